@@ -5,10 +5,7 @@ from pathlib import Path
 
 import click
 import data_collection
-import data_import
-import data_schema
 import yaml
-from cli import collect
 from cli.config import KernmlopsConfig
 from click_default_group import DefaultGroup
 from data_collection import GenericCollectorConfig
@@ -16,6 +13,8 @@ from kernmlops_benchmark import benchmarks
 from kernmlops_config import DEFAULT_CONFIG_FILE
 
 
+# subcommands import the modules they run on, hooks and graph backends are only
+# imported by the commands that use them
 @click.group()
 def cli():
     """Run kernmlops operations."""
@@ -57,6 +56,8 @@ def cli_collect_data(
     verbose: bool,
 ):
     """Run data collection tooling."""
+    from cli import collect
+
     config_overrides = yaml.safe_load(config_file.read_text())
     config = KernmlopsConfig().merge(config_overrides)
     collector_config: GenericCollectorConfig = config.collector_config
@@ -69,6 +70,194 @@ def cli_collect_data(
     )
 
 
+@cli.command("collectd")
+@click.option(
+    "-c",
+    "--config-file",
+    "config_file",
+    default=DEFAULT_CONFIG_FILE,
+    required=True,
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+)
+@click.option(
+    "-s",
+    "--socket",
+    "socket_path",
+    default=Path("/run/kernmlops-collectd.sock"),
+    help="Unix socket taking start, stop, wait and status commands as JSON lines",
+    type=click.Path(dir_okay=False, path_type=Path),
+)
+@click.option(
+    "-v",
+    "--verbose",
+    "verbose",
+    default=False,
+    is_flag=True,
+    type=bool,
+)
+def cli_collectd(config_file: Path, socket_path: Path, verbose: bool):
+    """Load hooks once and collect for every benchmark run started over a socket."""
+    from cli import collectd
+
+    config_overrides = yaml.safe_load(config_file.read_text())
+    config = KernmlopsConfig().merge(config_overrides)
+    collectd.run_collectd(
+        collector_config=config.collector_config,
+        socket_path=socket_path,
+        verbose=verbose,
+    )
+
+
+@cli_collect.command("decode")
+@click.option(
+    "-c",
+    "--config-file",
+    "config_file",
+    default=DEFAULT_CONFIG_FILE,
+    required=True,
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+)
+@click.option(
+    "-d",
+    "--collection-dir",
+    "collection_dir",
+    required=True,
+    help="Collection directory holding the raw/ logs, output_dir/curated/<benchmark>/<collection_id>",
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
+)
+@click.option(
+    "-j",
+    "--jobs",
+    "jobs",
+    default=None,
+    type=int,
+    help="Decoding processes, default is one per cpu",
+)
+@click.option(
+    "-v",
+    "--verbose",
+    "verbose",
+    default=False,
+    is_flag=True,
+    type=bool,
+)
+def cli_collect_decode(config_file: Path, collection_dir: Path, jobs: int | None, verbose: bool):
+    """Decode raw captured records into collection tables."""
+    from cli import collect
+
+    config_overrides = yaml.safe_load(config_file.read_text())
+    config = KernmlopsConfig().merge(config_overrides)
+    collect.run_decode(
+        collector_config=config.collector_config,
+        collection_dir=collection_dir,
+        jobs=jobs,
+        verbose=verbose,
+    )
+
+
+@cli_collect.command("check")
+@click.option(
+    "-c",
+    "--config-file",
+    "config_file",
+    default=DEFAULT_CONFIG_FILE,
+    required=True,
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+)
+@click.option(
+    "-H",
+    "--hook",
+    "hook_names",
+    multiple=True,
+    type=click.Choice(list(data_collection.bpf.all_hooks.keys())),
+    help="Hooks to check, default is every hook",
+)
+@click.option(
+    "-d",
+    "--duration",
+    "duration_sec",
+    default=5.0,
+    type=float,
+    help="Seconds of synthetic load per hook",
+)
+@click.option(
+    "-o",
+    "--output-file",
+    "output_file",
+    default=None,
+    help="Where to write the JSON report, default is stdout",
+    type=click.Path(dir_okay=False, path_type=Path),
+)
+@click.option(
+    "-v",
+    "--verbose",
+    "verbose",
+    default=False,
+    is_flag=True,
+    type=bool,
+)
+def cli_collect_check(config_file: Path, hook_names: tuple[str, ...], duration_sec: float,
+                      output_file: Path | None, verbose: bool):
+    """Load each hook under synthetic load and report its cost and failures."""
+    from cli import collect
+
+    config_overrides = yaml.safe_load(config_file.read_text())
+    config = KernmlopsConfig().merge(config_overrides)
+    collect.run_check(
+        collector_config=config.collector_config,
+        hook_names=list(hook_names),
+        duration_sec=duration_sec,
+        output_file=output_file,
+        verbose=verbose,
+    )
+
+
+@cli_collect.command("microbench")
+@click.option(
+    "-H",
+    "--hook",
+    "hook_names",
+    multiple=True,
+    type=click.Choice(list(data_collection.bpf.all_hooks.keys())),
+    help="Hooks to benchmark, default is every hook",
+)
+@click.option(
+    "-e",
+    "--events",
+    "event_counts",
+    multiple=True,
+    type=int,
+    help="Events per benchmark, may be given several times, default is 1e5, 1e6 and 1e7",
+)
+@click.option(
+    "-o",
+    "--output-file",
+    "output_file",
+    default=None,
+    help="Where to write the JSON report, default is stdout",
+    type=click.Path(dir_okay=False, path_type=Path),
+)
+@click.option(
+    "-v",
+    "--verbose",
+    "verbose",
+    default=False,
+    is_flag=True,
+    type=bool,
+)
+def cli_collect_microbench(hook_names: tuple[str, ...], event_counts: tuple[int, ...],
+                           output_file: Path | None, verbose: bool):
+    """Benchmark event decoding, table building and writing without loading any hook."""
+    from cli import collect
+
+    collect.run_microbench(
+        hook_names=list(hook_names),
+        event_counts=list(event_counts),
+        output_file=output_file,
+        verbose=verbose,
+    )
+
+
 @cli_collect.command("dump")
 @click.option(
     "-d",
@@ -89,6 +278,8 @@ def cli_collect_data(
 )
 def cli_collect_dump(input_dir: Path, benchmark_name: str | None):
     """Debug tool to dump collected data."""
+    import data_import
+
     kernmlops_dfs = data_import.read_parquet_dir(input_dir, benchmark_name=benchmark_name)
     for name, kernmlops_df in kernmlops_dfs.items():
         print(f"{name}: {kernmlops_df}")
@@ -138,6 +329,8 @@ def cli_collect_dump(input_dir: Path, benchmark_name: str | None):
 )
 def cli_collect_graph(input_dir: Path, output_dir: Path | None, collection_id: str, no_trends: bool, use_matplot: bool):
     """Debug tool to graph collected data."""
+    import data_schema
+
     collection_data = data_schema.CollectionData.from_data(
         data_dir=input_dir,
         collection_id=collection_id,
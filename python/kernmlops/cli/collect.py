@@ -1,12 +1,17 @@
+from __future__ import annotations
+
+import contextlib
+import json
 import os
 import signal
 import sys
+from dataclasses import replace
 from datetime import datetime
 from pathlib import Path
 from queue import Queue
 from threading import Event, Lock, Thread
-from time import sleep
-from typing import cast
+from time import CLOCK_BOOTTIME, clock_gettime_ns, perf_counter_ns, sleep
+from typing import Callable, Mapping, cast
 
 import data_collection
 import data_schema
@@ -22,9 +27,13 @@ from kernmlops_config import ConfigBase
 from pytimeparse.timeparse import timeparse
 
 
-def wait_for_END(run_event: Event, read):
-    while run_event.is_set() and "END" not in read.readline():
-        continue
+def wait_for_END(run_event: Event, read, flight_recorder: "data_collection.FlightRecorder | None" = None):
+    while run_event.is_set():
+        line = read.readline()
+        if "END" in line:
+            break
+        if flight_recorder is not None and "DUMP" in line:
+            flight_recorder.trigger("stdin")
     run_event.clear()
 
 def poll_instrumentation(
@@ -32,16 +41,66 @@ def poll_instrumentation(
   bpf_programs: list[data_collection.bpf.BPFProgram],
   queue: Queue,
   run_event: Event,
-  poll_rate: float = .5,
+  generic_config: data_collection.GenericCollectorConfig,
+  memory_budget: data_collection.bpf.MemoryBudget,
+  overhead: data_collection.bpf.CollectorOverhead,
+  rate_monitor: data_collection.bpf.BufferRateMonitor,
 ) -> int:
 
+    poll_rate = generic_config.poll_rate
+    poller: data_collection.bpf.AdaptivePoller | data_collection.bpf.EpollPoller
+    if generic_config.adaptive_polling:
+        # each hook is polled as often as its buffers fill, poll_rate bounds how long
+        # the benchmark goes unchecked and how often sampling hooks are polled
+        poller = data_collection.bpf.AdaptivePoller(
+            bpf_programs,
+            sample_interval_sec=poll_rate,
+            min_interval_sec=generic_config.poll_rate_min,
+            max_interval_sec=generic_config.poll_rate_max,
+            overhead=overhead,
+        )
+    else:
+        # perf buffers wake the poller as soon as they have data, poll_rate only bounds
+        # how long to wait and how often sampling hooks are polled
+        poller = data_collection.bpf.EpollPoller(bpf_programs, sample_interval_sec=poll_rate, overhead=overhead)
+    replay_hooks = [bpf_program for bpf_program in bpf_programs if isinstance(bpf_program, data_collection.bpf.ReplayHook)]
+    # handlers only run in this thread, the output thread's flushes are swapped in between polls
+    for bpf_program in bpf_programs:
+        bpf_program.own_buffers()
+    try:
+        return_code = poll_until_done(benchmark, bpf_programs, run_event, poll_rate, poller, replay_hooks, memory_budget,
+                                      rate_monitor)
+    finally:
+        for bpf_program in bpf_programs:
+            bpf_program.release_buffers()
+    queue.put(return_code)
+    return return_code
+
+def poll_until_done(
+  benchmark: Benchmark,
+  bpf_programs: list[data_collection.bpf.BPFProgram],
+  run_event: Event,
+  poll_rate: float,
+  poller: "data_collection.bpf.AdaptivePoller | data_collection.bpf.EpollPoller",
+  replay_hooks: "list[data_collection.bpf.ReplayHook]",
+  memory_budget: "data_collection.bpf.MemoryBudget",
+  rate_monitor: "data_collection.bpf.BufferRateMonitor",
+) -> int:
     return_code = None
     while return_code is None and run_event.is_set():
         try:
+            poller.poll(timeout_sec=poll_rate)
+            # lets last_k_ms find recent rows without scanning them
+            mark_us = clock_gettime_ns(CLOCK_BOOTTIME) // 1000
             for bpf_program in bpf_programs:
-                bpf_program.poll()
-            if poll_rate > 0:
-                sleep(poll_rate)
+                bpf_program.mark(mark_us)
+                bpf_program.handoff()
+            memory_budget.check()
+            rate_monitor.sample()
+            if replay_hooks and all(replay_hook.finished() for replay_hook in replay_hooks):
+                # the recorded collection is over, stop as if the benchmark was interrupted
+                run_event.clear()
+                continue
             return_code = benchmark.poll()
             # clean data when missed samples - or detect?
         except BenchmarkNotRunningError:
@@ -52,96 +111,333 @@ def poll_instrumentation(
         return_code = 0 if benchmark.name() == "faux" else 1
 
     # Poll again to clean out all buffers
+    try:
+        poller.drain()
+    except Exception:
+        pass
+    poller.close()
+    return return_code if return_code is not None else 1
+
+def size_page_cnts(bpf_programs: list[BPFProgram], generic_config: data_collection.GenericCollectorConfig,
+                   rates: dict[str, dict[str, data_collection.bpf.BufferRate]], verbose: bool):
+    uncalibrated_programs = [bpf_program for bpf_program in bpf_programs if bpf_program.name() not in rates]
+    calibrated_rates = dict[str, dict[str, data_collection.bpf.BufferRate]]()
+    if uncalibrated_programs and generic_config.page_cnt_calibration_sec > 0:
+        calibrated_rates = data_collection.bpf.calibrate_rates(
+            uncalibrated_programs,
+            calibration_sec=generic_config.page_cnt_calibration_sec,
+        )
+
+    def _size(hook_rates: dict[str, dict[str, data_collection.bpf.BufferRate]]) -> dict[str, dict[str, int]]:
+        return data_collection.bpf.size_buffers(
+            {bpf_program.name(): hook_rates[bpf_program.name()]
+             for bpf_program in bpf_programs if bpf_program.name() in hook_rates},
+            ring_buffers={bpf_program.name(): bpf_program.transport.ring_buffer for bpf_program in bpf_programs},
+            # buffers have to hold everything written between the two furthest apart polls
+            poll_interval_sec=generic_config.poll_rate_max if generic_config.adaptive_polling else generic_config.poll_rate,
+            loss_probability=generic_config.page_cnt_loss_probability,
+            memory_cap_bytes=generic_config.page_cnt_memory_cap_mb * 1024 * 1024,
+            cpus=os.cpu_count() or 1,
+        )
+    page_cnts = _size(rates)
+    # an idle host only tells how much a buffer needs at least
+    min_page_cnts = _size(calibrated_rates)
     for bpf_program in bpf_programs:
-        try:
-            bpf_program.poll()
-        except Exception:
-            pass
-    return_code = return_code if return_code is not None else 1
-    queue.put(return_code)
-    return return_code
+        if bpf_program.name() in page_cnts:
+            bpf_program.transport = replace(bpf_program.transport, page_cnts=page_cnts[bpf_program.name()])
+            if verbose:
+                print(f"{bpf_program.name()} buffer page counts: {page_cnts[bpf_program.name()]}")
+        if bpf_program.name() in min_page_cnts:
+            bpf_program.transport = replace(bpf_program.transport, min_page_cnts=min_page_cnts[bpf_program.name()])
+            if verbose:
+                print(f"{bpf_program.name()} calibrated minimum buffer page counts: {min_page_cnts[bpf_program.name()]}")
+
+def plan_hook_selection(generic_config: data_collection.GenericCollectorConfig, benchmark_name: str, *,
+                        available_hooks: list[str], resample: bool, verbose: bool) -> "data_collection.bpf.HookPlan":
+    # overhead_budget_pct is a percentage of one core for every 16 cpus
+    budget_cores = generic_config.overhead_budget_pct / 100 * (os.cpu_count() or 1) / 16
+    priority = generic_config.hook_priority if generic_config.hook_priority else generic_config.hooks
+    # looking a hook up imports its module, only resampling needs them
+    hook_types = {
+        hook_name: data_collection.bpf.all_hooks[hook_name]
+        for hook_name in available_hooks
+    } if resample else {}
+    sample_freqs = {
+        hook_name: getattr(hook, "sample_freq")
+        for hook_name, hook in hook_types.items()
+        if hasattr(hook, "sample_freq")
+    }
+    curated_dir = generic_config.get_output_dir() / "curated"
+    # time per event is the hook's own, how many events to expect is the benchmark's
+    benchmark_costs = data_collection.bpf.load_hook_costs(curated_dir / benchmark_name)
+    hook_plan = data_collection.bpf.plan_hooks(
+        [hook_name for hook_name in priority if hook_name in available_hooks],
+        data_collection.bpf.load_hook_costs(*curated_dir.iterdir()) if curated_dir.is_dir() else {},
+        budget_cores=budget_cores,
+        sample_freqs=sample_freqs,
+        event_rates={hook_name: cost.events_per_sec for hook_name, cost in benchmark_costs.items()},
+    )
+    if verbose:
+        for planned_hook in hook_plan.hooks:
+            print(f"{planned_hook.hook} planned at {planned_hook.predicted_cores:.4f} cores"
+                  f"{'' if planned_hook.measured else ' (unmeasured)'}"
+                  f"{f' sampled at {planned_hook.sample_freq}Hz' if planned_hook.sample_freq else ''}")
+        print(f"Predicted overhead {hook_plan.predicted_cores():.4f} of {budget_cores:.4f} cores")
+    return hook_plan
 
 def signal_handler_factory(event: Event):
     return lambda x,y: event.clear()
 
-def output_collections_to_file(collection_id: str, collection_tables : list[data_schema.CollectionTable], bpf_programs: list[BPFProgram], name: str,
-                               benchmark_name: str, verbose: bool, output_dir: Path, ids: tuple[int,int] | None = None):
-    for bpf_program in bpf_programs:
-        collection_tables.extend(bpf_program.pop_data())
-    for collection_table in collection_tables:
+def trigger_handler_factory(flight_recorder: "data_collection.FlightRecorder"):
+    return lambda x,y: flight_recorder.trigger("SIGUSR2")
+
+def output_collections_to_file(collection_tables: list[data_schema.CollectionTable], bpf_programs: list[BPFProgram],
+                               writer: "data_schema.CollectionWriter | data_collection.WriterProcess", verbose: bool,
+                               overhead: data_collection.bpf.CollectorOverhead, collection_id: str,
+                               built_hook_tables: Mapping[str, list[data_schema.CollectionTable]] | None = None):
+    def write(hook_name: str, collection_table: data_schema.CollectionTable):
         with pl.Config(tbl_cols=-1):
             if verbose:
                 print(f"{collection_table.name()}: {collection_table.table}")
-        full_path = Path(output_dir/benchmark_name/collection_id/f"{collection_table.name()}.{name}.parquet")
-        collection_table.table.write_parquet(full_path)
-        if ids is not None:
-            os.chown(full_path, ids[0], ids[1])
-    return collection_tables
-
-def output_data_thread(collection_id: str, bpf_programs: list[BPFProgram], benchmark_name: str, run_event: Event,
-                       verbose: bool, output_dir: Path, lock: Lock, ended: bool, output_interval: int | float, user_id: int, group_id: int):
-    num : int = 0
-    sleep(output_interval)
+        start_ns = perf_counter_ns()
+        writer.write(collection_table)
+        overhead.add_write(hook_name, perf_counter_ns() - start_ns)
+
+    # tables passed in, like system_info, belong to the collector itself
+    collector_tables = collection_tables + data_collection.bpf.pop_collection_loss(bpf_programs)
+    hook_tables = list[data_schema.CollectionTable]()
+    for bpf_program in bpf_programs:
+        start_ns = perf_counter_ns()
+        if isinstance(writer, data_collection.WriterProcess):
+            # tables are built by the writer process, only the raw rows leave this process
+            raw_data = bpf_program.pop_raw_data()
+            overhead.add_pop_data(bpf_program.name(), perf_counter_ns() - start_ns)
+            start_ns = perf_counter_ns()
+            writer.write_raw(bpf_program.name(), bpf_program.collection_id, raw_data)
+            overhead.add_write(bpf_program.name(), perf_counter_ns() - start_ns)
+        else:
+            program_tables = bpf_program.pop_data()
+            overhead.add_pop_data(bpf_program.name(), perf_counter_ns() - start_ns)
+            for collection_table in program_tables:
+                write(bpf_program.name(), collection_table)
+            hook_tables.extend(program_tables)
+    # tables built outside of the hooks, like flight recorder dumps, are still written for them
+    for hook_name, built_tables in (built_hook_tables or {}).items():
+        for collection_table in built_tables:
+            write(hook_name, collection_table)
+        hook_tables.extend(built_tables)
+    for collection_table in collector_tables:
+        write("collector", collection_table)
+    # written last so the interval includes the writes above
+    collector_tables.append(overhead.pop_table(collection_id))
+    write("collector", collector_tables[-1])
+    return collector_tables + hook_tables
+
+def output_data_thread(bpf_programs: list[BPFProgram], run_event: Event, verbose: bool,
+                       writer: "data_schema.CollectionWriter | data_collection.WriterProcess", lock: Lock,
+                       output_interval: int | float, flush_event: Event,
+                       overhead: data_collection.bpf.CollectorOverhead, collection_id: str):
+    # the memory budget sets flush_event to flush before the interval is up
+    flush_event.wait(output_interval)
     while run_event.is_set():
+        flush_event.clear()
         lock.acquire()
         try:
-            if(ended):
+            # run_collect clears the event before its final flush closes the writer
+            if not run_event.is_set():
                 lock.release()
                 return
-            output_collections_to_file(collection_id, [], bpf_programs, str(num), benchmark_name, verbose, output_dir, (user_id, group_id))
+            output_collections_to_file([], bpf_programs, writer, verbose, overhead, collection_id)
+        except Exception as e:
+            print(e)
+        lock.release()
+        flush_event.wait(output_interval)
+
+def flight_recorder_thread(bpf_programs: list[BPFProgram], flight_recorder: "data_collection.FlightRecorder",
+                           run_event: Event, verbose: bool,
+                           writer: "data_schema.CollectionWriter | data_collection.WriterProcess", lock: Lock,
+                           flush_event: Event, overhead: data_collection.bpf.CollectorOverhead, collection_id: str):
+    # rows are moved into the recorder every second, only a trigger writes them out
+    # once the recorder kept recording for its post trigger window
+    while run_event.is_set():
+        until_dump_sec = flight_recorder.seconds_until_dump()
+        if until_dump_sec is None:
+            flight_recorder.triggered.wait(1)
+        else:
+            sleep(min(1, until_dump_sec))
+        flush_event.clear()
+        lock.acquire()
+        try:
+            if not run_event.is_set():
+                lock.release()
+                return
+            start_ns = perf_counter_ns()
+            flight_recorder.record()
+            overhead.add_pop_data("flight_recorder", perf_counter_ns() - start_ns)
+            if flight_recorder.seconds_until_dump() == 0:
+                print(f"Flight recorder dump: {flight_recorder.trigger_reason}")
+                output_collections_to_file([], bpf_programs, writer, verbose, overhead, collection_id,
+                                           built_hook_tables=flight_recorder.dump())
         except Exception as e:
             print(e)
         lock.release()
-        num += 1
-        sleep(output_interval)
 
 def run_collect(
     *,
     collector_config: ConfigBase,
     benchmark: Benchmark,
-    verbose: bool
+    verbose: bool,
+    loaded_programs: list[BPFProgram] | None = None,
+    loaded_config: data_collection.GenericCollectorConfig | None = None,
+    run_event: Event | None = None,
+    on_start: Callable[[str], None] | None = None,
 ):
+    """Collects from the configured hooks while `benchmark` runs, returns its return code.
+
+    `collectd` passes the `loaded_programs` it keeps across collections, they
+    are re-armed instead of loaded and only disabled once the collection ends.
+    Configs that would load them differently than its `loaded_config` are rejected.
+    It also stops collections through its own `run_event` rather than signals
+    or stdin, and is told the collection_id through `on_start`.
+    """
     if not benchmark.is_configured():
         raise BenchmarkNotConfiguredError(f"benchmark {benchmark.name()} is not configured")
-    benchmark.setup()
 
     generic_config = cast(data_collection.GenericCollectorConfig, getattr(collector_config, "generic"))
-    bpf_programs = generic_config.get_hooks()
+    hook_names = generic_config.hooks
+    hook_plan: data_collection.bpf.HookPlan | None = None
+    if generic_config.overhead_budget_pct > 0:
+        hook_plan = plan_hook_selection(
+            generic_config,
+            benchmark.name(),
+            available_hooks=(
+                data_collection.bpf.hook_names() if loaded_programs is None
+                else [bpf_program.name() for bpf_program in loaded_programs]
+            ),
+            # sample rates are fixed once a program is loaded
+            resample=loaded_programs is None,
+            verbose=verbose,
+        )
+        hook_names = hook_plan.hook_names()
+    if loaded_programs is None:
+        bpf_programs = generic_config.get_hooks(hook_names)
+        sample_freqs = hook_plan.sample_freqs() if hook_plan is not None else {}
+        for bpf_program in bpf_programs:
+            if bpf_program.name() in sample_freqs:
+                setattr(bpf_program, "sample_freq", sample_freqs[bpf_program.name()])
+    else:
+        if generic_config.raw_capture or generic_config.consumer_processes > 0:
+            raise ValueError("raw_capture and consumer_processes need the hooks loaded for each collection")
+        missing_hooks = set(hook_names) - {bpf_program.name() for bpf_program in loaded_programs}
+        if missing_hooks:
+            raise ValueError(f"hooks {sorted(missing_hooks)} are not loaded by collectd")
+        mismatches = generic_config.load_mismatches(loaded_config, hook_names) if loaded_config is not None else []
+        if mismatches:
+            raise ValueError(f"{', '.join(mismatches)} differ from the config collectd loaded the hooks with")
+        bpf_programs = [bpf_program for bpf_program in loaded_programs if bpf_program.name() in hook_names]
+    benchmark.setup()
     system_info = data_collection.machine_info().to_polars()
     system_info = system_info.unnest(system_info.columns)
     collection_id = system_info["collection_id"][0]
     output_dir = generic_config.get_output_dir() / "curated" if bpf_programs else generic_config.get_output_dir() / "baseline"
+    collection_dir = Path(output_dir/benchmark.name()/collection_id)
     queue = Queue(maxsize=1)
-    run_event = Event()
+    external_run_event = run_event is not None
+    if run_event is None:
+        run_event = Event()
     run_event.set()
 
+    if generic_config.raw_capture:
+        # handlers only copy records out, `kernmlops collect decode` builds the hook tables afterwards
+        for bpf_program in bpf_programs:
+            bpf_program.transport = replace(bpf_program.transport, raw_capture_dir=collection_dir / "raw")
+    if generic_config.consumer_processes > 0:
+        if generic_config.raw_capture:
+            raise ValueError("raw_capture and consumer_processes cannot be combined")
+        # outputs are pinned for the consumer processes instead of being opened here
+        pin_dir = Path(generic_config.bpffs_dir) / "kernmlops" / collection_id
+        for bpf_program in bpf_programs:
+            bpf_program.transport = replace(bpf_program.transport, pin_dir=pin_dir)
+    rates_path = generic_config.get_output_dir() / "buffer_rates" / f"{benchmark.name()}.json"
+    if generic_config.auto_page_cnt and loaded_programs is None:
+        size_page_cnts(bpf_programs, generic_config, data_collection.bpf.load_rates(rates_path), verbose)
+    if loaded_programs is None:
+        data_collection.bpf.load_hooks(
+            bpf_programs,
+            collection_id,
+            workers=generic_config.compile_workers,
+            verbose=verbose,
+        )
     for bpf_program in bpf_programs:
-        bpf_program.load(collection_id)
-        if verbose:
-            print(f"{bpf_program.name()} BPF program loaded")
+        if loaded_programs is not None:
+            bpf_program.rearm(collection_id)
+            bpf_program.enable()
+            if verbose:
+                print(f"{bpf_program.name()} BPF program re-armed")
+        if bpf_program.name() in generic_config.disabled_hooks:
+            # attached but silent until enabled through the query socket
+            bpf_program.disable()
     if verbose:
         print("Finished loading BPF programs")
+    escalation: data_collection.EscalationEngine | None = None
+    if generic_config.escalation_rules:
+        escalation = data_collection.EscalationEngine(
+            bpf_programs,
+            generic_config.get_escalation_rules(),
+            verbose=verbose,
+        )
+    # loaded programs count their losses across collections
+    lost_samples_mark = data_collection.bpf.total_lost_samples(bpf_programs)
 
-    # Configure signal capture
-    signal.signal(signal.SIGINT, signal_handler_factory(run_event))
-    signal.signal(signal.SIGALRM, signal_handler_factory(run_event))
-    signal.signal(signal.SIGUSR1, signal_handler_factory(run_event))
+    flight_recorder: data_collection.FlightRecorder | None = None
+    if generic_config.flight_recorder:
+        flight_recorder_window_parse : int | float | None = timeparse(generic_config.flight_recorder_window)
+        flight_recorder = data_collection.FlightRecorder(
+            bpf_programs,
+            window_sec=flight_recorder_window_parse if flight_recorder_window_parse is not None else 30,
+            max_bytes=generic_config.flight_recorder_mb * 1024 * 1024,
+            trigger_hook=generic_config.flight_recorder_trigger_hook or None,
+            trigger_events_per_sec=generic_config.flight_recorder_trigger_events_per_sec,
+            post_trigger_sec=timeparse(generic_config.flight_recorder_post_trigger) or 0,
+            cooldown_sec=timeparse(generic_config.flight_recorder_cooldown) or 0,
+        )
+        signal.signal(signal.SIGUSR2, trigger_handler_factory(flight_recorder))
 
-    # Create stdin killer daemon
-    read_thread = Thread(target = wait_for_END, args = (run_event, sys.stdin))
-    read_thread.daemon = True
-    read_thread.start()
+    if not external_run_event:
+        # Configure signal capture
+        signal.signal(signal.SIGINT, signal_handler_factory(run_event))
+        signal.signal(signal.SIGALRM, signal_handler_factory(run_event))
+        signal.signal(signal.SIGUSR1, signal_handler_factory(run_event))
 
-    # Create polling thread
-    poll_thread = Thread(target = poll_instrumentation, args = (benchmark, bpf_programs, queue, run_event, generic_config.poll_rate))
-    poll_thread.start()
+        # Create stdin killer daemon
+        read_thread = Thread(target = wait_for_END, args = (run_event, sys.stdin, flight_recorder))
+        read_thread.daemon = True
+        read_thread.start()
 
     # Create output thread
     output_interval_parse : int | float | None = timeparse(generic_config.output_interval)
     output_interval = 60
     if output_interval_parse is not None:
         output_interval = output_interval_parse
-    ended = False
+    output_roll_interval_parse : int | float | None = timeparse(generic_config.output_roll_interval)
+    output_roll_interval = 60 * 60
+    if output_roll_interval_parse is not None:
+        output_roll_interval = output_roll_interval_parse
+    consumer_pool: data_collection.bpf.ConsumerPool | None = None
+    if generic_config.consumer_processes > 0:
+        consumer_pool = data_collection.bpf.ConsumerPool(
+            bpf_programs,
+            processes=generic_config.consumer_processes,
+            shard_dir=collection_dir / "shards",
+            flush_interval_sec=output_interval,
+        )
+        try:
+            # records the benchmark submits before a worker opened its outputs would be lost
+            consumer_pool.start()
+        except RuntimeError:
+            for bpf_program in bpf_programs:
+                bpf_program.close()
+            raise
     output_lock = Lock()
     (user_id, group_id) = get_user_group_ids()
     Path(output_dir/benchmark.name()/collection_id).mkdir(parents=True, exist_ok=True)
@@ -149,48 +445,233 @@ def run_collect(
     os.chown(output_dir, user_id, group_id)
     os.chown(Path(output_dir/benchmark.name()), user_id, group_id)
     os.chown(Path(output_dir/benchmark.name()/collection_id), user_id, group_id)
-    output_thread = Thread(target = output_data_thread, args = (collection_id, bpf_programs, benchmark.name(),
-                                                                run_event, generic_config.output_dfs, output_dir,
-                                                                output_lock, ended, output_interval, user_id, group_id))
+    if (collection_dir / "raw").is_dir():
+        os.chown(collection_dir / "raw", user_id, group_id)
+    writer: data_schema.CollectionWriter | data_collection.WriterProcess
+    if generic_config.output_process:
+        writer = data_collection.WriterProcess(
+            output_dir=collection_dir,
+            roll_size_bytes=generic_config.output_roll_size_mb * 1024 * 1024,
+            roll_interval_sec=output_roll_interval,
+            ids=(user_id, group_id),
+            verbose=generic_config.output_dfs,
+        )
+    else:
+        writer = data_schema.CollectionWriter(
+            output_dir=collection_dir,
+            roll_size_bytes=generic_config.output_roll_size_mb * 1024 * 1024,
+            roll_interval_sec=output_roll_interval,
+            ids=(user_id, group_id),
+        )
+
+    # Create polling thread
+    flush_event = Event()
+    memory_budget = data_collection.bpf.MemoryBudget(
+        bpf_programs,
+        total_bytes=generic_config.memory_budget_mb * 1024 * 1024,
+        hook_bytes=generic_config.hook_memory_budget_mb * 1024 * 1024,
+        flush_event=flush_event,
+        spill_dir=data_collection.bpf.collection_spill_dir(generic_config.get_output_dir() / "spill", collection_id),
+    )
+    memory_budget.start()
+    overhead = data_collection.bpf.CollectorOverhead(bpf_programs)
+    rate_monitor = data_collection.bpf.BufferRateMonitor(bpf_programs)
+    poll_thread = Thread(target = poll_instrumentation, args = (benchmark, bpf_programs, queue, run_event, generic_config,
+                                                                memory_budget, overhead, rate_monitor))
+    if escalation is not None:
+        # escalated hooks stay disabled until a rule fires
+        escalation.start()
+    poll_thread.start()
+
+    if flight_recorder is not None:
+        output_thread = Thread(target = flight_recorder_thread, args = (bpf_programs, flight_recorder, run_event,
+                                                                        generic_config.output_dfs, writer, output_lock,
+                                                                        flush_event, overhead, collection_id))
+    else:
+        output_thread = Thread(target = output_data_thread, args = (bpf_programs, run_event, generic_config.output_dfs,
+                                                                    writer, output_lock, output_interval, flush_event,
+                                                                    overhead, collection_id))
     output_thread.daemon = True
     output_thread.start()
 
+    query_server: data_collection.QueryServer | None = None
+    if generic_config.query_socket:
+        query_window_parse: int | float | None = timeparse(generic_config.query_max_window)
+        query_server = data_collection.QueryServer(
+            bpf_programs,
+            Path(generic_config.query_socket),
+            max_window_ms=int((query_window_parse if query_window_parse is not None else 60) * 1000),
+        )
+        os.chown(generic_config.query_socket, user_id, group_id)
+        query_server.start()
+
     tick = datetime.now()
 
     benchmark.run()
 
     if verbose:
         print(f"Started benchmark {benchmark.name()}")
+    if on_start is not None:
+        on_start(collection_id)
     return_code = queue.get()
 
     collection_time_sec = (datetime.now() - tick).total_seconds()
     poll_thread.join()
+    if escalation is not None:
+        escalation.close()
+    if query_server is not None:
+        query_server.close()
+    data_collection.bpf.close_perf_buffers(bpf_programs)
+    if generic_config.auto_page_cnt and (rates := rate_monitor.rates()):
+        # the next collection of this benchmark sizes its buffers from these
+        data_collection.bpf.save_rates(rates_path, rates)
+        os.chown(rates_path.parent, user_id, group_id)
+        os.chown(rates_path, user_id, group_id)
+    lost_samples = data_collection.bpf.total_lost_samples(bpf_programs) - lost_samples_mark
+    consumer_tables = list[data_schema.CollectionTable]()
+    if consumer_pool is not None:
+        # workers drain their buffers before the programs are unloaded
+        consumer_pool.close()
+        consumer_tables = consumer_pool.merge(collection_id)
+        lost_samples += consumer_pool.lost_samples
     for bpf_program in bpf_programs:
-        bpf_program.close()
+        if loaded_programs is None:
+            bpf_program.close()
+        else:
+            # stays attached for the next collection of collectd
+            bpf_program.disable()
 
     if verbose:
         print(f"Benchmark ran for {collection_time_sec}s")
 
+    system_info = system_info.with_columns([
+        pl.lit(collection_time_sec).alias("collection_time_sec"),
+        pl.lit(os.getpid()).alias("collection_pid"),
+        pl.lit(benchmark.name()).alias("benchmark_name"),
+        pl.lit([hook.name() for hook in bpf_programs]).cast(pl.List(pl.String())).alias("hooks"),
+        pl.lit(lost_samples).alias("lost_samples"),
+    ])
+    if hook_plan is not None:
+        # the hooks chosen for the overhead budget and what they were expected to cost
+        system_info = pl.concat([system_info, hook_plan.to_polars()], how="horizontal")
     collection_tables: list[data_schema.CollectionTable] = [
-        data_schema.SystemInfoTable.from_df(
-            system_info.with_columns([
-                pl.lit(collection_time_sec).alias("collection_time_sec"),
-                pl.lit(os.getpid()).alias("collection_pid"),
-                pl.lit(benchmark.name()).alias("benchmark_name"),
-                pl.lit([hook.name() for hook in bpf_programs]).cast(pl.List(pl.String())).alias("hooks"),
-            ])
-        )
-    ]
+        data_schema.SystemInfoTable.from_df(system_info)
+    ] + consumer_tables
 
     output_lock.acquire()
-    ended = True
-    collection_tables = output_collections_to_file(collection_id, collection_tables, bpf_programs, "end",
-                                                   benchmark.name(), generic_config.output_dfs, output_dir,
-                                                   (user_id, group_id))
+    run_event.clear()
+    dumped_tables: dict[str, list[data_schema.CollectionTable]] = {}
+    if flight_recorder is not None:
+        # rows after the last trigger are dropped unless a dump is still pending,
+        # its post trigger window ends with the collection
+        flight_recorder.record()
+        if flight_recorder.triggered.is_set():
+            dumped_tables = flight_recorder.dump()
+        flight_recorder.discard()
+    collection_tables = output_collections_to_file(collection_tables, bpf_programs, writer, generic_config.output_dfs,
+                                                   overhead, collection_id, built_hook_tables=dumped_tables)
+    writer.close()
     output_lock.release()
-    collection_data = data_schema.CollectionData.from_tables(collection_tables)
+    memory_budget.close()
 
     if generic_config.output_graphs:
+        if isinstance(writer, data_collection.WriterProcess):
+            # hook tables only exist in the writer process, read back what it wrote
+            collection_data = data_schema.CollectionData.from_collection_dir(collection_dir, data_schema.table_types)
+        else:
+            collection_data = data_schema.CollectionData.from_tables(collection_tables)
         collection_data.graph(out_dir=generic_config.get_output_dir() / "graphs")
     print(f"{collection_id}")
     return return_code
+
+def run_check(
+    *,
+    collector_config: ConfigBase,
+    hook_names: list[str],
+    duration_sec: float,
+    output_file: Path | None,
+    verbose: bool,
+):
+    """Checks every hook in turn and writes the JSON report to `output_file`, or stdout."""
+    generic_config = cast(data_collection.GenericCollectorConfig, getattr(collector_config, "generic"))
+    unknown_hooks = set(hook_names) - set(data_collection.bpf.all_hooks.keys())
+    if unknown_hooks:
+        raise ValueError(f"unknown hooks {sorted(unknown_hooks)}")
+    check_dir = generic_config.get_output_dir() / "check"
+    # probed like collections do, so the report shows what the cache saves
+    generic_config.use_kernel_feature_cache()
+    hook_types = {
+        hook_name: data_collection.bpf.all_hooks[hook_name]
+        for hook_name in data_collection.bpf.all_hooks
+        if not hook_names or hook_name in hook_names
+    }
+    report = data_collection.bpf.check_hooks(
+        hook_types,
+        duration_sec=duration_sec,
+        # on disk rather than tmpfs so block IO is exercised too
+        workdir=check_dir,
+        # hooks are checked on the transport they are collected with
+        transports={hook_name: generic_config.hook_transport(hook_name) for hook_name in hook_types},
+        verbose=verbose,
+    )
+    if not any(check_dir.iterdir()):
+        check_dir.rmdir()
+    report_json = json.dumps(report, indent=2)
+    if output_file is None:
+        print(report_json)
+        return
+    output_file.write_text(report_json)
+    (user_id, group_id) = get_user_group_ids()
+    os.chown(output_file, user_id, group_id)
+
+def run_microbench(
+    *,
+    hook_names: list[str],
+    event_counts: list[int],
+    output_file: Path | None,
+    verbose: bool,
+):
+    """Runs the userspace microbenchmarks and writes the JSON report to `output_file`, or stdout."""
+    # hooks print while they are set up, only the report goes to stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        report = data_collection.bpf.run_microbenchmarks(
+            [
+                hook_name
+                for hook_name in data_collection.bpf.hook_names()
+                if not hook_names or hook_name in hook_names
+            ],
+            event_counts=tuple(event_counts) or data_collection.bpf.MICROBENCH_EVENTS,
+            verbose=verbose,
+        )
+    report_json = json.dumps(report, indent=2)
+    if output_file is None:
+        print(report_json)
+        return
+    output_file.write_text(report_json)
+    (user_id, group_id) = get_user_group_ids()
+    os.chown(output_file, user_id, group_id)
+
+def run_decode(
+    *,
+    collector_config: ConfigBase,
+    collection_dir: Path,
+    jobs: int | None,
+    verbose: bool,
+):
+    """Builds the hook tables of a collection made with `raw_capture` from its raw logs."""
+    generic_config = cast(data_collection.GenericCollectorConfig, getattr(collector_config, "generic"))
+    output_roll_interval_parse : int | float | None = timeparse(generic_config.output_roll_interval)
+    output_roll_interval = 60 * 60
+    if output_roll_interval_parse is not None:
+        output_roll_interval = output_roll_interval_parse
+    decoded_hooks = data_collection.bpf.decode_raw_capture(
+        collection_dir,
+        # collections are stored under output_dir/benchmark/collection_id
+        collection_id=collection_dir.name,
+        roll_size_bytes=generic_config.output_roll_size_mb * 1024 * 1024,
+        roll_interval_sec=output_roll_interval,
+        jobs=jobs,
+        ids=get_user_group_ids(),
+    )
+    if verbose:
+        print(f"Decoded raw captures of {decoded_hooks}")
@@ -0,0 +1,218 @@
+import json
+import os
+import signal
+import socketserver
+import traceback
+from dataclasses import dataclass, field
+from pathlib import Path
+from queue import Queue
+from threading import Event, Lock, Thread
+from typing import Any, Mapping, cast
+
+import data_collection
+import yaml
+from cli.collect import run_collect, size_page_cnts
+from cli.config import KernmlopsConfig
+from data_collection.bpf_instrumentation.bpf_hook import BPFProgram
+from data_schema import get_user_group_ids
+from kernmlops_benchmark import benchmarks
+from kernmlops_config import ConfigBase
+
+
+@dataclass
+class _Run:
+    config_file: Path
+    benchmark_name: str | None
+    run_event: Event = field(default_factory=Event)
+    started: Event = field(default_factory=Event)
+    finished: Event = field(default_factory=Event)
+    collection_id: str | None = None
+    return_code: int | None = None
+    error: str | None = None
+
+    def result(self) -> Mapping[str, Any]:
+        return {
+            "config_file": str(self.config_file),
+            "collection_id": self.collection_id,
+            "running": not self.finished.is_set(),
+            "return_code": self.return_code,
+            "error": self.error,
+        }
+
+
+class _CommandHandler(socketserver.StreamRequestHandler):
+    """One JSON command per line, answered by one JSON line.
+
+    `{"command": "start", "config_file": "config/redis_always.yaml"}` starts a
+    collection, optionally of `"benchmark"` instead of the configured one, and
+    answers once its benchmark runs with the new collection_id. `"stop"` ends
+    the collection early and `"wait"` waits for it to end on its own, both answer
+    with its return code. `"status"` answers right away. Failures are answered
+    with `{"error": message}`.
+    """
+
+    server: "_CommandUnixServer"
+
+    def handle(self) -> None:
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                response = self.server.daemon.command(json.loads(line))
+            except Exception as e:
+                response = {"error": str(e)}
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+
+class _CommandUnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: Path, daemon: "CollectorDaemon"):
+        self.daemon = daemon
+        super().__init__(str(socket_path), _CommandHandler)
+
+
+class CollectorDaemon:
+    """Loads the configured hooks once and runs one collection per `start` command.
+
+    Between collections the programs stay attached but disabled, each collection
+    re-arms them under its own collection_id instead of compiling them again.
+    Collections run one at a time on the thread calling `serve`, so the signal
+    handlers of `run_collect` keep working.
+    """
+
+    def __init__(self, collector_config: ConfigBase, socket_path: Path, verbose: bool):
+        generic_config = cast(data_collection.GenericCollectorConfig, getattr(collector_config, "generic"))
+        if generic_config.raw_capture or generic_config.consumer_processes > 0:
+            raise ValueError("raw_capture and consumer_processes need the hooks loaded for each collection")
+        self.verbose = verbose
+        self.generic_config = generic_config
+        self.socket_path = socket_path
+        self.bpf_programs: list[BPFProgram] = generic_config.get_hooks()
+        if generic_config.auto_page_cnt:
+            # sized once at startup, from the peak rates of every benchmark collected so far
+            rates = data_collection.bpf.peak_rates(
+                [
+                    data_collection.bpf.load_rates(rates_path)
+                    for rates_path in sorted((generic_config.get_output_dir() / "buffer_rates").glob("*.json"))
+                ],
+                cpus=os.cpu_count() or 1,
+            )
+            size_page_cnts(self.bpf_programs, generic_config, rates, verbose)
+        data_collection.bpf.load_hooks(
+            self.bpf_programs,
+            "",
+            workers=generic_config.compile_workers,
+            verbose=verbose,
+        )
+        for bpf_program in self.bpf_programs:
+            bpf_program.disable()
+        self._runs = Queue[_Run | None]()
+        self._lock = Lock()
+        self._run: _Run | None = None
+        self._shutdown = Event()
+        self.socket_path.unlink(missing_ok=True)
+        self._server = _CommandUnixServer(socket_path, self)
+        # collections run as root, only the invoking user and root may start them
+        os.chmod(socket_path, 0o600)
+        user_id, group_id = get_user_group_ids()
+        os.chown(socket_path, user_id, group_id)
+        self._thread = Thread(target=self._serve_commands, name="kernmlops-collectd", daemon=True)
+
+    def serve(self) -> None:
+        """Runs queued collections until `shutdown`, then unloads the programs."""
+        signal.signal(signal.SIGINT, lambda x, y: self.shutdown())
+        signal.signal(signal.SIGTERM, lambda x, y: self.shutdown())
+        self._thread.start()
+        print(f"collectd listening on {self.socket_path}")
+        try:
+            while (run := self._runs.get()) is not None:
+                self._collect(run)
+        finally:
+            self._server.shutdown()
+            self._server.server_close()
+            self.socket_path.unlink(missing_ok=True)
+            for bpf_program in self.bpf_programs:
+                bpf_program.close()
+
+    def shutdown(self) -> None:
+        """Stops the running collection, if any, and makes `serve` return."""
+        self._shutdown.set()
+        with self._lock:
+            if self._run is not None:
+                self._run.run_event.clear()
+        self._runs.put(None)
+
+    def command(self, request: Mapping[str, Any]) -> Mapping[str, Any]:
+        command = request.get("command")
+        if command == "start":
+            return self._start(Path(request["config_file"]), request.get("benchmark"))
+        with self._lock:
+            run = self._run
+        if command == "status":
+            return {"hooks": [bpf_program.name() for bpf_program in self.bpf_programs]} | (
+                run.result() if run is not None else {"running": False}
+            )
+        if command not in ("stop", "wait"):
+            raise ValueError(f"unknown command {command}, expected one of start, stop, wait or status")
+        if run is None:
+            raise ValueError("no collection was started")
+        if command == "stop":
+            run.run_event.clear()
+        run.finished.wait()
+        return run.result()
+
+    def _start(self, config_file: Path, benchmark_name: str | None) -> Mapping[str, Any]:
+        if not config_file.is_file():
+            raise ValueError(f"config file {config_file} does not exist")
+        with self._lock:
+            if self._shutdown.is_set():
+                raise ValueError("collectd is shutting down")
+            if self._run is not None and not self._run.finished.is_set():
+                raise ValueError(f"collection {self._run.collection_id} is still running")
+            run = _Run(config_file=config_file, benchmark_name=benchmark_name)
+            self._run = run
+        self._runs.put(run)
+        run.started.wait()
+        return run.result()
+
+    def _collect(self, run: _Run) -> None:
+        def on_start(collection_id: str) -> None:
+            run.collection_id = collection_id
+            run.started.set()
+
+        try:
+            config = KernmlopsConfig().merge(yaml.safe_load(run.config_file.read_text()))
+            name = run.benchmark_name if run.benchmark_name else str(config.benchmark_config.generic.benchmark)
+            if name not in benchmarks:
+                raise ValueError(f"unknown benchmark {name}")
+            run.return_code = run_collect(
+                collector_config=config.collector_config,
+                benchmark=benchmarks[name].from_config(config.benchmark_config),
+                verbose=self.verbose,
+                loaded_programs=self.bpf_programs,
+                loaded_config=self.generic_config,
+                run_event=run.run_event,
+                on_start=on_start,
+            )
+        except Exception as e:
+            print(traceback.format_exc())
+            run.error = str(e)
+            # a failed collection may stop anywhere, leave every program silent
+            for bpf_program in self.bpf_programs:
+                bpf_program.disable()
+        finally:
+            run.finished.set()
+            run.started.set()
+
+    def _serve_commands(self) -> None:
+        try:
+            self._server.serve_forever()
+        except Exception:
+            print(traceback.format_exc())
+
+
+def run_collectd(*, collector_config: ConfigBase, socket_path: Path, verbose: bool):
+    daemon = CollectorDaemon(collector_config, socket_path, verbose)
+    daemon.serve()
@@ -1,29 +1,151 @@
+import os
 from dataclasses import dataclass, field, make_dataclass
+from importlib import import_module
 from pathlib import Path
+from typing import TYPE_CHECKING, Any, Final, Mapping
 
 from data_collection import bpf_instrumentation as bpf
-from data_collection.system_info import machine_info
 from kernmlops_config import ConfigBase
 
+if TYPE_CHECKING:
+    from data_collection.escalation import EscalationEngine, EscalationRule
+    from data_collection.flight_recorder import FlightRecorder
+    from data_collection.query_server import QueryServer
+    from data_collection.system_info import machine_info
+    from data_collection.writer_process import WriterProcess
+
+# exports pull in polars, psutil and pyarrow, they are imported on first use like bpf's
+_exports: Final[Mapping[str, str]] = {
+    "EscalationEngine": "escalation",
+    "EscalationRule": "escalation",
+    "FlightRecorder": "flight_recorder",
+    "QueryServer": "query_server",
+    "machine_info": "system_info",
+    "WriterProcess": "writer_process",
+}
+
+
+def __getattr__(name: str) -> Any:
+    if name not in _exports:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(import_module(f"{__name__}.{_exports[name]}"), name)
+
 
 @dataclass(frozen=True)
 class GenericCollectorConfig(ConfigBase):
     poll_rate: float = 0.5
+    adaptive_polling: bool = False
+    poll_rate_min: float = 0.01
+    poll_rate_max: float = 2.0
     output_interval: str = "1m"
+    output_roll_size_mb: int = 256
+    output_roll_interval: str = "1h"
+    output_process: bool = False
+    memory_budget_mb: int = 1024
+    hook_memory_budget_mb: int = 256
+    # threads compiling hooks at startup, 0 is one per cpu
+    compile_workers: int = 0
+    # kernel feature probes are kept per kernel build under output_dir
+    kernel_feature_cache: bool = True
     output_dir: str = "data"
     output_dfs: bool = False
     output_graphs: bool = False
     hooks: list[str] = field(default_factory=bpf.hook_names)
+    overhead_budget_pct: float = 0.0
+    hook_priority: list[str] = field(default_factory=list)
+    disabled_hooks: list[str] = field(default_factory=list)
+    ring_buffer_hooks: list[str] = field(default_factory=list)
+    ring_buffer_page_cnt: int = 1024
+    ring_buffer_wakeup_events: int = 0
+    raw_capture: bool = False
+    consumer_processes: int = 0
+    bpffs_dir: str = "/sys/fs/bpf"
+    auto_page_cnt: bool = False
+    page_cnt_loss_probability: float = 1e-6
+    page_cnt_memory_cap_mb: int = 512
+    page_cnt_calibration_sec: float = 0.0
+    flight_recorder: bool = False
+    flight_recorder_window: str = "30s"
+    flight_recorder_mb: int = 512
+    flight_recorder_trigger_hook: str = ""
+    flight_recorder_trigger_events_per_sec: float = 0.0
+    flight_recorder_post_trigger: str = "5s"
+    flight_recorder_cooldown: str = "60s"
+    query_socket: str = ""
+    query_max_window: str = "60s"
+    escalation_rules: list[dict[str, Any]] = field(default_factory=list)
+    replay_dir: str = ""
+    replay_speed: float = 1.0
 
     def get_output_dir(self) -> Path:
         return Path(self.output_dir)
 
-    def get_hooks(self) -> list[bpf.BPFProgram]:
-        return [
-            hook()
-            for hook_name, hook in bpf.all_hooks.items()
-            if hook_name in self.hooks
+    def get_escalation_rules(self) -> "list[EscalationRule]":
+        from data_collection.escalation import EscalationRule
+
+        return [EscalationRule.from_config(rule) for rule in self.escalation_rules]
+
+    def use_kernel_feature_cache(self) -> None:
+        """Has hooks constructed from now on probe the kernel through the cache, when enabled."""
+        if not self.kernel_feature_cache:
+            return
+        from data_schema import get_user_group_ids
+
+        # hooks probe the kernel for their code substitutions when constructed
+        bpf.cache_kernel_features(
+            self.get_output_dir() / "kernel_features",
+            # probes run as root, the cache belongs to the user like the rest of the output
+            ids=get_user_group_ids() if os.getuid() == 0 else None,
+        )
+
+    def get_hooks(self, hook_names: list[str] | None = None) -> list[bpf.BPFProgram]:
+        hook_names = hook_names if hook_names is not None else self.hooks
+        # only the selected hooks' modules are imported
+        hook_types = [
+            bpf.all_hooks[hook_name]
+            for hook_name in bpf.all_hooks
+            if hook_name in hook_names
+        ]
+        if self.replay_dir:
+            # nothing is loaded, the rows of a recorded collection are fed through each hook's table builders
+            return [bpf.ReplayHook(hook_type, Path(self.replay_dir), self.replay_speed) for hook_type in hook_types]
+        self.use_kernel_feature_cache()
+        hooks = [hook_type() for hook_type in hook_types]
+        for hook in hooks:
+            if hook.name() in self.ring_buffer_hooks:
+                hook.transport = self.hook_transport(hook.name())
+        return hooks
+
+    def hook_transport(self, hook_name: str) -> bpf.Transport:
+        """Transport of `hook_name` before page counts are sized or outputs captured or pinned."""
+        if hook_name not in self.ring_buffer_hooks:
+            return bpf.Transport()
+        return bpf.Transport(
+            ring_buffer=True,
+            page_cnt=self.ring_buffer_page_cnt,
+            wakeup_events=self.ring_buffer_wakeup_events,
+        )
+
+    def load_mismatches(self, loaded_config: "GenericCollectorConfig", hook_names: list[str]) -> list[str]:
+        """Settings of this config that programs loaded under `loaded_config` cannot follow."""
+        mismatches = [
+            f"transport of {hook_name}"
+            for hook_name in hook_names
+            if self.hook_transport(hook_name) != loaded_config.hook_transport(hook_name)
+        ]
+        page_cnt_fields = [
+            "auto_page_cnt",
+            "page_cnt_loss_probability",
+            "page_cnt_memory_cap_mb",
+            "page_cnt_calibration_sec",
         ]
+        if self.auto_page_cnt or loaded_config.auto_page_cnt:
+            mismatches.extend(
+                field_name
+                for field_name in page_cnt_fields
+                if getattr(self, field_name) != getattr(loaded_config, field_name)
+            )
+        return mismatches
 
 
 CollectorConfig = make_dataclass(
@@ -43,6 +165,11 @@ CollectorConfig = make_dataclass(
 __all__ = [
     "bpf",
     "machine_info",
+    "EscalationEngine",
+    "EscalationRule",
+    "FlightRecorder",
+    "QueryServer",
+    "WriterProcess",
     "CollectorConfig",
     "GenericCollectorConfig",
 ]
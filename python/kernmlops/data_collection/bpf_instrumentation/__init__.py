@@ -1,58 +1,188 @@
-"""Module for maintaining different BPF hooks/instrumentation."""
-
-from typing import Final, Mapping
-
-from data_collection.bpf_instrumentation.blk_io_hook import BlockIOBPFHook
-from data_collection.bpf_instrumentation.bpf_hook import BPFProgram
-from data_collection.bpf_instrumentation.cbmm import (
-    CBMMBPFHook,
-)
-from data_collection.bpf_instrumentation.collapse_huge_page import (
-    CollapseHugePageBPFHook,
-)
-from data_collection.bpf_instrumentation.file_data_hook import FileDataBPFHook
-from data_collection.bpf_instrumentation.fork_and_exit import TraceProcessHook
-from data_collection.bpf_instrumentation.madvise import MadviseBPFHook
-from data_collection.bpf_instrumentation.memory_usage_hook import MemoryUsageHook
-from data_collection.bpf_instrumentation.mm_rss_stat import TraceRSSStatBPFHook
-from data_collection.bpf_instrumentation.perf import (
-    CustomHWConfigManager,
-    PerfBPFHook,
-)
-from data_collection.bpf_instrumentation.process_metadata_hook import (
-    ProcessMetadataHook,
-)
-from data_collection.bpf_instrumentation.quanta_runtime_hook import QuantaRuntimeBPFHook
-from data_collection.bpf_instrumentation.unmap_range import UnmapRangeBPFHook
-from data_collection.bpf_instrumentation.vfs_read_hook import VFSReadBPFHook
-from data_collection.bpf_instrumentation.vfs_write_hook import VFSWriteBPFHook
-from data_collection.bpf_instrumentation.zswap_runtime_hook import ZswapRuntimeBPFHook
-
-all_hooks: Final[Mapping[str, type[BPFProgram]]] = {
-    FileDataBPFHook.name(): FileDataBPFHook,
-    MemoryUsageHook.name(): MemoryUsageHook,
-    ProcessMetadataHook.name(): ProcessMetadataHook,
-    QuantaRuntimeBPFHook.name(): QuantaRuntimeBPFHook,
-    BlockIOBPFHook.name(): BlockIOBPFHook,
-    PerfBPFHook.name(): PerfBPFHook,
-    CollapseHugePageBPFHook.name(): CollapseHugePageBPFHook,
-    CBMMBPFHook.name(): CBMMBPFHook,
-    MadviseBPFHook.name(): MadviseBPFHook,
-    UnmapRangeBPFHook.name(): UnmapRangeBPFHook,
-    TraceRSSStatBPFHook.name(): TraceRSSStatBPFHook,
-    TraceProcessHook.name(): TraceProcessHook,
-    ZswapRuntimeBPFHook.name(): ZswapRuntimeBPFHook,
-    VFSReadBPFHook.name(): VFSReadBPFHook,
-    VFSWriteBPFHook.name(): VFSWriteBPFHook,
+"""Module for maintaining different BPF hooks/instrumentation.
+
+Hooks import BCC and every helper imports polars, so the package exports are
+only imported on first use. Commands that never load a hook start without BCC.
+"""
+
+from importlib import import_module
+from typing import TYPE_CHECKING, Any, Final, Iterator, Mapping
+
+if TYPE_CHECKING:
+    from data_collection.bpf_instrumentation.bpf_hook import BPFProgram
+    from data_collection.bpf_instrumentation.buffer_sizing import (
+        BufferRate,
+        BufferRateMonitor,
+        calibrate_rates,
+        load_rates,
+        peak_rates,
+        save_rates,
+        size_buffers,
+    )
+    from data_collection.bpf_instrumentation.consumer_pool import ConsumerPool
+    from data_collection.bpf_instrumentation.event_buffer import EventBuffer
+    from data_collection.bpf_instrumentation.hook_check import check_hooks
+    from data_collection.bpf_instrumentation.hook_loader import HookLoadTime, load_hooks
+    from data_collection.bpf_instrumentation.hook_selection import (
+        HookPlan,
+        load_hook_costs,
+        plan_hooks,
+    )
+    from data_collection.bpf_instrumentation.kernel_features import (
+        KernelFeatureStats,
+        cache_kernel_features,
+        kernel_build_id,
+        kernel_feature_stats,
+    )
+    from data_collection.bpf_instrumentation.memory_budget import (
+        MemoryBudget,
+        collection_spill_dir,
+    )
+    from data_collection.bpf_instrumentation.microbench import (
+        MICROBENCH_EVENTS,
+        run_microbenchmarks,
+    )
+    from data_collection.bpf_instrumentation.overhead import CollectorOverhead
+    from data_collection.bpf_instrumentation.perf import (
+        CustomHWConfigManager,
+    )
+    from data_collection.bpf_instrumentation.perf_buffer import (
+        PerfBuffers,
+        close_perf_buffers,
+        pop_collection_loss,
+        total_lost_samples,
+    )
+    from data_collection.bpf_instrumentation.poller import AdaptivePoller, EpollPoller
+    from data_collection.bpf_instrumentation.quanta_runtime_hook import (
+        QuantaRuntimeBPFHook,
+    )
+    from data_collection.bpf_instrumentation.raw_capture import decode_raw_capture
+    from data_collection.bpf_instrumentation.replay import ReplayHook
+    from data_collection.bpf_instrumentation.transport import Transport
+
+# hook name to the module and class implementing it
+_hook_modules: Final[Mapping[str, tuple[str, str]]] = {
+    "file_data": ("file_data_hook", "FileDataBPFHook"),
+    "memory_usage": ("memory_usage_hook", "MemoryUsageHook"),
+    "process_metadata": ("process_metadata_hook", "ProcessMetadataHook"),
+    "quanta_runtime": ("quanta_runtime_hook", "QuantaRuntimeBPFHook"),
+    "block_io": ("blk_io_hook", "BlockIOBPFHook"),
+    "perf": ("perf", "PerfBPFHook"),
+    "collapse_huge_pages": ("collapse_huge_page", "CollapseHugePageBPFHook"),
+    "cbmm": ("cbmm", "CBMMBPFHook"),
+    "madvise": ("madvise", "MadviseBPFHook"),
+    "unmap_range": ("unmap_range", "UnmapRangeBPFHook"),
+    "mm_rss_stat": ("mm_rss_stat", "TraceRSSStatBPFHook"),
+    "process_trace": ("fork_and_exit", "TraceProcessHook"),
+    "zswap_runtime": ("zswap_runtime_hook", "ZswapRuntimeBPFHook"),
+    "vfs_read": ("vfs_read_hook", "VFSReadBPFHook"),
+    "vfs_write": ("vfs_write_hook", "VFSWriteBPFHook"),
 }
 
+# package export to the module defining it
+_exports: Final[Mapping[str, str]] = {
+    "BPFProgram": "bpf_hook",
+    "BufferRate": "buffer_sizing",
+    "BufferRateMonitor": "buffer_sizing",
+    "calibrate_rates": "buffer_sizing",
+    "load_rates": "buffer_sizing",
+    "peak_rates": "buffer_sizing",
+    "save_rates": "buffer_sizing",
+    "size_buffers": "buffer_sizing",
+    "ConsumerPool": "consumer_pool",
+    "EventBuffer": "event_buffer",
+    "check_hooks": "hook_check",
+    "HookLoadTime": "hook_loader",
+    "load_hooks": "hook_loader",
+    "HookPlan": "hook_selection",
+    "load_hook_costs": "hook_selection",
+    "plan_hooks": "hook_selection",
+    "cache_kernel_features": "kernel_features",
+    "kernel_build_id": "kernel_features",
+    "kernel_feature_stats": "kernel_features",
+    "KernelFeatureStats": "kernel_features",
+    "MemoryBudget": "memory_budget",
+    "collection_spill_dir": "memory_budget",
+    "MICROBENCH_EVENTS": "microbench",
+    "run_microbenchmarks": "microbench",
+    "CollectorOverhead": "overhead",
+    "CustomHWConfigManager": "perf",
+    "PerfBuffers": "perf_buffer",
+    "close_perf_buffers": "perf_buffer",
+    "pop_collection_loss": "perf_buffer",
+    "total_lost_samples": "perf_buffer",
+    "AdaptivePoller": "poller",
+    "EpollPoller": "poller",
+    "QuantaRuntimeBPFHook": "quanta_runtime_hook",
+    "decode_raw_capture": "raw_capture",
+    "ReplayHook": "replay",
+    "Transport": "transport",
+}
+
+
+def __getattr__(name: str) -> Any:
+    if name not in _exports:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(import_module(f"{__name__}.{_exports[name]}"), name)
+
+
+class _HookTypes(Mapping[str, "type[BPFProgram]"]):
+    """Hook types by name, a hook's module is imported when its type is first looked up."""
+
+    def __getitem__(self, hook_name: str) -> "type[BPFProgram]":
+        module_name, class_name = _hook_modules[hook_name]
+        hook_type = getattr(import_module(f"{__name__}.{module_name}"), class_name)
+        assert hook_type.name() == hook_name
+        return hook_type
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(_hook_modules)
+
+    def __len__(self) -> int:
+        return len(_hook_modules)
+
+
+all_hooks: Final[Mapping[str, "type[BPFProgram]"]] = _HookTypes()
+
 def hook_names() -> list[str]:
     return list(all_hooks.keys())
 
 __all__ = [
     "all_hooks",
     "hook_names",
+    "calibrate_rates",
+    "cache_kernel_features",
+    "check_hooks",
+    "load_rates",
+    "peak_rates",
+    "save_rates",
+    "size_buffers",
+    "close_perf_buffers",
+    "collection_spill_dir",
+    "decode_raw_capture",
+    "kernel_build_id",
+    "kernel_feature_stats",
+    "load_hook_costs",
+    "load_hooks",
+    "plan_hooks",
+    "pop_collection_loss",
+    "run_microbenchmarks",
+    "total_lost_samples",
+    "AdaptivePoller",
+    "MICROBENCH_EVENTS",
     "BPFProgram",
+    "BufferRate",
+    "BufferRateMonitor",
+    "CollectorOverhead",
+    "ConsumerPool",
     "CustomHWConfigManager",
+    "EventBuffer",
+    "EpollPoller",
+    "HookLoadTime",
+    "KernelFeatureStats",
+    "HookPlan",
+    "MemoryBudget",
+    "PerfBuffers",
     "QuantaRuntimeBPFHook",
+    "ReplayHook",
+    "Transport",
 ]
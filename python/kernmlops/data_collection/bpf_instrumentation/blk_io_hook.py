@@ -1,12 +1,20 @@
 from dataclasses import dataclass
 from pathlib import Path
-from typing import cast
+from types import SimpleNamespace
+from typing import Any, Mapping, cast
 
 import polars as pl
-from bcc import BPF
 from data_collection.bpf_instrumentation.bpf_hook import POLL_TIMEOUT_MS, BPFProgram
+from data_collection.bpf_instrumentation.event_buffer import EventBuffer
+from data_collection.bpf_instrumentation.kernel_features import kernel_struct_has_field
+from data_collection.bpf_instrumentation.perf_buffer import PerfBuffers
 from data_schema import UPTIME_TIMESTAMP, CollectionTable
-from data_schema.block_io import BlockIOLatencyTable, BlockIOQueueTable, BlockIOTable
+from data_schema.block_io import (
+  BlockIOJoin,
+  BlockIOLatencyTable,
+  BlockIOQueueTable,
+  BlockIOTable,
+)
 
 
 @dataclass(frozen=True)
@@ -34,6 +42,8 @@ class BlockIOLatencyData:
   block_io_flags: int
 
 class BlockIOBPFHook(BPFProgram):
+  # queue accounting runs while disabled, the queues it tracks outlive a collection
+  kept_maps = frozenset(["device_queue", "started_4k_ios"])
 
   @classmethod
   def name(cls) -> str:
@@ -43,58 +53,119 @@ class BlockIOBPFHook(BPFProgram):
     bpf_text = open(Path(__file__).parent / "bpf/blk_io.bpf.c", "r").read()
 
     # code substitutions
-    if BPF.kernel_struct_has_field(b'request', b'rq_disk') == 1:
+    if kernel_struct_has_field('request', 'rq_disk'):
         bpf_text = bpf_text.replace('__RQ_DISK__', 'rq_disk')
     else:
         bpf_text = bpf_text.replace('__RQ_DISK__', 'q->disk')
     self.bpf_text = bpf_text
-    self.block_io_queue_data = list[BlockIOQueueData]()
-    self.block_io_latency_data = list[BlockIOLatencyData]()
+    self.block_io_queue_data = EventBuffer(BlockIOQueueData)
+    self.block_io_latency_data = EventBuffer(BlockIOLatencyData)
 
   def load(self, collection_id: str):
     self.collection_id = collection_id
-    self.bpf = BPF(text = self.bpf_text)
-    self.bpf["block_io_starts"].open_perf_buffer(self._queue_event_handler, page_cnt=64)
-    self.bpf["block_io_ends"].open_perf_buffer(self._latency_event_handler, page_cnt=64)
+    self.bpf = self.compiled_bpf()
+    self.open_buffers()
+
+  def open_buffers(self):
+    self.perf_buffers = PerfBuffers(self.bpf, self.name(), self.transport)
+    self.perf_buffers.open("block_io_starts", self._queue_event_handler, page_cnt=64)
+    self.perf_buffers.open("block_io_ends", self._latency_event_handler, page_cnt=64)
 
   def poll(self):
-    self.bpf.perf_buffer_poll(timeout=POLL_TIMEOUT_MS)
+    self.perf_buffers.poll(timeout_ms=POLL_TIMEOUT_MS)
 
   def close(self):
     self.bpf.cleanup()
 
-  def data(self) -> list[CollectionTable]:
-    return list[CollectionTable]([
-      BlockIOTable.from_tables(
-        latency_table=cast(
-          BlockIOLatencyTable,
-          BlockIOLatencyTable.from_df_id(
-            pl.DataFrame(self.block_io_latency_data).rename({
-              "block_io_end_uptime_us": UPTIME_TIMESTAMP,
-            }),
-            collection_id=self.collection_id,
-          ),
+  def buffers(self) -> Mapping[str, EventBuffer]:
+    return {
+      "block_io_queue": self.block_io_queue_data,
+      "block_io_latency": self.block_io_latency_data,
+    }
+
+  @classmethod
+  def _raw_tables(
+    cls, raw_data: Mapping[str, pl.DataFrame], collection_id: str,
+  ) -> tuple[BlockIOQueueTable, BlockIOLatencyTable]:
+    return (
+      cast(
+        BlockIOQueueTable,
+        BlockIOQueueTable.from_df_id(
+          raw_data["block_io_queue"].rename({
+            "block_io_start_uptime_us": UPTIME_TIMESTAMP,
+          }),
+          collection_id=collection_id,
         ),
-        queue_table=cast(
-          BlockIOQueueTable,
-          BlockIOQueueTable.from_df_id(
-            pl.DataFrame(self.block_io_queue_data).rename({
-              "block_io_start_uptime_us": UPTIME_TIMESTAMP,
-            }),
-            collection_id=self.collection_id,
-          ),
+      ),
+      cast(
+        BlockIOLatencyTable,
+        BlockIOLatencyTable.from_df_id(
+          raw_data["block_io_latency"].rename({
+            "block_io_end_uptime_us": UPTIME_TIMESTAMP,
+          }),
+          collection_id=collection_id,
         ),
       ),
+    )
+
+  @classmethod
+  def build_tables(cls, raw_data: Mapping[str, pl.DataFrame], collection_id: str) -> list[CollectionTable]:
+    queue_table, latency_table = cls._raw_tables(raw_data, collection_id)
+    return list[CollectionTable]([
+      BlockIOTable.from_tables(queue_table=queue_table, latency_table=latency_table),
     ])
 
-  def clear(self):
-    self.block_io_queue_data.clear()
-    self.block_io_latency_data.clear()
+  @classmethod
+  def build_streaming_tables(
+    cls, raw_data: Mapping[str, pl.DataFrame], collection_id: str, joins: dict[str, Any],
+  ) -> list[CollectionTable]:
+    queue_table, latency_table = cls._raw_tables(raw_data, collection_id)
+    block_io_join = joins.setdefault(BlockIOTable.name(), BlockIOJoin())
+    return list[CollectionTable]([
+      block_io_join.join(queue_table=queue_table, latency_table=latency_table),
+    ])
 
-  def pop_data(self) -> list[CollectionTable]:
-    block_io_tables = self.data()
-    self.clear()
-    return block_io_tables
+  @classmethod
+  def synthetic_event(cls, table_name: str, seq: int) -> Any:
+    if table_name == "block_io_starts":
+      # every request is queued 10us after the last and completes 5us later
+      return SimpleNamespace(
+        device=8, sector=seq, segments=1, block_io_bytes=4096, block_io_start_uptime_us=seq * 10,
+        block_io_flags=0, queue_length_segments=1, queue_length_4ks=1,
+      )
+    return SimpleNamespace(
+      device=8, sector=seq, segments=1, block_io_bytes=4096, block_io_end_uptime_us=seq * 10 + 5,
+      block_latency_us=5, block_io_latency_us=5, block_io_flags=0,
+    )
+
+  @classmethod
+  def raw_data_from_tables(cls, tables: Mapping[str, pl.DataFrame]) -> Mapping[str, pl.DataFrame]:
+    # only requests matched by the join are recorded, their completion cpu is not
+    block_io = tables[BlockIOTable.name()]
+    return {
+      "block_io_queue": block_io.select(
+        "cpu",
+        "device",
+        "sector",
+        "segments",
+        "block_io_bytes",
+        pl.col(UPTIME_TIMESTAMP).alias("block_io_start_uptime_us"),
+        "block_io_flags",
+        "queue_length_segment_ios",
+        "queue_length_4k_ios",
+      ),
+      "block_io_latency": block_io.select(
+        "cpu",
+        "device",
+        "sector",
+        "segments",
+        "block_io_bytes",
+        pl.col("finish_ts_uptime_us").alias("block_io_end_uptime_us"),
+        "block_latency_us",
+        "block_io_latency_us",
+        "block_io_flags",
+      ).sort("block_io_end_uptime_us"),
+    }
 
   def _queue_event_handler(self, cpu, block_io_start_perf_event, size):
     event = self.bpf["block_io_starts"].event(block_io_start_perf_event)
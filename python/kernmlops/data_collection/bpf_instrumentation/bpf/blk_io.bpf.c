@@ -10,6 +10,7 @@
 
 typedef struct block_io_start_perf_event {
   u32 device;
+  u32 cpu;
   u64 sector;
   u32 segments;
   u32 block_io_bytes;
@@ -21,6 +22,7 @@ typedef struct block_io_start_perf_event {
 
 typedef struct block_io_end_perf_event {
   u32 device;
+  u32 cpu;
   u64 sector;
   u32 segments;
   u32 block_io_bytes;
@@ -75,6 +77,7 @@ static inline unsigned short blk_rq_nr_phys_segments_dup(struct request* rq) {
 // when a block request is issued to the hardware driver
 // block_rq_issue: https://elixir.bootlin.com/linux/v5.6/source/include/trace/events/block.h#L207
 RAW_TRACEPOINT_PROBE(block_rq_issue) {
+  KERNMLOPS_RETURN_IF_DISABLED();
   struct request* req = (void*)ctx->args[0];
   u32 device = ddevt(req->__RQ_DISK__);
   u64 sector = req->__sector;
@@ -108,6 +111,7 @@ RAW_TRACEPOINT_PROBE(block_rq_issue) {
   struct block_io_start_perf_event data;
   __builtin_memset(&data, 0, sizeof(data));
   data.device = device;
+  data.cpu = bpf_get_smp_processor_id();
   data.sector = sector;
   data.segments = segments;
   data.block_io_bytes = bytes;
@@ -141,6 +145,7 @@ RAW_TRACEPOINT_PROBE(block_rq_complete) {
   struct block_io_end_perf_event data;
   __builtin_memset(&data, 0, sizeof(data));
   data.device = device;
+  data.cpu = bpf_get_smp_processor_id();
   data.sector = sector;
   data.segments = segments;
   data.block_io_bytes = bytes;
@@ -150,7 +155,10 @@ RAW_TRACEPOINT_PROBE(block_rq_complete) {
   data.block_io_latency_us = io_delta / 1000;
   data.block_io_flags = flags;
 
-  block_io_ends.perf_submit(ctx, &data, sizeof(data));
+  // requests issued before the hook was disabled still leave the queue lengths
+  if (!kernmlops_disabled()) {
+    block_io_ends.perf_submit(ctx, &data, sizeof(data));
+  }
 
   // get device queue for request that just finished
   struct queue_lengths* q_lengths = device_queue.lookup(&device);
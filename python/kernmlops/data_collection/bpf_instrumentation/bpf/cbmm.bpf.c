@@ -65,6 +65,7 @@ static void insert_mm_estimate_changes(int action) {
 
 int kprobe__mm_estimate_changes(struct pt_regs* ctx, struct mm_action* action,
                                 struct mm_cost_delta* cost) {
+  KERNMLOPS_RETURN_IF_DISABLED();
   switch (action->action) {
     case MM_ACTION_EAGER_PAGING:
     case MM_ACTION_RUN_PREZEROING:
@@ -106,15 +107,18 @@ int kretprobe__mm_decide(struct pt_regs* ctx) {
   struct cbmm_action* storage_action = NULL;
   if (!(storage_action = cbmm_action_hash.lookup(&tgid_pid)))
     return 0;
-  switch (storage_action->action) {
-    case MM_ACTION_EAGER_PAGING:
-      mm_decide_push_eager(ctx, PT_REGS_RC(ctx), *storage_action);
-      break;
-    case MM_ACTION_RUN_PREZEROING:
-      mm_decide_push_prezero(ctx, PT_REGS_RC(ctx), *storage_action);
-      break;
-    default:
-      break;
+  // decisions started before the hook was disabled still clear their action
+  if (!kernmlops_disabled()) {
+    switch (storage_action->action) {
+      case MM_ACTION_EAGER_PAGING:
+        mm_decide_push_eager(ctx, PT_REGS_RC(ctx), *storage_action);
+        break;
+      case MM_ACTION_RUN_PREZEROING:
+        mm_decide_push_prezero(ctx, PT_REGS_RC(ctx), *storage_action);
+        break;
+      default:
+        break;
+    }
   }
   cbmm_action_hash.delete(&tgid_pid);
   return 0;
@@ -33,6 +33,7 @@ typedef struct trace_mm_khugepaged_scan_pmd_struct {
 BPF_PERF_OUTPUT(trace_mm_khugepaged_scan_pmds);
 
 RAW_TRACEPOINT_PROBE(mm_khugepaged_scan_pmd) {
+  KERNMLOPS_RETURN_IF_DISABLED();
   u64 start = bpf_ktime_get_ns();
   trace_mm_khugepaged_scan_pmd_t data;
   __builtin_memset(&data, 0, sizeof(data));
@@ -68,6 +69,7 @@ typedef struct collapse_huge_page_struct {
 
 int kprobe_collapse_huge_page(struct pt_regs* ctx, struct mm_struct* mm, u64 address,
                               int referenced, int unmapped, struct collapse_control* cc) {
+  KERNMLOPS_RETURN_IF_DISABLED();
   u64 start = bpf_ktime_get_ns();
   collapse_huge_page_t data;
   __builtin_memset(&data, 0, sizeof(data));
@@ -98,6 +100,7 @@ BPF_PERF_OUTPUT(trace_mm_collapse_huge_pages);
 // If this succeeds a folio was allocated meaning there was space
 
 RAW_TRACEPOINT_PROBE(mm_collapse_huge_page) {
+  KERNMLOPS_RETURN_IF_DISABLED();
   u64 start = bpf_ktime_get_ns();
   trace_mm_collapse_huge_page_t data;
   __builtin_memset(&data, 0, sizeof(data));
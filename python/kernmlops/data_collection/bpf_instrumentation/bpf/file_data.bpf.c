@@ -9,6 +9,7 @@ typedef struct file_open_perf_event {
   u32 tgid;
   u64 ts_uptime_us;
   u32 file_inode;
+  u32 cpu;
   u64 file_size_bytes;
   char file_name[DNAME_INLINE_LEN];
 } file_open_perf_event_t;
@@ -34,6 +35,7 @@ static int probe_dentry(struct pt_regs* ctx, struct dentry* dentry, bool created
   // TODO(Patrick): avoid division and multiplication
   data.ts_uptime_us = ts / 1000;
   data.file_inode = dentry->d_inode->i_ino;
+  data.cpu = bpf_get_smp_processor_id();
   data.file_size_bytes = file_size;
   bpf_probe_read(&data.file_name, DNAME_INLINE_LEN, (const void*)&dentry->d_iname);
 
@@ -52,16 +54,19 @@ int trace_create(struct pt_regs* ctx, struct mnt_idmap* idmap, struct inode* dir
                  struct dentry* dentry)
 #endif
 {
+  KERNMLOPS_RETURN_IF_DISABLED();
   return probe_dentry(ctx, dentry, true);
 }
 
 // trace file security_inode_create time
 int trace_security_inode_create(struct pt_regs* ctx, struct inode* dir, struct dentry* dentry) {
+  KERNMLOPS_RETURN_IF_DISABLED();
   return probe_dentry(ctx, dentry, true);
 }
 
 // trace file open time
 int trace_open(struct pt_regs* ctx, struct path* path, struct file* file) {
+  KERNMLOPS_RETURN_IF_DISABLED();
   struct dentry* dentry = path->dentry;
   bool created = file->f_mode & FMODE_CREATED;
   return probe_dentry(ctx, dentry, created);
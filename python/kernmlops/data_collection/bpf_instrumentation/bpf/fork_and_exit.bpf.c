@@ -18,6 +18,7 @@ BPF_PERF_OUTPUT(release_task_events);
 BPF_PERF_OUTPUT(exec_events);
 
 int kretprobe_copy_process(struct pt_regs* ctx) {
+  KERNMLOPS_RETURN_IF_DISABLED();
   struct task_struct* task;
   if (IS_ERR(task = (struct task_struct*)PT_REGS_RC(ctx)))
     return 0;
@@ -31,6 +32,7 @@ int kretprobe_copy_process(struct pt_regs* ctx) {
 }
 
 int kprobe_do_exit(struct pt_regs* ctx, long code) {
+  KERNMLOPS_RETURN_IF_DISABLED();
   struct task_struct* task = (struct task_struct*)bpf_get_current_task();
   stop_data_t data;
   data.ts = bpf_ktime_get_ns();
@@ -43,6 +45,7 @@ int kprobe_do_exit(struct pt_regs* ctx, long code) {
 typedef start_data_t exec_data_t;
 
 int kretprobe_exec(struct pt_regs* ctx) {
+  KERNMLOPS_RETURN_IF_DISABLED();
   if (PT_REGS_RC(ctx) != 0)
     return 0;
 
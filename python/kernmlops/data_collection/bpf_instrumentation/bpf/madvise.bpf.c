@@ -16,6 +16,7 @@ BPF_HASH(munmap_hash, u32, madvise_output_t, 32768);
 
 int kprobe__do_madvise(struct pt_regs* ctx, struct mm_struct* mm, unsigned long addr, size_t length,
                        int advice) {
+  KERNMLOPS_RETURN_IF_DISABLED();
   u32 pid = bpf_get_current_pid_tgid();
   madvise_output_t data;
   memset((void*)&data, 0, sizeof(data));
@@ -31,13 +32,11 @@ int kprobe__do_madvise(struct pt_regs* ctx, struct mm_struct* mm, unsigned long
 int kretprobe__do_madvise(struct pt_regs* ctx) {
   u32 pid = bpf_get_current_pid_tgid();
   madvise_output_t* data;
-  if (((int)PT_REGS_RC(ctx)) != 0)
-    madvise_hash.delete(&pid);
-  return 0;
   if ((data = madvise_hash.lookup(&pid)) == NULL)
-    madvise_hash.delete(&pid);
-  return 0;
-  madvise_output.perf_submit(ctx, data, sizeof(madvise_output_t));
+    return 0;
+  // calls entered before the hook was disabled or that failed still clear their entry
+  if (((int)PT_REGS_RC(ctx)) == 0 && !kernmlops_disabled())
+    madvise_output.perf_submit(ctx, data, sizeof(madvise_output_t));
   madvise_hash.delete(&pid);
   return 0;
 }
@@ -45,6 +44,7 @@ int kretprobe__do_madvise(struct pt_regs* ctx) {
 int kprobe__do_vmi_align_munmap(struct pt_regs* ctx, struct vm_area_struct* vma,
                                 struct mm_struct* mm, unsigned long start, unsigned long end,
                                 struct list_head* uf, bool unlock) {
+  KERNMLOPS_RETURN_IF_DISABLED();
   u32 pid = bpf_get_current_pid_tgid();
   madvise_output_t data;
   memset((void*)&data, 0, sizeof(data));
@@ -62,10 +62,8 @@ int kretprobe__do_vmi_align_munmap(struct pt_regs* ctx) {
   u32 pid = bpf_get_current_pid_tgid();
   if ((data = munmap_hash.lookup(&pid)) == NULL)
     return 0;
-  if (((int)PT_REGS_RC(ctx)) != 0)
-    munmap_hash.delete(&pid);
-  return 0;
-  madvise_output.perf_submit(ctx, data, sizeof(madvise_output_t));
+  if (((int)PT_REGS_RC(ctx)) == 0 && !kernmlops_disabled())
+    madvise_output.perf_submit(ctx, data, sizeof(madvise_output_t));
   munmap_hash.delete(&pid);
   return 0;
 }
@@ -18,6 +18,7 @@ BPF_HASH(rss_stat_hash, u32, rss_stat_output_t, 32768);
 #define PAGE_SZ 12
 
 RAW_TRACEPOINT_PROBE(rss_stat) {
+  KERNMLOPS_RETURN_IF_DISABLED();
   rss_stat_output_t stack_data;
   u32 pid = bpf_get_current_pid_tgid();
   memset((void*)&stack_data, 0, sizeof(stack_data));
@@ -31,6 +32,7 @@ RAW_TRACEPOINT_PROBE(rss_stat) {
 }
 
 TRACEPOINT_PROBE(kmem, rss_stat) {
+  KERNMLOPS_RETURN_IF_DISABLED();
   rss_stat_output_t* data;
   u32 pid = bpf_get_current_pid_tgid();
   if ((data = rss_stat_hash.lookup(&pid)) == NULL) {
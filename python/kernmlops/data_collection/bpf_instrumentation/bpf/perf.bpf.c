@@ -6,6 +6,7 @@ typedef struct perf_event_data {
   u32 tgid;
   u64 ts_uptime_us;
   u32 count;
+  u32 cpu;
   u64 enabled_time_us;
   u64 running_time_us;
 } tlb_perf_event_data_t;
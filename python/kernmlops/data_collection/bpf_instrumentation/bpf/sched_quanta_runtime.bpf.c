@@ -14,6 +14,7 @@ typedef struct quanta_runtime_perf_event {
   u32 tgid;
   u64 quanta_end_uptime_us;
   u32 quanta_run_length_us;
+  u32 cpu;
 } quanta_runtime_perf_event_t;
 
 BPF_HASH(run_start, u32);
@@ -27,6 +28,7 @@ RAW_TRACEPOINT_PROBE(sched_wakeup_new) {
 #else
 int trace_wake_up_new_task(struct pt_regs* ctx, struct task_struct* p) {
 #endif
+  KERNMLOPS_RETURN_IF_DISABLED();
   u64 ts = bpf_ktime_get_ns();
   u32 pid = p->pid;
   queue_start.update(&pid, &ts);
@@ -40,6 +42,7 @@ RAW_TRACEPOINT_PROBE(sched_wakeup) {
 int trace_ttwu_do_wakeup(struct pt_regs* ctx, struct rq* rq, struct task_struct* p,
                          int wake_flags) {
 #endif
+  KERNMLOPS_RETURN_IF_DISABLED();
   u64 ts = bpf_ktime_get_ns();
 
   u32 tgid = p->tgid;
@@ -63,6 +66,13 @@ int trace_run(struct pt_regs* ctx, struct task_struct* prev) {
   u32 next_pid = bpf_get_current_pid_tgid();
   u32 next_tgid = bpf_get_current_pid_tgid() >> 32;
 #endif
+  if (kernmlops_disabled()) {
+    // timestamps taken before the hook was disabled would span the disabled time once enabled again
+    u32 prev_pid = prev->pid;
+    queue_start.delete(&next_pid);
+    run_start.delete(&prev_pid);
+    return 0;
+  }
 
   u64 ts = bpf_ktime_get_ns();
 
@@ -81,6 +91,7 @@ int trace_run(struct pt_regs* ctx, struct task_struct* prev) {
       // TODO(Patrick): avoid division and multiplication
       data.quanta_end_uptime_us = ts / 1000;
       data.quanta_run_length_us = delta / 1000;
+      data.cpu = bpf_get_smp_processor_id();
       // TODO(Patrick): consider only submitting if greater than 10us or so
       quanta_queue_times.perf_submit(ctx, &data, sizeof(data));
       queue_start.delete(&next_pid);
@@ -108,6 +119,7 @@ int trace_run(struct pt_regs* ctx, struct task_struct* prev) {
   // TODO(Patrick): avoid division and multiplication
   data.quanta_end_uptime_us = ts / 1000;
   data.quanta_run_length_us = delta / 1000;
+  data.cpu = bpf_get_smp_processor_id();
 
   quanta_runtimes.perf_submit(ctx, &data, sizeof(data));
   run_start.delete(&pid);
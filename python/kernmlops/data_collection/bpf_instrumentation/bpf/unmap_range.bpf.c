@@ -13,6 +13,7 @@ BPF_PERF_OUTPUT(unmap_range_output);
 
 int kprobe__unmap_page_range(struct pt_regs* ctx, struct mm_gather* tlb, struct vm_area_struct* vma,
                              unsigned long start, unsigned long end, struct zap_details* details) {
+  KERNMLOPS_RETURN_IF_DISABLED();
   unmap_range_output_t data;
   data.tgid = vma->vm_mm->owner->tgid;
   data.ts_ns = bpf_ktime_get_ns();
@@ -26,6 +27,7 @@ int kprobe__unmap_page_range(struct pt_regs* ctx, struct mm_gather* tlb, struct
 int kprobe__unmap_hugepage_range(struct pt_regs* ctx, struct mm_gather* tlb,
                                  struct vm_area_struct* vma, unsigned long start, unsigned long end,
                                  struct page* ref_page, zap_flags_t zap_flags) {
+  KERNMLOPS_RETURN_IF_DISABLED();
   unmap_range_output_t data;
   data.tgid = vma->vm_mm->owner->tgid;
   data.ts_ns = bpf_ktime_get_ns();
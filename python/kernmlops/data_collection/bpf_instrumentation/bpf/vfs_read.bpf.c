@@ -42,6 +42,7 @@ int trace_read_iter_branch(struct pt_regs* ctx) {
 // Entry to vfs_read
 int trace_vfs_read_entry(struct pt_regs* ctx, struct file* file, char __user* buf, u64 count,
                          loff_t* pos) {
+  KERNMLOPS_RETURN_IF_DISABLED();
   u64 id = bpf_get_current_pid_tgid();
 
   vfs_read_event_t event = {};
@@ -87,8 +88,11 @@ int trace_vfs_read_return(struct pt_regs* ctx) {
   if (!event)
     return 0;
 
-  event->ret = PT_REGS_RC(ctx);
-  vfs_read_events.perf_submit(ctx, event, sizeof(*event));
+  // calls entered before the hook was disabled still clear their context
+  if (!kernmlops_disabled()) {
+    event->ret = PT_REGS_RC(ctx);
+    vfs_read_events.perf_submit(ctx, event, sizeof(*event));
+  }
   read_ctx.delete(&id);
   return 0;
 }
@@ -42,6 +42,7 @@ int trace_write_iter_branch(struct pt_regs* ctx) {
 // Entry to vfs_write
 int trace_vfs_write_entry(struct pt_regs* ctx, struct file* file, char __user* buf, u64 count,
                           loff_t* pos) {
+  KERNMLOPS_RETURN_IF_DISABLED();
   u64 id = bpf_get_current_pid_tgid();
 
   vfs_write_event_t event = {};
@@ -83,8 +84,11 @@ int trace_vfs_write_return(struct pt_regs* ctx) {
   if (!event)
     return 0;
 
-  event->ret = PT_REGS_RC(ctx);
-  vfs_write_events.perf_submit(ctx, event, sizeof(*event));
+  // calls entered before the hook was disabled still clear their context
+  if (!kernmlops_disabled()) {
+    event->ret = PT_REGS_RC(ctx);
+    vfs_write_events.perf_submit(ctx, event, sizeof(*event));
+  }
   write_ctx.delete(&id);
   return 0;
 }
@@ -17,6 +17,7 @@ BPF_HASH(loads, u64, u64);
 BPF_HASH(invalidates, u64, u64);
 
 int trace_zswap_store_entry(struct pt_regs* ctx) {
+  KERNMLOPS_RETURN_IF_DISABLED();
   u64 id = bpf_get_current_pid_tgid();
   u64 start_ts = bpf_ktime_get_ns();
   stores.update(&id, &start_ts);
@@ -28,20 +29,22 @@ int trace_zswap_store_return(struct pt_regs* ctx) {
   u64* start_ts = stores.lookup(&id);
   if (start_ts == 0)
     return 0;
-  struct task_struct* task;
-  if (IS_ERR(task = (struct task_struct*)PT_REGS_RC(ctx)))
-    return 0;
   zswap_event_t event;
   event.pid = (u32)(id);
   event.tgid = (u32)(id >> 32);
   event.start_ts = *start_ts;
   event.end_ts = bpf_ktime_get_ns();
-  zswap_store_events.perf_submit(ctx, &event, sizeof(event));
+  // calls entered before the hook was disabled or that failed still clear their start
   stores.delete(&id);
+  struct task_struct* task;
+  if (kernmlops_disabled() || IS_ERR(task = (struct task_struct*)PT_REGS_RC(ctx)))
+    return 0;
+  zswap_store_events.perf_submit(ctx, &event, sizeof(event));
   return 0;
 }
 
 int trace_zswap_load_entry(struct pt_regs* ctx) {
+  KERNMLOPS_RETURN_IF_DISABLED();
   u64 id = bpf_get_current_pid_tgid();
   u64 start_ts = bpf_ktime_get_ns();
   loads.update(&id, &start_ts);
@@ -53,20 +56,22 @@ int trace_zswap_load_return(struct pt_regs* ctx) {
   u64* start_ts = loads.lookup(&id);
   if (start_ts == 0)
     return 0;
-  struct task_struct* task;
-  if (IS_ERR(task = (struct task_struct*)PT_REGS_RC(ctx)))
-    return 0;
   zswap_event_t event;
   event.pid = (u32)(id);
   event.tgid = (u32)(id >> 32);
   event.start_ts = *start_ts;
   event.end_ts = bpf_ktime_get_ns();
-  zswap_load_events.perf_submit(ctx, &event, sizeof(event));
+  // calls entered before the hook was disabled or that failed still clear their start
   loads.delete(&id);
+  struct task_struct* task;
+  if (kernmlops_disabled() || IS_ERR(task = (struct task_struct*)PT_REGS_RC(ctx)))
+    return 0;
+  zswap_load_events.perf_submit(ctx, &event, sizeof(event));
   return 0;
 }
 
 int trace_zswap_invalidate_entry(struct pt_regs* ctx) {
+  KERNMLOPS_RETURN_IF_DISABLED();
   u64 id = bpf_get_current_pid_tgid();
   u64 start_ts = bpf_ktime_get_ns();
   invalidates.update(&id, &start_ts);
@@ -78,15 +83,16 @@ int trace_zswap_invalidate_return(struct pt_regs* ctx) {
   u64* start_ts = invalidates.lookup(&id);
   if (start_ts == 0)
     return 0;
-  struct task_struct* task;
-  if (IS_ERR(task = (struct task_struct*)PT_REGS_RC(ctx)))
-    return 0;
   zswap_event_t event;
   event.pid = (u32)(id);
   event.tgid = (u32)(id >> 32);
   event.start_ts = *start_ts;
   event.end_ts = bpf_ktime_get_ns();
-  zswap_invalidate_events.perf_submit(ctx, &event, sizeof(event));
+  // calls entered before the hook was disabled or that failed still clear their start
   invalidates.delete(&id);
+  struct task_struct* task;
+  if (kernmlops_disabled() || IS_ERR(task = (struct task_struct*)PT_REGS_RC(ctx)))
+    return 0;
+  zswap_invalidate_events.perf_submit(ctx, &event, sizeof(event));
   return 0;
 }
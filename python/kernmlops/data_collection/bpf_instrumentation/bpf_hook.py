@@ -1,6 +1,16 @@
 """Abstract definition of a BPF program."""
 
+import time
+from typing import Any, Mapping
 
+import polars as pl
+from data_collection.bpf_instrumentation.event_buffer import EventBuffer
+from data_collection.bpf_instrumentation.transport import (
+  CONTROL_MAP,
+  PERF_TRANSPORT,
+  Transport,
+  hash_map_names,
+)
 from data_schema import CollectionTable
 from typing_extensions import Final, Protocol
 
@@ -8,30 +18,224 @@ POLL_TIMEOUT_MS: Final[int] = 5
 
 
 class BPFProgram(Protocol):
-  """Loadable BPF program that returns performance data."""
+  """Loadable BPF program that returns performance data.
+
+  Event handlers append rows to the program's `EventBuffer`s, tables are built
+  from the retired rows of those buffers so polling never waits on table creation.
+  """
+
+  collection_id: str
+  # set before load to move the program's outputs to ring buffers or capture them raw
+  transport: Transport = PERF_TRANSPORT
+  # disabled programs stay attached, their probes return before recording anything
+  enabled: bool = True
+  # hash maps `rearm` keeps, state that stays valid across collections
+  kept_maps: frozenset[str] = frozenset()
 
   @classmethod
   def name(cls) -> str: ...
 
   def load(self, collection_id: str) -> None: ...
 
+  def compile(self) -> None:
+    """Compiles the program's `bpf_text` ahead of `load`, which then only attaches it.
+
+    BCC compiles without holding the GIL so programs can be compiled in
+    threads, see `load_hooks`. Probes BCC attaches by their name are attached
+    by compiling already.
+    """
+    bpf_text = getattr(self, "bpf_text", None)
+    if bpf_text is None:
+      return
+    from bcc import BPF
+
+    self._compiled_bpf = BPF(text=self.transport.bpf_text(bpf_text))
+
+  def compiled_bpf(self) -> Any:
+    """The `BPF` compiled ahead of `load`, compiled now when it was not."""
+    if getattr(self, "_compiled_bpf", None) is None:
+      self.compile()
+    compiled_bpf, self._compiled_bpf = self._compiled_bpf, None
+    return compiled_bpf
+
+  def discard(self) -> None:
+    """Releases what a failed or abandoned load left, the loaded program or one compiled ahead of `load`."""
+    if getattr(self, "bpf", None) is not None:
+      self.close()
+      return
+    compiled_bpf, self._compiled_bpf = getattr(self, "_compiled_bpf", None), None
+    if compiled_bpf is not None:
+      compiled_bpf.cleanup()
+
+  def open_buffers(self) -> None:
+    """Opens the program's `PerfBuffers` on `self.bpf`, also how raw captures are decoded."""
+
   def poll(self) -> None: ...
 
+  def enable(self) -> None:
+    self._set_enabled(True)
+
+  def disable(self) -> None:
+    """Stops recording without detaching, cheaper than closing and loading the program again."""
+    self._set_enabled(False)
+
+  def _set_enabled(self, enabled: bool) -> None:
+    self.enabled = enabled
+    # sampling hooks have no program, pollers skip them while disabled instead
+    bpf = getattr(self, "bpf", None)
+    if bpf is None:
+      return
+    control = bpf[CONTROL_MAP]
+    control[control.Key(0)] = control.Leaf(0 if enabled else 1)
+
   def close(self) -> None: ...
 
-  def data(self) -> list[CollectionTable]: ...
+  def buffers(self) -> Mapping[str, EventBuffer]:
+    """Named buffers holding the raw rows collected by this program."""
+    ...
+
+  @classmethod
+  def build_tables(cls, raw_data: Mapping[str, pl.DataFrame], collection_id: str) -> list[CollectionTable]:
+    """Builds the collection tables from the raw rows of each buffer returned by `buffers`."""
+    ...
+
+  @classmethod
+  def build_streaming_tables(
+    cls, raw_data: Mapping[str, pl.DataFrame], collection_id: str, joins: dict[str, Any],
+  ) -> list[CollectionTable]:
+    """Builds the collection tables from the rows retired by a flush.
+
+    Programs whose tables join several buffers keep the rows not matched yet in
+    `joins` so they are matched by a later flush of the same collection,
+    everything else is built by `build_tables`.
+    """
+    return cls.build_tables(raw_data, collection_id)
+
+  @classmethod
+  def synthetic_event(cls, table_name: str, seq: int) -> Any:
+    """Event number `seq` of the output `table_name`, as its handler reads it, for the microbenchmarks.
+
+    Events are numbered so rows stay distinct and joins match one to one,
+    programs returning None, like sampling hooks, are not benchmarked.
+    """
+    return None
+
+  @classmethod
+  def raw_data_from_tables(cls, tables: Mapping[str, pl.DataFrame]) -> Mapping[str, pl.DataFrame]:
+    """Raw rows of each buffer recovered from recorded tables, the inverse of `build_tables`.
+
+    `tables` are keyed by table name and have no `collection_id` column, a
+    `ReplayHook` feeds the recovered rows back through `build_tables`.
+    """
+    ...
+
+  def data(self) -> list[CollectionTable]:
+    return self.build_tables(
+      {name: buffer.frame() for name, buffer in self.buffers().items()},
+      self.collection_id,
+    )
+
+  def mark(self, ts_uptime_us: int) -> None:
+    """Called by the poll thread after polling so recent rows can be found by time."""
+    for buffer in self.buffers().values():
+      buffer.mark(ts_uptime_us)
+
+  def event_buffers(self) -> list[EventBuffer]:
+    """Every buffer handlers append to, the program's own and its loss records."""
+    event_buffers = list(self.buffers().values())
+    perf_buffers = getattr(self, "perf_buffers", None)
+    if perf_buffers is not None:
+      event_buffers.append(perf_buffers.losses)
+    return event_buffers
+
+  def own_buffers(self) -> None:
+    """Called by the poll thread before its first poll, see `EventBuffer.own`."""
+    for buffer in self.event_buffers():
+      buffer.own()
+
+  def handoff(self) -> None:
+    """Called by the poll thread between polls to retire rows for the flushing threads."""
+    for buffer in self.event_buffers():
+      buffer.handoff()
+
+  def release_buffers(self) -> None:
+    """Called by the poll thread after its last poll."""
+    for buffer in self.event_buffers():
+      buffer.release()
+
+  def keep_tail(self, ms: int) -> None:
+    """Keeps flushed rows readable by `last_k_ms` and `last_k_data` for windows up to `ms` milliseconds."""
+    for buffer in self.buffers().values():
+      buffer.keep_tail(ms * 1000)
+
+  def last_k_ms(self, ms: int) -> list[CollectionTable]:
+    """Tables of the rows from about the last `ms` milliseconds, flushed ones only as far as `keep_tail` allows."""
+    since_us = time.clock_gettime_ns(time.CLOCK_BOOTTIME) // 1000 - ms * 1000
+    return self._tables_since(since_us)
+
+  def covers_ms(self, ms: int) -> bool:
+    """Whether `last_k_ms` holds every row of the last `ms` milliseconds, it does not early on or past `keep_tail`."""
+    since_us = time.clock_gettime_ns(time.CLOCK_BOOTTIME) // 1000 - ms * 1000
+    return all(
+      (oldest_mark_us := buffer.oldest_mark_us()) is not None and oldest_mark_us <= since_us
+      for buffer in self.buffers().values()
+    )
+
+  def last_k_data(self, k: int) -> list[CollectionTable]:
+    """Tables of the last `k` rows of each table.
+
+    The rows of every buffer are taken over the same time range, the one
+    holding the last `k` rows of each, so joins across buffers still match.
+    """
+    marks_us = [buffer.last_rows_since_us(k) for buffer in self.buffers().values()]
+    since_us = 0
+    if marks_us and None not in marks_us:
+      since_us = min(mark_us for mark_us in marks_us if mark_us is not None)
+    return [
+      type(collection_table).from_df(collection_table.table.tail(k))
+      for collection_table in self._tables_since(since_us)
+    ]
+
+  def _tables_since(self, since_us: int) -> list[CollectionTable]:
+    return self.build_tables(
+      {name: buffer.to_frame(buffer.rows_since(since_us)) for name, buffer in self.buffers().items()},
+      self.collection_id,
+    )
+
+  def last_data(self) -> list[CollectionTable]:
+    return self.last_k_data(1)
 
-  # def last_k_ms(self, ms: int) -> list[CollectionTable]: ...
+  def clear(self):
+    for buffer in self.buffers().values():
+      buffer.clear()
 
-  # def last_k_data(self, k: int) -> list[CollectionTable]:
-  #   return [
-  #     table.limit(k)
-  #     for table in self.data()
-  #   ]
+  def rearm(self, collection_id: str) -> None:
+    """Starts a new collection on the loaded program, anything left from the previous one is dropped."""
+    perf_buffers = getattr(self, "perf_buffers", None)
+    if perf_buffers is not None:
+      # records written after the previous collection drained belong to it
+      perf_buffers.consume()
+      perf_buffers.losses.clear()
+    self.clear()
+    self.joins().clear()
+    # entries stored by entry probes whose return never came would pair with the next collection's events
+    bpf = getattr(self, "bpf", None)
+    if bpf is not None:
+      for map_name in hash_map_names(getattr(self, "bpf_text", "")):
+        if map_name not in self.kept_maps:
+          bpf[map_name].clear()
+    self.collection_id = collection_id
 
-  # def last_data(self) -> list[CollectionTable]:
-  #   return self.last_data(1)
+  def pop_raw_data(self) -> Mapping[str, pl.DataFrame]:
+    """Retires the rows of every buffer without building tables from them."""
+    return {name: buffer.pop_frame() for name, buffer in self.buffers().items()}
 
-  def clear(self): ...
+  def joins(self) -> dict[str, Any]:
+    """Join state carried between the flushes of `pop_data`."""
+    joins = getattr(self, "_joins", None)
+    if joins is None:
+      joins = self._joins = dict[str, Any]()
+    return joins
 
-  def pop_data(self) -> list[CollectionTable]: ...
+  def pop_data(self) -> list[CollectionTable]:
+    return self.build_streaming_tables(self.pop_raw_data(), self.collection_id, self.joins())
@@ -0,0 +1,214 @@
+"""Sizes each hook's perf and ring buffers from the rates its outputs were written at."""
+
+import json
+import math
+import mmap
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from statistics import NormalDist
+from typing import Final, Mapping
+
+from data_collection.bpf_instrumentation.bpf_hook import BPFProgram
+from data_collection.bpf_instrumentation.perf_buffer import (
+  PERF_RECORD_HEADER_BYTES,
+  PerfBuffers,
+)
+from data_collection.bpf_instrumentation.transport import RING_BUFFER_HEADER_BYTES
+
+MIN_PAGE_CNT: Final[int] = 8
+MAX_PAGE_CNT: Final[int] = 16384
+
+
+@dataclass(frozen=True)
+class BufferRate:
+  """Peak rate an output was written at, per CPU for perf buffers and overall for ring buffers."""
+  events_per_sec: float
+  bytes_per_sec: float
+  ring_buffer: bool = False
+
+
+def load_rates(rates_path: Path) -> dict[str, dict[str, BufferRate]]:
+  """Rates saved by earlier collections, keyed by hook and output, empty without any."""
+  if not rates_path.is_file():
+    return {}
+  return {
+    hook_name: {
+      table_name: BufferRate(**rate)
+      for table_name, rate in hook_rates.items()
+    }
+    for hook_name, hook_rates in json.loads(rates_path.read_text()).items()
+  }
+
+
+def save_rates(rates_path: Path, rates: Mapping[str, Mapping[str, BufferRate]]) -> None:
+  """Stores `rates` over the saved rates of the same hooks, other hooks keep theirs."""
+  saved_rates = load_rates(rates_path)
+  saved_rates.update({hook_name: dict(hook_rates) for hook_name, hook_rates in rates.items()})
+  rates_path.parent.mkdir(parents=True, exist_ok=True)
+  rates_path.write_text(json.dumps(
+    {
+      hook_name: {table_name: asdict(rate) for table_name, rate in hook_rates.items()}
+      for hook_name, hook_rates in saved_rates.items()
+    },
+    indent=2,
+  ))
+
+
+def peak_rates(saved_rates: list[Mapping[str, Mapping[str, BufferRate]]], *, cpus: int) -> dict[str, dict[str, BufferRate]]:
+  """Highest rate each output was written at across `saved_rates`, such as those of every benchmark."""
+  peaks = dict[str, dict[str, BufferRate]]()
+  for rates in saved_rates:
+    for hook_name, hook_rates in rates.items():
+      hook_peaks = peaks.setdefault(hook_name, {})
+      for table_name, rate in hook_rates.items():
+        peak = hook_peaks.get(table_name)
+        # perf buffer rates are per CPU, they are compared as the rate of every CPU at once
+        if peak is None or (
+          _transport_rate(rate, ring_buffer=True, cpus=cpus).bytes_per_sec
+          > _transport_rate(peak, ring_buffer=True, cpus=cpus).bytes_per_sec
+        ):
+          hook_peaks[table_name] = rate
+  return peaks
+
+
+class BufferRateMonitor:
+  """Tracks the peak write rate of every output over windows of `window_sec`.
+
+  Sampled by the poll thread, windows shorter than a second mostly measure
+  when polls happened rather than how fast events arrive.
+  """
+
+  def __init__(self, bpf_programs: list[BPFProgram], *, window_sec: float = 1.0):
+    self.bpf_programs = bpf_programs
+    self.window_sec = window_sec
+    self._peaks = dict[tuple[str, str], BufferRate]()
+    self._marks = dict[tuple[str, str, int], tuple[int, int]]()
+    self._window_start = time.monotonic()
+
+  def sample(self) -> None:
+    now = time.monotonic()
+    elapsed_sec = now - self._window_start
+    if elapsed_sec < self.window_sec:
+      return
+    self._window_start = now
+    for bpf_program in self.bpf_programs:
+      perf_buffers = getattr(bpf_program, "perf_buffers", None)
+      if not isinstance(perf_buffers, PerfBuffers):
+        continue
+      ring_buffer = perf_buffers.transport.ring_buffer
+      header_bytes = RING_BUFFER_HEADER_BYTES if ring_buffer else PERF_RECORD_HEADER_BYTES
+      for stats in perf_buffers.stats():
+        mark_key = (bpf_program.name(), stats.buffer, stats.cpu)
+        events_mark, bytes_mark = self._marks.get(mark_key, (0, 0))
+        total_bytes = stats.bytes + stats.events * header_bytes
+        self._marks[mark_key] = (stats.events, total_bytes)
+        rate = BufferRate(
+          events_per_sec=(stats.events - events_mark) / elapsed_sec,
+          bytes_per_sec=(total_bytes - bytes_mark) / elapsed_sec,
+          ring_buffer=ring_buffer,
+        )
+        peak_key = (bpf_program.name(), stats.buffer)
+        peak = self._peaks.get(peak_key)
+        if peak is None or rate.bytes_per_sec > peak.bytes_per_sec:
+          self._peaks[peak_key] = rate
+
+  def rates(self) -> dict[str, dict[str, BufferRate]]:
+    rates = dict[str, dict[str, BufferRate]]()
+    for (hook_name, table_name), rate in self._peaks.items():
+      rates.setdefault(hook_name, {})[table_name] = rate
+    return rates
+
+
+def calibrate_rates(bpf_programs: list[BPFProgram], *, calibration_sec: float) -> dict[str, dict[str, BufferRate]]:
+  """Measures the rates of fresh copies of `bpf_programs` over `calibration_sec`.
+
+  Runs before the benchmark starts, so it only sees the background rate of
+  the host, sizes from these rates are a floor for the hooks' own sizes
+  rather than a replacement for them.
+  """
+  calibration_programs = list[BPFProgram]()
+  for bpf_program in bpf_programs:
+    calibration_program = type(bpf_program)()
+    calibration_program.transport = bpf_program.transport
+    calibration_programs.append(calibration_program)
+  for calibration_program in calibration_programs:
+    calibration_program.load("calibration")
+  monitor = BufferRateMonitor(calibration_programs, window_sec=min(1.0, calibration_sec))
+  stop_at = time.monotonic() + calibration_sec
+  try:
+    while time.monotonic() < stop_at:
+      for calibration_program in calibration_programs:
+        calibration_program.poll()
+        calibration_program.clear()
+      monitor.sample()
+  finally:
+    for calibration_program in calibration_programs:
+      calibration_program.close()
+  return monitor.rates()
+
+
+def _page_cnt(rate: BufferRate, *, poll_interval_sec: float, z_score: float) -> int:
+  if rate.events_per_sec <= 0:
+    return MIN_PAGE_CNT
+  # arrivals between two polls are taken as poisson, sized so exceeding the
+  # buffer is as likely as the requested loss probability
+  mean_events = rate.events_per_sec * poll_interval_sec
+  events = math.ceil(mean_events + z_score * math.sqrt(mean_events)) + 1
+  record_bytes = rate.bytes_per_sec / rate.events_per_sec
+  pages = math.ceil(events * record_bytes / mmap.PAGESIZE)
+  page_cnt = 1 << max(pages - 1, 0).bit_length()
+  return min(max(page_cnt, MIN_PAGE_CNT), MAX_PAGE_CNT)
+
+
+def _transport_rate(rate: BufferRate, *, ring_buffer: bool, cpus: int) -> BufferRate:
+  if rate.ring_buffer == ring_buffer:
+    return rate
+  if ring_buffer:
+    # the peak of a single CPU, every CPU may write to the ring at that rate
+    return BufferRate(rate.events_per_sec * cpus, rate.bytes_per_sec * cpus, ring_buffer=True)
+  # the whole ring's rate, any CPU's buffer may take all of it
+  return BufferRate(rate.events_per_sec, rate.bytes_per_sec, ring_buffer=False)
+
+
+def size_buffers(
+  rates: Mapping[str, Mapping[str, BufferRate]],
+  *,
+  ring_buffers: Mapping[str, bool],
+  poll_interval_sec: float,
+  loss_probability: float,
+  memory_cap_bytes: int,
+  cpus: int,
+) -> dict[str, dict[str, int]]:
+  """Page counts per hook and output, halving the largest buffers until all fit in `memory_cap_bytes`.
+
+  `ring_buffers` tells whether each hook's transport is now a ring buffer,
+  rates saved under the other transport are converted to it. Perf buffers
+  are allocated on every CPU, so they count `cpus` times against the cap.
+  """
+  z_score = NormalDist().inv_cdf(1 - loss_probability)
+  sizes = {
+    (hook_name, table_name): (
+      _page_cnt(
+        _transport_rate(rate, ring_buffer=ring_buffers.get(hook_name, False), cpus=cpus),
+        poll_interval_sec=poll_interval_sec,
+        z_score=z_score,
+      ),
+      1 if ring_buffers.get(hook_name, False) else cpus,
+    )
+    for hook_name, hook_rates in rates.items()
+    for table_name, rate in hook_rates.items()
+  }
+
+  def _bytes(page_cnt: int, copies: int) -> int:
+    return page_cnt * copies * mmap.PAGESIZE
+
+  while sum(_bytes(*size) for size in sizes.values()) > memory_cap_bytes:
+    key, (page_cnt, copies) = max(sizes.items(), key=lambda size: _bytes(*size[1]))
+    if page_cnt <= MIN_PAGE_CNT:
+      break
+    sizes[key] = (page_cnt // 2, copies)
+  page_cnts = dict[str, dict[str, int]]()
+  for (hook_name, table_name), (page_cnt, _) in sizes.items():
+    page_cnts.setdefault(hook_name, {})[table_name] = page_cnt
+  return page_cnts
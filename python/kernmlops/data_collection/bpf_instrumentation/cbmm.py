@@ -1,9 +1,12 @@
 from dataclasses import dataclass
 from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Mapping
 
 import polars as pl
-from bcc import BPF
 from data_collection.bpf_instrumentation.bpf_hook import POLL_TIMEOUT_MS, BPFProgram
+from data_collection.bpf_instrumentation.event_buffer import EventBuffer
+from data_collection.bpf_instrumentation.perf_buffer import PerfBuffers
 from data_schema import CollectionTable
 from data_schema.generic_table import (
     CBMMEagerDataTable,
@@ -38,12 +41,12 @@ class CBMMBPFHook(BPFProgram):
     def __init__(self):
         self.is_support_raw_tp = True #  BPF.support_raw_tracepoint()
         self.bpf_text = open(Path(__file__).parent / "bpf/cbmm.bpf.c", "r").read()
-        self.cbmm_eager = list[CBMMEagerTracingRuntimeData]()
-        self.cbmm_prezero = list[CBMMPrezeroingTracingRuntimeData]()
+        self.cbmm_eager = EventBuffer(CBMMEagerTracingRuntimeData)
+        self.cbmm_prezero = EventBuffer(CBMMPrezeroingTracingRuntimeData)
 
     def load(self, collection_id: str):
         self.collection_id = collection_id
-        self.bpf = BPF(text = self.bpf_text)
+        self.bpf = self.compiled_bpf()
         self.bpf.attach_kprobe(event=b"mm_estimate_changes", fn_name=b"kprobe__mm_estimate_changes")
         self.bpf.attach_kretprobe(event=b"mm_decide", fn_name=b"kretprobe__mm_decide")
         self.bpf.attach_kprobe(event=b"mm_estimate_eager_page_cost_benefit", fn_name=b"kprobe__mm_estimate_eager_page_cost_benefit")
@@ -54,35 +57,53 @@ class CBMMBPFHook(BPFProgram):
         #self.bpf.attach_kprobe(event=b"mm_estimate_async_prezeroing_lock_contention_cost",
         #   fn_name=b"kprobe__mm_estimate_async_prezeroing_lock_contention_cost")
         self.bpf.attach_kretprobe(event=b"mm_estimated_prezeroed_used", fn_name=b"kretprobe__mm_estimated_prezeroed_used")
-        self.bpf["cbmm_eager"].open_perf_buffer(self._cbmm_eager_eh, page_cnt=64)
-        self.bpf["cbmm_prezero"].open_perf_buffer(self._cbmm_prezero_eh, page_cnt=64)
+        self.open_buffers()
+
+    def open_buffers(self):
+        self.perf_buffers = PerfBuffers(self.bpf, self.name(), self.transport)
+        self.perf_buffers.open("cbmm_eager", self._cbmm_eager_eh, page_cnt=64)
+        self.perf_buffers.open("cbmm_prezero", self._cbmm_prezero_eh, page_cnt=64)
 
     def poll(self):
-        self.bpf.perf_buffer_poll(timeout=POLL_TIMEOUT_MS)
+        self.perf_buffers.poll(timeout_ms=POLL_TIMEOUT_MS)
 
     def close(self):
         self.bpf.cleanup()
 
-    def data(self) -> list[CollectionTable]:
+    def buffers(self) -> Mapping[str, EventBuffer]:
+        return {
+            "cbmm_eager": self.cbmm_eager,
+            "cbmm_prezero": self.cbmm_prezero,
+        }
+
+    @classmethod
+    def build_tables(cls, raw_data: Mapping[str, pl.DataFrame], collection_id: str) -> list[CollectionTable]:
         return [
             CBMMPrezeroingDataTable.from_df_id(
-                pl.DataFrame(self.cbmm_prezero),
-                collection_id=self.collection_id,
+                raw_data["cbmm_prezero"],
+                collection_id=collection_id,
             ),
             CBMMEagerDataTable.from_df_id(
-                pl.DataFrame(self.cbmm_eager),
-                collection_id=self.collection_id,
+                raw_data["cbmm_eager"],
+                collection_id=collection_id,
             ),
         ]
 
-    def pop_data(self) -> list[CollectionTable]:
-        tables = self.data()
-        self.clear()
-        return tables
+    @classmethod
+    def synthetic_event(cls, table_name: str, seq: int) -> Any:
+        if table_name == "cbmm_eager":
+            return SimpleNamespace(freq_cycles=seq, greatest_range_benefit=seq, decision=seq & 1)
+        return SimpleNamespace(
+            load=seq, daemon_cost=seq, prezero_n=seq, nfree=seq, critical_section_cost=seq,
+            zeroing_per_page_cost=seq, recent_used=seq, decision=seq & 1,
+        )
 
-    def clear(self):
-        self.cbmm_eager.clear()
-        self.cbmm_prezero.clear()
+    @classmethod
+    def raw_data_from_tables(cls, tables: Mapping[str, pl.DataFrame]) -> Mapping[str, pl.DataFrame]:
+        return {
+            "cbmm_prezero": tables[CBMMPrezeroingDataTable.name()],
+            "cbmm_eager": tables[CBMMEagerDataTable.name()],
+        }
 
     def _cbmm_eager_eh(self, cpu, cbmm_eager_paging_inputs, size):
         event = self.bpf["cbmm_eager"].event(cbmm_eager_paging_inputs)
@@ -1,10 +1,12 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
 from pathlib import Path
-from typing import cast
+from types import SimpleNamespace
+from typing import Any, Mapping, cast
 
 import polars as pl
-from bcc import BPF
 from data_collection.bpf_instrumentation.bpf_hook import POLL_TIMEOUT_MS, BPFProgram
+from data_collection.bpf_instrumentation.event_buffer import EventBuffer
+from data_collection.bpf_instrumentation.perf_buffer import PerfBuffers
 from data_schema import CollectionTable
 from data_schema.generic_table import (
   CollapseHugePageDataTableRaw,
@@ -13,6 +15,7 @@ from data_schema.generic_table import (
 )
 from data_schema.huge_pages import (
   CollapseHugePageDataTable,
+  CollapseHugePageJoin,
 )
 
 
@@ -62,57 +65,122 @@ class CollapseHugePageBPFHook(BPFProgram):
   def __init__(self):
     self.is_support_raw_tp = True #  BPF.support_raw_tracepoint()
     self.bpf_text = open(Path(__file__).parent / "bpf/collapse_huge_page.bpf.c", "r").read()
-    self.collapse_huge_pages = list[CollapseHugePageRuntimeData]()
-    self.trace_mm_collapse_huge_pages = list[TraceMMCollapseHugePageRuntimeData]()
-    self.trace_mm_khugepaged_scan_pmds = list[TraceMMKhugepagedScanPMDRuntimeData]()
+    self.collapse_huge_pages = EventBuffer(CollapseHugePageRuntimeData)
+    self.trace_mm_collapse_huge_pages = EventBuffer(TraceMMCollapseHugePageRuntimeData)
+    self.trace_mm_khugepaged_scan_pmds = EventBuffer(TraceMMKhugepagedScanPMDRuntimeData)
 
   def load(self, collection_id: str):
     self.collection_id = collection_id
-    self.bpf = BPF(text = self.bpf_text)
+    self.bpf = self.compiled_bpf()
     #self.bpf.attach_raw_tracepoint(tp=b"mm_collapse_huge_page", fn_name=b"mm_collapse_huge_page")
     self.bpf.attach_kprobe(event=b"collapse_huge_page", fn_name=b"kprobe_collapse_huge_page")
-    self.bpf["collapse_huge_pages"].open_perf_buffer(self._collapse_huge_pages_eh, page_cnt=64)
-    self.bpf["trace_mm_collapse_huge_pages"].open_perf_buffer(self._trace_huge_pages_eh, page_cnt=64)
-    self.bpf["trace_mm_khugepaged_scan_pmds"].open_perf_buffer(self._trace_khugepaged_scan_eh, page_cnt=64)
+    self.open_buffers()
+
+  def open_buffers(self):
+    self.perf_buffers = PerfBuffers(self.bpf, self.name(), self.transport)
+    self.perf_buffers.open("collapse_huge_pages", self._collapse_huge_pages_eh, page_cnt=64)
+    self.perf_buffers.open("trace_mm_collapse_huge_pages", self._trace_huge_pages_eh, page_cnt=64)
+    self.perf_buffers.open("trace_mm_khugepaged_scan_pmds", self._trace_khugepaged_scan_eh, page_cnt=64)
 
   def poll(self):
-    self.bpf.perf_buffer_poll(timeout=POLL_TIMEOUT_MS)
+    self.perf_buffers.poll(timeout_ms=POLL_TIMEOUT_MS)
 
   def close(self):
     self.bpf.cleanup()
 
-  def data(self) -> list[CollectionTable]:
-    if len(self.collapse_huge_pages) == 0 or len(self.trace_mm_collapse_huge_pages) == 0 or len(self.trace_mm_khugepaged_scan_pmds) == 0:
+  def buffers(self) -> Mapping[str, EventBuffer]:
+    return {
+      "collapse_huge_pages": self.collapse_huge_pages,
+      "trace_mm_collapse_huge_pages": self.trace_mm_collapse_huge_pages,
+      "trace_mm_khugepaged_scan_pmds": self.trace_mm_khugepaged_scan_pmds,
+    }
+
+  @classmethod
+  def build_tables(cls, raw_data: Mapping[str, pl.DataFrame], collection_id: str) -> list[CollectionTable]:
+    if any(raw_df.is_empty() for raw_df in raw_data.values()):
         return []
     return [
             CollapseHugePageDataTable.from_tables(
               collapse_table=cast(
                 CollapseHugePageDataTableRaw,
                 CollapseHugePageDataTableRaw.from_df_id(
-                  pl.DataFrame(self.collapse_huge_pages),
-                  collection_id = self.collection_id,),
+                  raw_data["collapse_huge_pages"],
+                  collection_id = collection_id,),
               ),
               trace_mm_table=cast(
                 TraceMMCollapseHugePageDataTable,
                 TraceMMCollapseHugePageDataTable.from_df_id(
-                  pl.DataFrame(self.trace_mm_collapse_huge_pages),
-                  collection_id = self.collection_id,),
+                  raw_data["trace_mm_collapse_huge_pages"],
+                  collection_id = collection_id,),
               ),
             ),
             TraceMMKhugepagedScanPMDDataTable.from_df_id(
-                pl.DataFrame(self.trace_mm_khugepaged_scan_pmds),
-                collection_id = self.collection_id,),
+                raw_data["trace_mm_khugepaged_scan_pmds"],
+                collection_id = collection_id,),
         ]
 
-  def clear(self):
-    self.collapse_huge_pages.clear()
-    self.trace_mm_collapse_huge_pages.clear()
-    self.trace_mm_khugepaged_scan_pmds.clear()
+  @classmethod
+  def build_streaming_tables(
+    cls, raw_data: Mapping[str, pl.DataFrame], collection_id: str, joins: dict[str, Any],
+  ) -> list[CollectionTable]:
+    collapse_huge_page_join = joins.setdefault(CollapseHugePageDataTable.name(), CollapseHugePageJoin())
+    # unmatched rows are kept by the join even when nothing is paired this flush
+    tables = [
+      collapse_huge_page_join.join(
+        collapse_table=cast(
+          CollapseHugePageDataTableRaw,
+          CollapseHugePageDataTableRaw.from_df_id(
+            raw_data["collapse_huge_pages"],
+            collection_id=collection_id,
+          ),
+        ),
+        trace_mm_table=cast(
+          TraceMMCollapseHugePageDataTable,
+          TraceMMCollapseHugePageDataTable.from_df_id(
+            raw_data["trace_mm_collapse_huge_pages"],
+            collection_id=collection_id,
+          ),
+        ),
+      ),
+      TraceMMKhugepagedScanPMDDataTable.from_df_id(
+        raw_data["trace_mm_khugepaged_scan_pmds"],
+        collection_id=collection_id,
+      ),
+    ]
+    return [table for table in tables if not table.table.is_empty()]
 
-  def pop_data(self) -> list[CollectionTable]:
-    quanta_tables = self.data()
-    self.clear()
-    return quanta_tables
+  @classmethod
+  def synthetic_event(cls, table_name: str, seq: int) -> Any:
+    # the collapse and its tracepoint share a task, the tracepoint inside the collapse
+    if table_name == "collapse_huge_pages":
+      return SimpleNamespace(
+        pid=seq, tgid=seq, start_ts_ns=seq * 1000, end_ts_ns=seq * 1000 + 500, mm=1,
+        address=0x200000, referenced=1, unmapped=0, cc=0,
+      )
+    if table_name == "trace_mm_collapse_huge_pages":
+      return SimpleNamespace(
+        pid=seq, tgid=seq, start_ts_ns=seq * 1000 + 1, end_ts_ns=seq * 1000 + 499, mm=1, isolated=True, status=1,
+      )
+    return SimpleNamespace(
+      pid=seq, tgid=seq, start_ts_ns=seq * 1000, end_ts_ns=seq * 1000 + 500, mm=1, page=0x200000,
+      writeable=1, referenced=1, none_or_zero=0, status=1, unmapped=False,
+    )
+
+  @classmethod
+  def raw_data_from_tables(cls, tables: Mapping[str, pl.DataFrame]) -> Mapping[str, pl.DataFrame]:
+    # the joined table has one row per collapse, end_ts_ns is not recorded and dropped by the join anyway
+    collapse_huge_pages = tables[CollapseHugePageDataTable.name()].with_columns(
+      pl.col("start_ts_ns").alias("end_ts_ns"),
+    )
+    return {
+      "collapse_huge_pages": collapse_huge_pages.select(
+        [field.name for field in fields(CollapseHugePageRuntimeData)]
+      ),
+      "trace_mm_collapse_huge_pages": collapse_huge_pages.select(
+        [field.name for field in fields(TraceMMCollapseHugePageRuntimeData)]
+      ),
+      "trace_mm_khugepaged_scan_pmds": tables[TraceMMKhugepagedScanPMDDataTable.name()],
+    }
 
   def _trace_khugepaged_scan_eh(self, cpu, trace_mm_khugepaged_scan_pmd_struct, size):
       event = self.bpf["trace_mm_khugepaged_scan_pmds"].event(trace_mm_khugepaged_scan_pmd_struct)
@@ -0,0 +1,310 @@
+"""Worker processes that consume pinned perf and ring buffers outside the collector's GIL."""
+
+import ctypes as ct
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+import traceback
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Final
+
+import polars as pl
+from bcc.libbcc import _LOST_CB_TYPE, _RAW_CB_TYPE, _RINGBUF_CB_TYPE, lib
+from bcc.utils import get_online_cpus
+from data_collection.bpf_instrumentation.bpf_hook import POLL_TIMEOUT_MS, BPFProgram
+from data_collection.bpf_instrumentation.event_buffer import EventBuffer
+from data_collection.bpf_instrumentation.perf_buffer import LostSampleData, PerfBuffers
+from data_collection.bpf_instrumentation.raw_capture import RawCaptureDecoder
+from data_collection.bpf_instrumentation.transport import (
+  PinnedBuffer,
+  record_cpu_reader,
+)
+from data_schema import CollectionLossTable, CollectionTable
+
+# compiling nothing, a worker only imports the hooks and opens pinned maps
+CONSUMER_ATTACH_TIMEOUT_SEC: Final[float] = 60.0
+
+
+@dataclass(frozen=True)
+class ConsumerAssignment:
+  """The pinned outputs of one hook a worker reads, perf buffers only on `cpus`."""
+  hook: str
+  buffers: tuple[PinnedBuffer, ...]
+  cpus: tuple[int, ...]
+
+
+def _bpf_obj_get(path: Path) -> int:
+  lib.bpf_obj_get.restype = ct.c_int
+  lib.bpf_obj_get.argtypes = [ct.c_char_p]
+  map_fd = lib.bpf_obj_get(str(path).encode())
+  if map_fd < 0:
+    raise OSError(ct.get_errno(), f"could not open pinned map {path}")
+  return map_fd
+
+
+class _Consumer:
+  """Opens a worker's share of the pinned outputs and feeds records to the hooks' own handlers."""
+
+  def __init__(self, worker: int, shard_dir: Path):
+    self.worker = worker
+    self.shard_dir = shard_dir
+    self.hooks = list[BPFProgram]()
+    self.losses = EventBuffer(LostSampleData)
+    self._readers = list[int]()
+    self._reader_array = (ct.c_void_p * 0)()
+    self._ring_buffers = list[int]()
+    # ctypes callbacks are freed with their python objects, bcc calls them until the reader is freed
+    self._callbacks = list[Any]()
+    self._map_fds = list[int]()
+    self._shard_num = 0
+
+  def attach(self, hook: BPFProgram, assignment: ConsumerAssignment) -> None:
+    decoder = RawCaptureDecoder({
+      "buffers": [
+        {"name": buffer.table_name, "event": buffer.event}
+        for buffer in assignment.buffers
+      ],
+    })
+    # handlers look up events through self.bpf, as in the collector
+    hook.bpf = decoder  # pyright: ignore [reportAttributeAccessIssue]
+    hook.open_buffers()
+    self.hooks.append(hook)
+    for buffer in assignment.buffers:
+      handler = decoder.handler(buffer.table_name)
+      if handler is None:
+        continue
+      map_fd = _bpf_obj_get(buffer.path)
+      self._map_fds.append(map_fd)
+      if buffer.ring_buffer:
+        self._open_ring_buffer(map_fd, handler, decoder[buffer.table_name].event_type)
+        continue
+      for cpu in assignment.cpus:
+        self._open_perf_buffer(map_fd, buffer, cpu, handler)
+    self._reader_array = (ct.c_void_p * len(self._readers))(*self._readers)
+
+  def poll(self, timeout_ms: int) -> None:
+    if self._readers:
+      lib.perf_reader_poll(len(self._readers), self._reader_array, timeout_ms)
+    for ring_buffer in self._ring_buffers:
+      # perf readers already waited, rings are only waited on by workers without any
+      if self._readers:
+        lib.bpf_consume_ringbuf(ring_buffer)
+      else:
+        lib.bpf_poll_ringbuf(ring_buffer, timeout_ms)
+
+  def drain(self) -> None:
+    if self._readers:
+      lib.perf_reader_consume(len(self._readers), self._reader_array)
+    for ring_buffer in self._ring_buffers:
+      lib.bpf_consume_ringbuf(ring_buffer)
+
+  def flush(self) -> None:
+    """Writes every hook's raw rows to Arrow shards, merged once the collection ends."""
+    for hook in self.hooks:
+      for buffer_name, raw_df in hook.pop_raw_data().items():
+        if not raw_df.is_empty():
+          raw_df.write_ipc(self._shard_path(f"{hook.name()}.{buffer_name}"), compression="lz4")
+    losses = self.losses.pop_frame()
+    if not losses.is_empty():
+      losses.write_ipc(self._shard_path(CollectionLossTable.name()), compression="lz4")
+    self._shard_num += 1
+
+  def close(self) -> None:
+    for reader in self._readers:
+      lib.perf_reader_free(reader)
+    for ring_buffer in self._ring_buffers:
+      lib.bpf_free_ringbuf(ring_buffer)
+    for map_fd in self._map_fds:
+      os.close(map_fd)
+
+  def _shard_path(self, name: str) -> Path:
+    return self.shard_dir / f"{name}.{self.worker}.{self._shard_num}.arrow"
+
+  def _open_perf_buffer(self, map_fd: int, buffer: PinnedBuffer, cpu: int, handler: Callable) -> None:
+    def _raw_cb(_, data, size):
+      handler(cpu, data, size)
+
+    def _lost_cb(_, lost):
+      self.losses.append(LostSampleData(
+        hook=buffer.hook,
+        buffer=buffer.table_name,
+        cpu=cpu,
+        ts_uptime_us=int(time.clock_gettime_ns(time.CLOCK_BOOTTIME) / 1000),
+        lost_samples=lost,
+      ))
+    raw_fn, lost_fn = _RAW_CB_TYPE(_raw_cb), _LOST_CB_TYPE(_lost_cb)
+    reader = lib.bpf_open_perf_buffer(raw_fn, lost_fn, None, -1, cpu, buffer.page_cnt)
+    if not reader:
+      raise OSError(ct.get_errno(), f"could not open perf buffer {buffer.table_name} on cpu {cpu}")
+    # same as bcc does for its own readers, the array maps each cpu to its reader's fd
+    reader_fd = lib.perf_reader_fd(reader)
+    lib.bpf_update_elem(map_fd, ct.byref(ct.c_int(cpu)), ct.byref(ct.c_int(reader_fd)), 0)
+    self._callbacks.extend([raw_fn, lost_fn])
+    self._readers.append(reader)
+
+  def _open_ring_buffer(self, map_fd: int, handler: Callable, event_type: Any) -> None:
+    record_cpu = record_cpu_reader(event_type)
+
+    def _ring_buffer_cb(_, data, size):
+      handler(record_cpu(data), data, size)
+      return 0
+    ring_buffer_fn = _RINGBUF_CB_TYPE(_ring_buffer_cb)
+    ring_buffer = lib.bpf_new_ringbuf(map_fd, ring_buffer_fn, None)
+    if not ring_buffer:
+      raise OSError(ct.get_errno(), "could not open ring buffer")
+    self._callbacks.append(ring_buffer_fn)
+    self._ring_buffers.append(ring_buffer)
+
+
+def _consumer_main(
+  worker: int,
+  assignments: list[ConsumerAssignment],
+  shard_dir: Path,
+  ready,
+  stop_event,
+  flush_interval_sec: float,
+) -> None:
+  from data_collection.bpf_instrumentation import all_hooks
+
+  consumer = _Consumer(worker, shard_dir)
+  try:
+    try:
+      for assignment in assignments:
+        consumer.attach(all_hooks[assignment.hook](), assignment)
+    except Exception:
+      # the collector is waiting for every worker before it starts the benchmark
+      ready.abort()
+      raise
+    ready.wait()
+    flushed_at = time.monotonic()
+    while not stop_event.is_set():
+      consumer.poll(POLL_TIMEOUT_MS)
+      if time.monotonic() - flushed_at >= flush_interval_sec:
+        consumer.flush()
+        flushed_at = time.monotonic()
+    consumer.drain()
+    consumer.flush()
+  except Exception:
+    print(traceback.format_exc())
+  finally:
+    consumer.close()
+
+
+class ConsumerPool:
+  """Consumes the pinned outputs of every hook in `processes` worker processes.
+
+  Perf buffers are split by CPU so every worker reads each hook's buffers for
+  its own CPUs, ring buffers are shared by all CPUs and so are split by hook.
+  Workers decode records with the hooks' handlers and write the raw rows as
+  Arrow shards, `merge` builds the hook tables from them once collection ends
+  so joins see the rows of every CPU. `start` returns once every worker
+  opened its outputs, so no record submitted by the benchmark is missed.
+  """
+
+  def __init__(
+    self,
+    bpf_programs: list[BPFProgram],
+    *,
+    processes: int,
+    shard_dir: Path,
+    flush_interval_sec: float,
+  ):
+    self.bpf_programs = bpf_programs
+    self.shard_dir = shard_dir
+    self.shard_dir.mkdir(parents=True, exist_ok=True)
+    self.lost_samples = 0
+    self._pinned = list[PinnedBuffer]()
+    for bpf_program in bpf_programs:
+      perf_buffers = getattr(bpf_program, "perf_buffers", None)
+      if isinstance(perf_buffers, PerfBuffers):
+        self._pinned.extend(perf_buffers.pinned)
+    # polars is not fork safe and the collector holds BPF file descriptors
+    context = multiprocessing.get_context("spawn")
+    self._stop_event = context.Event()
+    worker_assignments = [
+      (worker, assignments)
+      for worker, assignments in enumerate(self._assign(processes))
+      if assignments
+    ]
+    # the collector waits along with the workers
+    self._ready = context.Barrier(len(worker_assignments) + 1)
+    self._processes = [
+      context.Process(
+        target=_consumer_main,
+        args=(worker, assignments, shard_dir, self._ready, self._stop_event, flush_interval_sec),
+        name=f"kernmlops-consumer-{worker}",
+        daemon=True,
+      )
+      for worker, assignments in worker_assignments
+    ]
+
+  def start(self, timeout_sec: float = CONSUMER_ATTACH_TIMEOUT_SEC) -> None:
+    """Starts the workers and waits until all of them opened their outputs, closing the pool if one failed."""
+    for process in self._processes:
+      process.start()
+    try:
+      self._ready.wait(timeout_sec)
+    except threading.BrokenBarrierError:
+      self.close()
+      raise RuntimeError("a consumer process failed to open its buffers, see its traceback above") from None
+
+  def close(self) -> None:
+    """Stops the workers after they drained their buffers and unpins every output."""
+    self._stop_event.set()
+    for process in self._processes:
+      process.join()
+    # outputs are pinned at {pin_dir}/{hook}/{table}, the pin_dir of the collection goes with them
+    for pin_dir in {pinned_buffer.path.parent.parent for pinned_buffer in self._pinned}:
+      shutil.rmtree(pin_dir, ignore_errors=True)
+
+  def merge(self, collection_id: str) -> list[CollectionTable]:
+    """Builds every hook's tables from the shards the workers wrote, then removes the shards."""
+    tables = list[CollectionTable]()
+    for bpf_program in self.bpf_programs:
+      raw_data = {
+        buffer_name: self._read_shards(f"{bpf_program.name()}.{buffer_name}", buffer.pop_frame())
+        for buffer_name, buffer in bpf_program.buffers().items()
+      }
+      tables.extend(bpf_program.build_tables(raw_data, collection_id))
+    losses = self._read_shards(CollectionLossTable.name(), pl.DataFrame())
+    if not losses.is_empty():
+      self.lost_samples = int(losses["lost_samples"].sum())
+      tables.append(CollectionLossTable.from_df_id(losses, collection_id=collection_id))
+    if not any(self.shard_dir.iterdir()):
+      self.shard_dir.rmdir()
+    return tables
+
+  def _assign(self, processes: int) -> list[list[ConsumerAssignment]]:
+    cpus = get_online_cpus()
+    assignments = [list[ConsumerAssignment]() for _ in range(processes)]
+    hooks = list(dict.fromkeys(pinned_buffer.hook for pinned_buffer in self._pinned))
+    for hook_num, hook in enumerate(hooks):
+      hook_buffers = [pinned_buffer for pinned_buffer in self._pinned if pinned_buffer.hook == hook]
+      perf_buffers = tuple(buffer for buffer in hook_buffers if not buffer.ring_buffer)
+      ring_buffers = tuple(buffer for buffer in hook_buffers if buffer.ring_buffer)
+      for worker in range(processes):
+        worker_cpus = tuple(cpus[worker::processes])
+        worker_buffers = perf_buffers if worker_cpus else ()
+        if worker == hook_num % processes:
+          worker_buffers += ring_buffers
+        if worker_buffers:
+          assignments[worker].append(ConsumerAssignment(hook=hook, buffers=worker_buffers, cpus=worker_cpus))
+    return assignments
+
+  def _read_shards(self, name: str, frame: pl.DataFrame) -> pl.DataFrame:
+    # shards are named {name}.{worker}.{shard_num}.arrow, read them flush by flush
+    shard_paths = sorted(
+      self.shard_dir.glob(f"{name}.*.*.arrow"),
+      key=lambda shard_path: tuple(int(num) for num in reversed(shard_path.name.split(".")[-3:-1])),
+    )
+    if not shard_paths:
+      return frame
+    shards = [pl.read_ipc(shard_path) for shard_path in shard_paths]
+    for shard_path in shard_paths:
+      shard_path.unlink()
+    if frame.is_empty():
+      return pl.concat(shards, how="diagonal_relaxed")
+    return pl.concat(shards + [frame], how="diagonal_relaxed")
@@ -0,0 +1,303 @@
+"""Double buffered storage for the rows produced by hook event handlers."""
+
+import os
+import sys
+import tempfile
+from bisect import bisect_right
+from dataclasses import fields, is_dataclass
+from pathlib import Path
+from queue import SimpleQueue
+from threading import Lock, get_ident
+from typing import Final
+
+import polars as pl
+
+# rows sampled into the running estimate of a buffer's row size, later samples weigh at least this much
+ROW_BYTES_SAMPLES: Final[int] = 64
+
+
+def _row_bytes(row) -> int:
+  """Rough size of a row including the objects it references."""
+  if isinstance(row, dict):
+    values = row.values()
+  elif isinstance(row, tuple):
+    values = row
+  else:
+    values = getattr(row, "__dict__", {}).values()
+  return (
+    sys.getsizeof(row)
+    + sys.getsizeof(getattr(row, "__dict__", ()))
+    + sum(sys.getsizeof(value) for value in values)
+  )
+
+
+class EventBuffer[T]:
+  """Rows appended by the poll thread and handed off to the flusher by swapping lists.
+
+  Event handlers call `append` or `extend` on the active list, `swap` replaces the
+  active list with a fresh one and returns the retired list to build tables from.
+  A handler looks up `append` before building its row, so swapping while a
+  handler runs would retire the list it is about to append to. While a poll
+  thread `own`s the buffer, other threads' swaps are therefore only requested
+  and the poll thread swaps between polls, in `handoff`, when no handler runs.
+
+  To bound memory the poll thread can `retire` the active rows without
+  waiting for a flush, another thread then spills them to Arrow files in
+  `spill_retired`. Popping a frame reads spilled rows back ahead of the rows
+  still in memory.
+
+  The poll thread `mark`s how many rows had arrived at each poll, so the rows
+  of a recent time window are found by bisecting the marks and slicing only
+  the window off the active list, to within one poll. Rows retired by a swap
+  stay readable for the longest window asked for through `keep_tail`, so
+  windows reach back past the last flush.
+  """
+
+  def __init__(self, row_type: type[T] | None = None, schema: pl.Schema | None = None):
+    self.row_type = row_type
+    # rows appended as tuples in the order of `schema`
+    self.schema = schema
+    self._active = list[T]()
+    self._marks_us = list[int]()
+    self._marked_rows = list[int]()
+    # retired rows of the last `tail_us` with their marks, kept for windows
+    self.tail_us = 0
+    self._tail = list[T]()
+    self._tail_marks_us = list[int]()
+    self._tail_marked_rows = list[int]()
+    # readers take the tail and the active rows with their marks in one read, swaps replace it whole
+    self._window = self._window_lists()
+    self._spilled = list[Path]()
+    # retired by the poll thread and not spilled yet, oldest first
+    self._retired = list[list[T]]()
+    self._row_bytes = 0.0
+    self._row_bytes_samples = 0
+    # swaps requested by other threads while a poll thread owns the buffer
+    self._poll_thread: int | None = None
+    self._swap_lock = Lock()
+    self._swaps_requested = 0
+    self._handoffs = SimpleQueue[tuple[list[Path], list[T]]]()
+    # bound directly to the active list so handlers append without a python level call
+    self.append = self._active.append
+    self.extend = self._active.extend
+
+  def __len__(self) -> int:
+    return len(self._active)
+
+  def estimated_bytes(self) -> int:
+    """Memory held by the active rows, estimated from a running average over the newest row of each call."""
+    active = self._active
+    if not active:
+      return 0
+    self._row_bytes_samples = min(self._row_bytes_samples + 1, ROW_BYTES_SAMPLES)
+    # the list pointer to each row is part of the cost
+    self._row_bytes += (_row_bytes(active[-1]) + 8 - self._row_bytes) / self._row_bytes_samples
+    return int(len(active) * self._row_bytes)
+
+  def keep_tail(self, window_us: int) -> None:
+    """Keeps retired rows around long enough for windows of `window_us`."""
+    self.tail_us = max(self.tail_us, window_us)
+
+  def mark(self, ts_uptime_us: int) -> None:
+    """Records that the rows so far arrived by `ts_uptime_us`."""
+    rows = len(self._active)
+    if self._marked_rows and self._marked_rows[-1] == rows:
+      return
+    self._marks_us.append(ts_uptime_us)
+    self._marked_rows.append(rows)
+
+  def own(self) -> None:
+    """Makes the calling thread the poll thread, other threads' swaps wait for its `handoff`."""
+    with self._swap_lock:
+      self._poll_thread = get_ident()
+
+  def release(self) -> None:
+    """Called by the poll thread once it stopped polling, any thread swaps directly again."""
+    with self._swap_lock:
+      self._poll_thread = None
+      self._serve_swaps()
+
+  def handoff(self) -> None:
+    """Called by the poll thread between polls, swaps for the threads that asked to."""
+    if self._swaps_requested == 0:
+      return
+    with self._swap_lock:
+      self._serve_swaps()
+
+  def swap(self) -> tuple[list[Path], list[T]]:
+    """Retires every row, new rows go into a fresh list.
+
+    Returns the spill files and the rows still in memory, both oldest first.
+    Waits for the poll thread's next `handoff` while it owns the buffer.
+    """
+    with self._swap_lock:
+      if self._poll_thread is None or self._poll_thread == get_ident():
+        return self._swap()
+      self._swaps_requested += 1
+    return self._handoffs.get()
+
+  def _serve_swaps(self) -> None:
+    for _ in range(self._swaps_requested):
+      self._handoffs.put(self._swap())
+    self._swaps_requested = 0
+
+  def _swap(self) -> tuple[list[Path], list[T]]:
+    # called holding the lock, rows retired for spilling are older than the active rows
+    rows = self._replace_active()
+    if self._retired:
+      rows = [row for retired in self._retired for row in retired] + rows
+    spilled, self._spilled, self._retired = self._spilled, list[Path](), list[list[T]]()
+    return spilled, rows
+
+  def _replace_active(self, *, keep_tail: bool = True) -> list[T]:
+    fresh = list[T]()
+    retired = self._active
+    if not keep_tail:
+      self._tail, self._tail_marks_us, self._tail_marked_rows = list[T](), list[int](), list[int]()
+    elif self.tail_us > 0:
+      self._extend_tail(retired, self._marks_us, self._marked_rows)
+    self._active, self.append, self.extend = fresh, fresh.append, fresh.extend
+    self._marks_us, self._marked_rows = list[int](), list[int]()
+    self._window = self._window_lists()
+    return retired
+
+  def _extend_tail(self, rows: list[T], marks_us: list[int], marked_rows: list[int]) -> None:
+    tail_rows = len(self._tail)
+    tail = self._tail + rows
+    tail_marks_us = self._tail_marks_us + marks_us
+    tail_marked_rows = self._tail_marked_rows + [tail_rows + rows for rows in marked_rows]
+    if not tail_marks_us:
+      # unmarked rows cannot be placed in any window
+      self._tail, self._tail_marks_us, self._tail_marked_rows = list[T](), list[int](), list[int]()
+      return
+    # the last mark before the window bounds it, rows before that mark are dropped
+    first = bisect_right(tail_marks_us, tail_marks_us[-1] - self.tail_us) - 1
+    if first < 0:
+      self._tail, self._tail_marks_us, self._tail_marked_rows = tail, tail_marks_us, tail_marked_rows
+      return
+    start = tail_marked_rows[first]
+    self._tail = tail[start:]
+    self._tail_marks_us = tail_marks_us[first:]
+    self._tail_marked_rows = [rows - start for rows in tail_marked_rows[first:]]
+
+  def _window_lists(self) -> tuple[list[T], list[int], list[int], list[T], list[int], list[int]]:
+    return (
+      self._tail, self._tail_marks_us, self._tail_marked_rows,
+      self._active, self._marks_us, self._marked_rows,
+    )
+
+  def oldest_mark_us(self) -> int | None:
+    """Time of the oldest mark still held, rows since then are all readable."""
+    tail, tail_marks_us, _, _, marks_us, _ = self._window
+    if tail_marks_us:
+      return tail_marks_us[0]
+    return marks_us[0] if marks_us else None
+
+  def rows_since(self, ts_uptime_us: int) -> list[T]:
+    """Rows that arrived after the last mark at or before `ts_uptime_us`, from the tail and the active rows."""
+    tail, tail_marks_us, tail_marked_rows, active, marks_us, marked_rows = self._window
+    mark = bisect_right(marks_us, ts_uptime_us)
+    if mark > 0:
+      return active[marked_rows[mark - 1]:]
+    tail_mark = bisect_right(tail_marks_us, ts_uptime_us)
+    return tail[tail_marked_rows[tail_mark - 1] if tail_mark > 0 else 0:] + active
+
+  def last_rows(self, k: int) -> list[T]:
+    if k <= 0:
+      return []
+    tail, _, _, active, _, _ = self._window
+    if len(active) >= k:
+      return active[-k:]
+    return tail[-(k - len(active)):] + active
+
+  def last_rows_since_us(self, k: int) -> int | None:
+    """Latest mark `rows_since` has to reach back to for the last `k` rows, None if they go past every mark."""
+    tail, tail_marks_us, tail_marked_rows, active, marks_us, marked_rows = self._window
+    first_row = len(active) - k
+    if first_row >= 0:
+      mark = bisect_right(marked_rows, first_row)
+      if mark > 0:
+        return marks_us[mark - 1]
+      # the active rows all came after the tail's last mark
+      first_row = len(tail)
+    else:
+      first_row += len(tail)
+    tail_mark = bisect_right(tail_marked_rows, first_row)
+    return tail_marks_us[tail_mark - 1] if tail_mark > 0 else None
+
+  def snapshot(self) -> list[T]:
+    """Copy of the active rows that leaves them in place."""
+    return list(self._active)
+
+  def retire(self) -> bool:
+    """Called by the poll thread to set the active rows aside for `spill_retired`, False without any."""
+    with self._swap_lock:
+      if not self._active:
+        return False
+      # holding a tail would defeat the budget, windows start over from here
+      self._retired.append(self._replace_active(keep_tail=False))
+      return True
+
+  def spill_retired(self, spill_dir: Path | None = None) -> int:
+    """Writes every retired row list to a temporary Arrow file, returns how many were spilled.
+
+    Runs off the poll thread, rows popped while they were written stay popped
+    and their file is removed.
+    """
+    spills = 0
+    while True:
+      with self._swap_lock:
+        if not self._retired:
+          return spills
+        rows = self._retired[0]
+      fd, spill_name = tempfile.mkstemp(prefix="kernmlops-", suffix=".arrow", dir=spill_dir)
+      os.close(fd)
+      spill_path = Path(spill_name)
+      self.to_frame(rows).write_ipc(spill_path, compression="lz4")
+      with self._swap_lock:
+        if self._retired and self._retired[0] is rows:
+          self._retired.pop(0)
+          self._spilled.append(spill_path)
+          spills += 1
+          continue
+      spill_path.unlink(missing_ok=True)
+
+  def clear(self) -> None:
+    """Drops every row, the tail included."""
+    spilled, _ = self.swap()
+    for spill_path in spilled:
+      spill_path.unlink(missing_ok=True)
+    with self._swap_lock:
+      # the active list stays, handlers may be about to append to it
+      self._tail, self._tail_marks_us, self._tail_marked_rows = list[T](), list[int](), list[int]()
+      self._window = self._window_lists()
+
+  def frame(self) -> pl.DataFrame:
+    with self._swap_lock:
+      spilled = list(self._spilled)
+      rows = [row for retired in self._retired for row in retired] + self.snapshot()
+    return self._with_spilled(spilled, self.to_frame(rows), remove=False)
+
+  def pop_frame(self) -> pl.DataFrame:
+    spilled, rows = self.swap()
+    return self._with_spilled(spilled, self.to_frame(rows), remove=True)
+
+  def to_frame(self, rows: list[T]) -> pl.DataFrame:
+    if self.schema is not None:
+      return pl.DataFrame(rows, schema=self.schema, orient="row")
+    if rows or self.row_type is None or not is_dataclass(self.row_type):
+      return pl.DataFrame(rows)
+    # keep the columns of empty intervals so renames and casts still apply
+    return pl.DataFrame(schema=[field.name for field in fields(self.row_type)])
+
+  def _with_spilled(self, spilled: list[Path], frame: pl.DataFrame, *, remove: bool) -> pl.DataFrame:
+    if not spilled:
+      return frame
+    spilled_frames = list[pl.DataFrame]()
+    for spill_path in spilled:
+      spilled_frames.append(pl.read_ipc(spill_path))
+      if remove:
+        spill_path.unlink(missing_ok=True)
+    if frame.is_empty():
+      return pl.concat(spilled_frames, how="diagonal_relaxed")
+    return pl.concat(spilled_frames + [frame], how="diagonal_relaxed")
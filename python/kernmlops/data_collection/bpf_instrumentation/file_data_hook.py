@@ -1,9 +1,16 @@
 from dataclasses import dataclass
 from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Mapping
 
 import polars as pl
-from bcc import BPF
 from data_collection.bpf_instrumentation.bpf_hook import POLL_TIMEOUT_MS, BPFProgram
+from data_collection.bpf_instrumentation.event_buffer import EventBuffer
+from data_collection.bpf_instrumentation.kernel_features import (
+  kernel_struct_has_field,
+  kprobe_exists,
+)
+from data_collection.bpf_instrumentation.perf_buffer import PerfBuffers
 from data_schema import CollectionTable, FileDataTable
 
 
@@ -28,11 +35,11 @@ class FileDataBPFHook(BPFProgram):
     bpf_text = open(Path(__file__).parent / "bpf/file_data.bpf.c", "r").read()
 
     # code substitutions
-    if BPF.kernel_struct_has_field(b'renamedata', b'new_mnt_idmap') == 1:
+    if kernel_struct_has_field('renamedata', 'new_mnt_idmap'):
         bpf_text = bpf_text.replace('TRACE_CREATE_1', '0')
         bpf_text = bpf_text.replace('TRACE_CREATE_2', '0')
         bpf_text = bpf_text.replace('TRACE_CREATE_3', '1')
-    elif BPF.kernel_struct_has_field(b'renamedata', b'old_mnt_userns') == 1:
+    elif kernel_struct_has_field('renamedata', 'old_mnt_userns'):
         bpf_text = bpf_text.replace('TRACE_CREATE_1', '0')
         bpf_text = bpf_text.replace('TRACE_CREATE_2', '1')
         bpf_text = bpf_text.replace('TRACE_CREATE_3', '0')
@@ -43,38 +50,50 @@ class FileDataBPFHook(BPFProgram):
     # pid from userspace point of view is thread group from kernel pov
     # bpf_text = bpf_text.replace('FILTER', 'tgid != %s' % args.pid)
     self.bpf_text = bpf_text.replace('FILTER', '0')
-    self.file_open_data = list[FileOpenData]()
+    self.file_open_data = EventBuffer(FileOpenData)
 
   def load(self, collection_id: str):
     self.collection_id = collection_id
-    self.bpf = BPF(text = self.bpf_text)
+    self.bpf = self.compiled_bpf()
     self.bpf.attach_kprobe(event=b"vfs_create", fn_name=b"trace_create")
     self.bpf.attach_kprobe(event=b"vfs_open", fn_name=b"trace_open")
-    if BPF.get_kprobe_functions(b"security_inode_create"):
+    if kprobe_exists("security_inode_create"):
         self.bpf.attach_kprobe(event=b"security_inode_create", fn_name=b"trace_security_inode_create")
-    self.bpf["file_open_events"].open_perf_buffer(self._file_open_event_handler, page_cnt=64)
+    self.open_buffers()
+
+  def open_buffers(self):
+    self.perf_buffers = PerfBuffers(self.bpf, self.name(), self.transport)
+    self.perf_buffers.open("file_open_events", self._file_open_event_handler, page_cnt=64)
 
   def poll(self):
-    self.bpf.perf_buffer_poll(timeout=POLL_TIMEOUT_MS)
+    self.perf_buffers.poll(timeout_ms=POLL_TIMEOUT_MS)
 
   def close(self):
     self.bpf.cleanup()
 
-  def data(self) -> list[CollectionTable]:
+  def buffers(self) -> Mapping[str, EventBuffer]:
+    return {
+      "file_open": self.file_open_data,
+    }
+
+  @classmethod
+  def build_tables(cls, raw_data: Mapping[str, pl.DataFrame], collection_id: str) -> list[CollectionTable]:
     return [
       FileDataTable.from_df_id(
-        pl.DataFrame(self.file_open_data),
-        collection_id=self.collection_id,
+        raw_data["file_open"],
+        collection_id=collection_id,
       ),
     ]
 
-  def clear(self):
-    self.file_open_data.clear()
+  @classmethod
+  def synthetic_event(cls, table_name: str, seq: int) -> Any:
+    return SimpleNamespace(
+      pid=seq, tgid=seq, ts_uptime_us=seq, file_inode=seq, file_size_bytes=4096, file_name=b"kernmlops",
+    )
 
-  def pop_data(self) -> list[CollectionTable]:
-    file_tables = self.data()
-    self.clear()
-    return file_tables
+  @classmethod
+  def raw_data_from_tables(cls, tables: Mapping[str, pl.DataFrame]) -> Mapping[str, pl.DataFrame]:
+    return {"file_open": tables[FileDataTable.name()]}
 
   def _file_open_event_handler(self, cpu, file_open_perf_event, size):
     event = self.bpf["file_open_events"].event(file_open_perf_event)
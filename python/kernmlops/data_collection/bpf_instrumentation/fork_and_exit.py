@@ -1,9 +1,12 @@
 from dataclasses import dataclass
 from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Mapping
 
 import polars as pl
-from bcc import BPF
 from data_collection.bpf_instrumentation.bpf_hook import POLL_TIMEOUT_MS, BPFProgram
+from data_collection.bpf_instrumentation.event_buffer import EventBuffer
+from data_collection.bpf_instrumentation.perf_buffer import PerfBuffers
 from data_schema import CollectionTable
 from data_schema.generic_table import ProcessTraceDataTable
 
@@ -24,39 +27,49 @@ class TraceProcessHook(BPFProgram):
 
   def __init__(self):
     self.bpf_text = open(Path(__file__).parent / "bpf/fork_and_exit.bpf.c", "r").read()
-    self.trace_process = list[TraceProcessStat]()
+    self.trace_process = EventBuffer(TraceProcessStat)
 
   def load(self, collection_id: str):
     self.collection_id = collection_id
-    self.bpf = BPF(text = self.bpf_text)
+    self.bpf = self.compiled_bpf()
     self.bpf.attach_kretprobe(event=b"copy_process", fn_name=b"kretprobe_copy_process")
     self.bpf.attach_kprobe(event=b"do_exit", fn_name=b"kprobe_do_exit")
     self.bpf.attach_kretprobe(event=b"__set_task_comm", fn_name=b"kretprobe_exec")
-    self.bpf["copy_task_events"].open_perf_buffer(self._create_task_eh, page_cnt=128)
-    self.bpf["release_task_events"].open_perf_buffer(self._release_task_eh, page_cnt=128)
-    self.bpf["exec_events"].open_perf_buffer(self._exec_eh, page_cnt=128)
+    self.open_buffers()
+
+  def open_buffers(self):
+    self.perf_buffers = PerfBuffers(self.bpf, self.name(), self.transport)
+    self.perf_buffers.open("copy_task_events", self._create_task_eh, page_cnt=128)
+    self.perf_buffers.open("release_task_events", self._release_task_eh, page_cnt=128)
+    self.perf_buffers.open("exec_events", self._exec_eh, page_cnt=128)
 
   def poll(self):
-    self.bpf.perf_buffer_poll(timeout=POLL_TIMEOUT_MS)
+    self.perf_buffers.poll(timeout_ms=POLL_TIMEOUT_MS)
 
   def close(self):
     self.bpf.cleanup()
 
-  def data(self) -> list[CollectionTable]:
+  def buffers(self) -> Mapping[str, EventBuffer]:
+    return {
+      "process_trace": self.trace_process,
+    }
+
+  @classmethod
+  def build_tables(cls, raw_data: Mapping[str, pl.DataFrame], collection_id: str) -> list[CollectionTable]:
     return [
             ProcessTraceDataTable.from_df_id(
-                pl.DataFrame(self.trace_process),
-                collection_id=self.collection_id,
+                raw_data["process_trace"],
+                collection_id=collection_id,
             ),
         ]
 
-  def clear(self):
-    self.trace_process.clear()
+  @classmethod
+  def synthetic_event(cls, table_name: str, seq: int) -> Any:
+    return SimpleNamespace(pid=seq, tgid=seq, ts=seq, buff=b"kernmlops")
 
-  def pop_data(self) -> list[CollectionTable]:
-    tables = self.data()
-    self.clear()
-    return tables
+  @classmethod
+  def raw_data_from_tables(cls, tables: Mapping[str, pl.DataFrame]) -> Mapping[str, pl.DataFrame]:
+    return {"process_trace": tables[ProcessTraceDataTable.name()]}
 
   def _create_task_eh(self, cpu, start_data, size):
       event = self.bpf["copy_task_events"].event(start_data)
@@ -0,0 +1,206 @@
+"""Loads each hook on its own under a synthetic load and measures what it costs."""
+
+import mmap
+import multiprocessing
+import os
+import platform
+import subprocess
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Final, Mapping
+
+from data_collection.bpf_instrumentation.bpf_hook import BPFProgram
+from data_collection.bpf_instrumentation.kernel_features import kernel_feature_stats
+from data_collection.bpf_instrumentation.perf_buffer import PerfBuffers
+from data_collection.bpf_instrumentation.transport import PERF_TRANSPORT, Transport
+
+CHECK_REPORT_VERSION: Final[int] = 3
+_LOAD_FILE_BYTES: Final[int] = 1024 * 1024
+_LOAD_MAP_BYTES: Final[int] = 4 * 1024 * 1024
+# sampling hooks return from poll right away, they are polled at this interval instead
+_SAMPLE_INTERVAL_SEC: Final[float] = 0.1
+
+
+@dataclass(frozen=True)
+class HookCheck:
+  """Result of checking one hook, `error` is set when it failed at `stage`, one of compile, attach or poll.
+
+  `probe_sec` is the time spent probing kernel features, `probes_cached` of
+  the hook's probes were answered from the cache instead. `compile_sec`
+  leaves the probes out.
+  """
+  hook: str
+  ok: bool
+  error: str | None = None
+  stage: str | None = None
+  probe_sec: float = 0.0
+  probes_cached: int = 0
+  compile_sec: float = 0.0
+  attach_sec: float = 0.0
+  rows: int = 0
+  rows_per_sec: float = 0.0
+  events: int = 0
+  events_per_sec: float = 0.0
+  lost_samples: int = 0
+  handler_ns_per_event: float = 0.0
+  poll_ns_per_row: float = 0.0
+
+
+def synthetic_load(stop_event, workdir: Path) -> None:
+  """Forks, creates, writes, syncs, reads and maps files until `stop_event` is set.
+
+  Enough to exercise the process, file, vfs, block IO and memory hooks, block
+  IO is only seen when `workdir` is backed by a disk rather than tmpfs.
+  """
+  data = os.urandom(_LOAD_FILE_BYTES)
+  load_path = workdir / f"kernmlops-check-{os.getpid()}"
+  try:
+    while not stop_event.is_set():
+      subprocess.run(["true"], check=False)
+      with open(load_path, "wb") as load_file:
+        load_file.write(data)
+        load_file.flush()
+        os.fsync(load_file.fileno())
+      with open(load_path, "rb") as load_file:
+        while load_file.read(64 * 1024):
+          pass
+      region = mmap.mmap(-1, _LOAD_MAP_BYTES)
+      region.write(data * (_LOAD_MAP_BYTES // _LOAD_FILE_BYTES))
+      region.madvise(mmap.MADV_DONTNEED)
+      region.close()
+  finally:
+    load_path.unlink(missing_ok=True)
+
+
+def _failed(hook_type: type[BPFProgram], stage: str, e: Exception, **times: float | int) -> HookCheck:
+  return HookCheck(hook=hook_type.name(), ok=False, error=f"{type(e).__name__}: {e}", stage=stage, **times)
+
+
+def check_hook(
+  hook_type: type[BPFProgram],
+  *,
+  duration_sec: float,
+  workdir: Path,
+  transport: Transport = PERF_TRANSPORT,
+) -> HookCheck:
+  """Times compiling and attaching `hook_type`, then polls it for `duration_sec` while `synthetic_load` runs."""
+  probe_stats = kernel_feature_stats()
+  start = time.perf_counter()
+  compile_error: Exception | None = None
+  try:
+    # hooks probe the kernel when constructed
+    hook = hook_type()
+    hook.transport = transport
+    hook.compile()
+  except Exception as e:
+    compile_error = e
+  probe_sec = kernel_feature_stats().probe_sec - probe_stats.probe_sec
+  probes_cached = kernel_feature_stats().cached - probe_stats.cached
+  compile_sec = time.perf_counter() - start - probe_sec
+  if compile_error is not None:
+    return _failed(hook_type, "compile", compile_error, probe_sec=probe_sec, probes_cached=probes_cached)
+  start = time.perf_counter()
+  try:
+    hook.load("check")
+  except Exception as e:
+    hook.discard()
+    return _failed(hook_type, "attach", e, probe_sec=probe_sec, probes_cached=probes_cached, compile_sec=compile_sec)
+  attach_sec = time.perf_counter() - start
+  context = multiprocessing.get_context("spawn")
+  stop_event = context.Event()
+  load_process = context.Process(target=synthetic_load, args=(stop_event, workdir), daemon=True)
+  rows, poll_ns = 0, 0
+  perf_buffers = getattr(hook, "perf_buffers", None)
+  sampled = not isinstance(perf_buffers, PerfBuffers)
+  try:
+    load_process.start()
+    started_at = time.monotonic()
+    while time.monotonic() - started_at < duration_sec:
+      poll_start_ns = time.perf_counter_ns()
+      hook.poll()
+      poll_ns += time.perf_counter_ns() - poll_start_ns
+      # rows are only counted, clearing keeps the check's own memory flat
+      rows += sum(len(buffer) for buffer in hook.buffers().values())
+      hook.clear()
+      if sampled:
+        time.sleep(_SAMPLE_INTERVAL_SEC)
+    elapsed_sec = time.monotonic() - started_at
+    stop_event.set()
+    load_process.join()
+    events, handler_ns, lost_samples = 0, 0, 0
+    if isinstance(perf_buffers, PerfBuffers):
+      events = sum(stats.events for stats in perf_buffers.stats())
+      handler_ns = sum(stats.handler_ns for stats in perf_buffers.stats())
+      lost_samples = perf_buffers.lost_samples()
+    return HookCheck(
+      hook=hook_type.name(),
+      ok=True,
+      probe_sec=probe_sec,
+      probes_cached=probes_cached,
+      compile_sec=compile_sec,
+      attach_sec=attach_sec,
+      rows=rows,
+      rows_per_sec=rows / elapsed_sec,
+      events=events,
+      events_per_sec=events / elapsed_sec,
+      lost_samples=lost_samples,
+      handler_ns_per_event=handler_ns / events if events else 0.0,
+      poll_ns_per_row=poll_ns / rows if rows else 0.0,
+    )
+  except Exception as e:
+    return _failed(
+      hook_type, "poll", e,
+      probe_sec=probe_sec, probes_cached=probes_cached, compile_sec=compile_sec, attach_sec=attach_sec,
+    )
+  finally:
+    stop_event.set()
+    if load_process.is_alive():
+      load_process.join()
+    hook.close()
+
+
+def check_hooks(
+  hook_types: Mapping[str, type[BPFProgram]],
+  *,
+  duration_sec: float,
+  workdir: Path,
+  transports: Mapping[str, Transport] | None = None,
+  verbose: bool = False,
+) -> Mapping[str, Any]:
+  """Report of every hook checked in turn, versioned so reports of different hosts can be compared.
+
+  Hooks are loaded with their transport in `transports`, perf buffers otherwise.
+  """
+  transports = transports if transports is not None else {}
+  workdir.mkdir(parents=True, exist_ok=True)
+  checks = list[HookCheck]()
+  for hook_name, hook_type in hook_types.items():
+    if verbose:
+      print(f"checking {hook_name}")
+    checks.append(check_hook(
+      hook_type,
+      duration_sec=duration_sec,
+      workdir=workdir,
+      transport=transports.get(hook_name, PERF_TRANSPORT),
+    ))
+    if verbose:
+      print(checks[-1])
+  return {
+    "version": CHECK_REPORT_VERSION,
+    "host": {
+      "hostname": platform.node(),
+      "kernel": platform.release(),
+      "cpus": os.cpu_count(),
+    },
+    "duration_sec": duration_sec,
+    # startup as collections see it, the probes are the part the kernel feature cache saves
+    "startup": {
+      "probe_sec": sum(check.probe_sec for check in checks),
+      "probes_cached": sum(check.probes_cached for check in checks),
+      "compile_sec": sum(check.compile_sec for check in checks),
+      "attach_sec": sum(check.attach_sec for check in checks),
+    },
+    "failed": [check.hook for check in checks if not check.ok],
+    "hooks": [asdict(check) for check in checks],
+  }
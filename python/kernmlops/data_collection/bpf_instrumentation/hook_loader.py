@@ -0,0 +1,97 @@
+"""Loads hooks at collector startup, compiling them concurrently and attaching them one at a time."""
+
+import contextlib
+import os
+import re
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Final
+
+from data_collection.bpf_instrumentation.bpf_hook import BPFProgram
+
+# functions BCC attaches by their name while the `BPF` object is created
+_AUTO_ATTACHED: Final[re.Pattern] = re.compile(
+  r"\b(?:kprobe|kretprobe|tracepoint|raw_tracepoint|kfunc|kretfunc|lsm)__\w+\s*\("
+)
+
+
+@dataclass(frozen=True)
+class HookLoadTime:
+  hook: str
+  compile_sec: float
+  attach_sec: float
+
+
+def attaches_on_compile(bpf_program: BPFProgram) -> bool:
+  """Whether compiling the program already attaches some of its probes, as `kprobe__` functions are."""
+  bpf_text = getattr(bpf_program, "bpf_text", None)
+  return bpf_text is not None and _AUTO_ATTACHED.search(bpf_text) is not None
+
+
+def _timed_compile(bpf_program: BPFProgram) -> float:
+  start = perf_counter()
+  bpf_program.compile()
+  return perf_counter() - start
+
+
+def _compiled(compile_sec: float) -> Future[float]:
+  compiled = Future[float]()
+  compiled.set_result(compile_sec)
+  return compiled
+
+
+def load_hooks(
+  bpf_programs: list[BPFProgram],
+  collection_id: str,
+  *,
+  workers: int = 0,
+  verbose: bool = False,
+) -> list[HookLoadTime]:
+  """Compiles `bpf_programs` in `workers` threads, one per cpu by default, and loads them in order.
+
+  Each program is loaded in the calling thread as soon as its compile
+  finished, so attaching stays serial while the remaining programs compile.
+  The first program is compiled before any thread starts, so BCC and LLVM
+  set up their global state once, and programs that attach while compiling,
+  see `attaches_on_compile`, are compiled in the calling thread too. If any
+  program fails, compiles already running are waited for and every program
+  compiled or attached so far is discarded.
+  """
+  load_times = list[HookLoadTime]()
+  start_all = perf_counter()
+  executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1, thread_name_prefix="kernmlops-compile")
+  try:
+    compiling = list[Future[float] | None]()
+    for index, bpf_program in enumerate(bpf_programs):
+      if index == 0:
+        compiling.append(_compiled(_timed_compile(bpf_program)))
+      elif attaches_on_compile(bpf_program):
+        compiling.append(None)
+      else:
+        compiling.append(executor.submit(_timed_compile, bpf_program))
+    for bpf_program, compiled in zip(bpf_programs, compiling):
+      compile_sec = compiled.result() if compiled is not None else _timed_compile(bpf_program)
+      start = perf_counter()
+      bpf_program.load(collection_id)
+      load_times.append(HookLoadTime(
+        hook=bpf_program.name(),
+        compile_sec=compile_sec,
+        attach_sec=perf_counter() - start,
+      ))
+      if verbose:
+        print(f"{bpf_program.name()} BPF program compiled in {compile_sec:.2f}s, "
+              f"attached in {load_times[-1].attach_sec:.2f}s")
+  except BaseException:
+    # programs not compiling yet are not started, those compiling are waited for to be released
+    executor.shutdown(wait=True, cancel_futures=True)
+    for bpf_program in bpf_programs:
+      # the first error is the one reported
+      with contextlib.suppress(Exception):
+        bpf_program.discard()
+    raise
+  executor.shutdown()
+  if verbose:
+    # compare with `compile_workers: 1` to see what compiling in threads saves
+    print(f"{len(bpf_programs)} BPF programs loaded in {perf_counter() - start_all:.2f}s")
+  return load_times
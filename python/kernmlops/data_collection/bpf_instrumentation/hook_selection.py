@@ -0,0 +1,147 @@
+"""Picks the hooks, and their sample rates, that fit a collector overhead budget."""
+
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Final, Mapping
+
+import polars as pl
+from data_schema import CollectorOverheadTable
+
+# assumed for hooks never collected with this benchmark, about what a busy tracepoint costs
+UNMEASURED_HOOK_CORES: Final[float] = 0.005
+MIN_SAMPLE_FREQ: Final[int] = 10
+
+
+@dataclass(frozen=True)
+class HookCost:
+  """Cores a hook kept busy on average, and the events it handled per second, when sampled at `sample_freq`."""
+  cores: float
+  events_per_sec: float
+  sample_freq: int | None = None
+
+  def ns_per_event(self) -> float | None:
+    """Collector time per event handled, None for hooks that handled none."""
+    if self.events_per_sec <= 0:
+      return None
+    return self.cores * 1e9 / self.events_per_sec
+
+
+@dataclass(frozen=True)
+class PlannedHook:
+  hook: str
+  predicted_cores: float
+  measured: bool
+  sample_freq: int | None = None
+
+
+@dataclass(frozen=True)
+class HookPlan:
+  budget_cores: float
+  hooks: tuple[PlannedHook, ...]
+
+  def hook_names(self) -> list[str]:
+    return [planned_hook.hook for planned_hook in self.hooks]
+
+  def predicted_cores(self) -> float:
+    return sum(planned_hook.predicted_cores for planned_hook in self.hooks)
+
+  def sample_freqs(self) -> dict[str, int]:
+    return {
+      planned_hook.hook: planned_hook.sample_freq
+      for planned_hook in self.hooks
+      if planned_hook.sample_freq is not None
+    }
+
+  def to_polars(self) -> pl.DataFrame:
+    """One row of `system_info` columns describing the plan."""
+    return pl.DataFrame({
+      "overhead_budget_cores": [self.budget_cores],
+      "predicted_overhead_cores": [self.predicted_cores()],
+      "hook_plan": [[asdict(planned_hook) for planned_hook in self.hooks]],
+    })
+
+
+def load_hook_costs(*benchmark_dirs: Path) -> dict[str, HookCost]:
+  """Costs per hook from the `collector_overhead` tables of earlier collections in `benchmark_dirs`.
+
+  Only the collector's own time is known, the time the kernel spends in the
+  BPF programs themselves is not part of it. Sampling hooks collected at
+  several frequencies are costed at the one they were collected at longest,
+  tables written before frequencies were recorded leave `sample_freq` unknown.
+  """
+  overhead_paths = [
+    overhead_path
+    for benchmark_dir in benchmark_dirs
+    for overhead_path in benchmark_dir.glob(f"*/{CollectorOverheadTable.name()}.*.parquet")
+  ]
+  if not overhead_paths:
+    return {}
+  overheads = pl.concat(
+    [pl.read_parquet(overhead_path) for overhead_path in overhead_paths],
+    how="diagonal_relaxed",
+  )
+  if "sample_freq" not in overheads.columns:
+    overheads = overheads.with_columns(pl.lit(None, dtype=pl.Int64()).alias("sample_freq"))
+  by_hook = overheads.group_by("hook", "sample_freq").agg(
+    pl.col("interval_us", "poll_ns", "pop_data_ns", "write_ns", "events").sum()
+  ).sort("interval_us").unique("hook", keep="last")
+  return {
+    row["hook"]: HookCost(
+      # event handlers run inside poll so handler_ns is already part of poll_ns
+      cores=(row["poll_ns"] + row["pop_data_ns"] + row["write_ns"]) / (row["interval_us"] * 1000),
+      events_per_sec=row["events"] * 1_000_000 / row["interval_us"],
+      sample_freq=row["sample_freq"],
+    )
+    for row in by_hook.iter_rows(named=True)
+    if row["interval_us"] > 0
+  }
+
+
+def plan_hooks(
+  priority: list[str],
+  costs: Mapping[str, HookCost],
+  *,
+  budget_cores: float,
+  sample_freqs: Mapping[str, int],
+  event_rates: Mapping[str, float] | None = None,
+) -> HookPlan:
+  """Takes hooks in `priority` order while their predicted cost fits in `budget_cores`.
+
+  A hook is predicted to cost the time it took per event times the events
+  per second in `event_rates`, those expected of the benchmark, so the same
+  hook can fit one benchmark and not another. Hooks without an expected
+  rate, or without events, cost what they did on average.
+
+  Hooks with a sample frequency in `sample_freqs` that do not fit are sampled
+  less often instead, as long as that stays above `MIN_SAMPLE_FREQ`. Their
+  cost is assumed to scale with frequency, from the one it was measured at
+  to the one in `sample_freqs`.
+  """
+  event_rates = event_rates if event_rates is not None else {}
+  planned_hooks = list[PlannedHook]()
+  remaining_cores = budget_cores
+  for hook_name in priority:
+    cost = costs.get(hook_name)
+    cores = cost.cores if cost is not None else UNMEASURED_HOOK_CORES
+    ns_per_event = cost.ns_per_event() if cost is not None else None
+    if ns_per_event is not None and hook_name in event_rates:
+      cores = ns_per_event * event_rates[hook_name] / 1e9
+    sample_freq = sample_freqs.get(hook_name)
+    measured_freq = cost.sample_freq if cost is not None else None
+    if sample_freq is not None and measured_freq:
+      cores = cores * sample_freq / measured_freq
+    if cores > remaining_cores and sample_freq is not None and cores > 0:
+      reduced_freq = int(sample_freq * remaining_cores / cores)
+      if reduced_freq >= MIN_SAMPLE_FREQ:
+        cores = cores * reduced_freq / sample_freq
+        sample_freq = reduced_freq
+    if cores > remaining_cores:
+      continue
+    remaining_cores -= cores
+    planned_hooks.append(PlannedHook(
+      hook=hook_name,
+      predicted_cores=cores,
+      measured=cost is not None,
+      sample_freq=sample_freq,
+    ))
+  return HookPlan(budget_cores=budget_cores, hooks=tuple(planned_hooks))
@@ -0,0 +1,115 @@
+"""Kernel feature probes the hooks substitute into their programs, cached per kernel build.
+
+Probing BTF for a struct field or the traceable functions for a kprobe costs
+more than the substitution it decides, the answers only change with the
+kernel so they are kept in a file named after the kernel build.
+
+Only the probes are cached, BCC still compiles every program from its C
+source on each load. A compiled program cannot be loaded again, its
+instructions hold the fds of the maps created along with it. `collect check`
+reports the time taken by both.
+"""
+
+import hashlib
+import json
+import os
+import platform
+import time
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Callable, Final
+
+KERNEL_BTF_PATH: Final[Path] = Path("/sys/kernel/btf/vmlinux")
+# ELF notes of the running kernel, holding its GNU build id when linked with one
+KERNEL_NOTES_PATH: Final[Path] = Path("/sys/kernel/notes")
+
+
+def kernel_build_id() -> str:
+  """Identifies the running kernel build by its notes, release, version and BTF size.
+
+  Cheap enough for every start, the BTF itself is megabytes. Its mtime is
+  left out since sysfs files are dated at boot.
+  """
+  build = hashlib.sha256()
+  if KERNEL_NOTES_PATH.is_file():
+    build.update(KERNEL_NOTES_PATH.read_bytes())
+  btf_size = KERNEL_BTF_PATH.stat().st_size if KERNEL_BTF_PATH.is_file() else 0
+  build.update(f"{platform.release()} {platform.version()} {btf_size}".encode())
+  return build.hexdigest()[:16]
+
+
+@dataclass(frozen=True)
+class KernelFeatureStats:
+  """Probes answered since the process started, `cached` of them from the cache without probing."""
+  probes: int = 0
+  cached: int = 0
+  probe_sec: float = 0.0
+
+
+class KernelFeatures:
+  """Answers feature probes from `cache_path` when set, probing through BCC and saving the answer otherwise.
+
+  The cache is handed to `ids`, the user and group owning the collected data,
+  when set.
+  """
+
+  def __init__(self, cache_path: Path | None = None, ids: tuple[int, int] | None = None):
+    self.cache_path = cache_path
+    self.ids = ids
+    self.stats = KernelFeatureStats()
+    self._features = dict[str, bool]()
+    if cache_path is not None and cache_path.is_file():
+      self._features = json.loads(cache_path.read_text())
+
+  def struct_has_field(self, struct_name: str, field_name: str) -> bool:
+    def probe() -> bool:
+      from bcc import BPF
+
+      return BPF.kernel_struct_has_field(struct_name.encode(), field_name.encode()) == 1
+    return self._feature(f"struct_has_field:{struct_name}.{field_name}", probe)
+
+  def kprobe_exists(self, function_name: str) -> bool:
+    def probe() -> bool:
+      from bcc import BPF
+
+      return len(BPF.get_kprobe_functions(function_name.encode())) > 0
+    return self._feature(f"kprobe_exists:{function_name}", probe)
+
+  def _feature(self, key: str, probe: Callable[[], bool]) -> bool:
+    if key in self._features:
+      self.stats = replace(self.stats, probes=self.stats.probes + 1, cached=self.stats.cached + 1)
+    else:
+      start = time.perf_counter()
+      self._features[key] = probe()
+      self.stats = replace(
+        self.stats, probes=self.stats.probes + 1, probe_sec=self.stats.probe_sec + time.perf_counter() - start,
+      )
+      if self.cache_path is not None:
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        self.cache_path.write_text(json.dumps(self._features, indent=2, sort_keys=True))
+        if self.ids is not None:
+          os.chown(self.cache_path.parent, *self.ids)
+          os.chown(self.cache_path, *self.ids)
+    return self._features[key]
+
+
+# probed without a cache until the collector config sets one up
+_kernel_features = KernelFeatures()
+
+
+def cache_kernel_features(cache_dir: Path, ids: tuple[int, int] | None = None) -> None:
+  """Keeps the answers of later probes in `cache_dir`, in a file per kernel build owned by `ids`."""
+  global _kernel_features
+  _kernel_features = KernelFeatures(cache_dir / f"{kernel_build_id()}.json", ids)
+
+
+def kernel_feature_stats() -> KernelFeatureStats:
+  return _kernel_features.stats
+
+
+def kernel_struct_has_field(struct_name: str, field_name: str) -> bool:
+  return _kernel_features.struct_has_field(struct_name, field_name)
+
+
+def kprobe_exists(function_name: str) -> bool:
+  return _kernel_features.kprobe_exists(function_name)
@@ -1,9 +1,12 @@
 from dataclasses import dataclass
 from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Mapping
 
 import polars as pl
-from bcc import BPF
 from data_collection.bpf_instrumentation.bpf_hook import POLL_TIMEOUT_MS, BPFProgram
+from data_collection.bpf_instrumentation.event_buffer import EventBuffer
+from data_collection.bpf_instrumentation.perf_buffer import PerfBuffers
 from data_schema import CollectionTable
 from data_schema.generic_table import MadviseDataTable
 
@@ -53,11 +56,11 @@ class MadviseBPFHook(BPFProgram):
   def __init__(self):
     self.is_support_raw_tp = True #  BPF.support_raw_tracepoint()
     self.bpf_text = open(Path(__file__).parent / "bpf/madvise.bpf.c", "r").read()
-    self.madvise_stat = list[MadviseStat]()
+    self.madvise_stat = EventBuffer(MadviseStat)
 
   def load(self, collection_id: str):
     self.collection_id = collection_id
-    self.bpf = BPF(text = self.bpf_text)
+    self.bpf = self.compiled_bpf()
     self.bpf.attach_kprobe(event=b"do_madvise",
                            fn_name=b"kprobe__do_madvise")
     self.bpf.attach_kretprobe(event=b"do_madvise",
@@ -66,29 +69,39 @@ class MadviseBPFHook(BPFProgram):
                            fn_name=b"kprobe__do_vmi_align_munmap")
     self.bpf.attach_kretprobe(event=b"do_vmi_align_munmap",
                               fn_name=b"kretprobe__do_vmi_align_munmap")
-    self.bpf["madvise_output"].open_perf_buffer(self._madvise_eh, page_cnt=64)
+    self.open_buffers()
+
+  def open_buffers(self):
+    self.perf_buffers = PerfBuffers(self.bpf, self.name(), self.transport)
+    self.perf_buffers.open("madvise_output", self._madvise_eh, page_cnt=64)
 
   def poll(self):
-    self.bpf.perf_buffer_poll(timeout=POLL_TIMEOUT_MS)
+    self.perf_buffers.poll(timeout_ms=POLL_TIMEOUT_MS)
 
   def close(self):
     self.bpf.cleanup()
 
-  def data(self) -> list[CollectionTable]:
+  def buffers(self) -> Mapping[str, EventBuffer]:
+    return {
+      "madvise": self.madvise_stat,
+    }
+
+  @classmethod
+  def build_tables(cls, raw_data: Mapping[str, pl.DataFrame], collection_id: str) -> list[CollectionTable]:
     return [
             MadviseDataTable.from_df_id(
-                pl.DataFrame(self.madvise_stat),
-                collection_id=self.collection_id,
+                raw_data["madvise"],
+                collection_id=collection_id,
             ),
         ]
 
-  def clear(self):
-    self.madvise_stat.clear()
+  @classmethod
+  def synthetic_event(cls, table_name: str, seq: int) -> Any:
+    return SimpleNamespace(tgid=seq, ts_ns=seq, address=seq * 4096, length=4096, advice=4)
 
-  def pop_data(self) -> list[CollectionTable]:
-    tables = self.data()
-    self.clear()
-    return tables
+  @classmethod
+  def raw_data_from_tables(cls, tables: Mapping[str, pl.DataFrame]) -> Mapping[str, pl.DataFrame]:
+    return {"madvise": tables[MadviseDataTable.name()]}
 
   def _madvise_eh(self, cpu, madvise_struct, size):
       event = self.bpf["madvise_output"].event(madvise_struct)
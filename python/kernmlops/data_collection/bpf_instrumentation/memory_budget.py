@@ -0,0 +1,107 @@
+"""Bounds the memory held by buffered hook rows between flushes."""
+
+import os
+import shutil
+from pathlib import Path
+from queue import SimpleQueue
+from threading import Event, Thread
+
+from data_collection.bpf_instrumentation.bpf_hook import BPFProgram
+from data_collection.bpf_instrumentation.event_buffer import EventBuffer
+
+
+def _pid_alive(pid: int) -> bool:
+  try:
+    os.kill(pid, 0)
+  except ProcessLookupError:
+    return False
+  except PermissionError:
+    pass
+  return True
+
+
+def collection_spill_dir(spill_root: Path, collection_id: str) -> Path:
+  """Spill directory of a collection under `spill_root`, removing those left by collectors that died."""
+  if spill_root.is_dir():
+    for spill_dir in spill_root.iterdir():
+      _, _, pid = spill_dir.name.rpartition(".")
+      if pid.isdigit() and not _pid_alive(int(pid)):
+        shutil.rmtree(spill_dir, ignore_errors=True)
+  return spill_root / f"{collection_id}.{os.getpid()}"
+
+
+class MemoryBudget:
+  """Checks the buffered rows of every hook against a collector wide and a per hook budget.
+
+  Crossing `flush_ratio` of either budget requests an early flush through
+  `flush_event`. Buffers still over budget when checked again, because the
+  flush has not caught up, have their rows retired by the poll thread and
+  written to Arrow files in `spill_dir` by a spill thread, so peak memory
+  stays bounded regardless of the event rate without the poll thread
+  building frames. `spill_dir` is removed on `close`.
+  """
+
+  def __init__(
+    self,
+    bpf_programs: list[BPFProgram],
+    *,
+    total_bytes: int,
+    hook_bytes: int,
+    flush_event: Event,
+    spill_dir: Path | None = None,
+    flush_ratio: float = 0.75,
+  ):
+    self.bpf_programs = bpf_programs
+    self.total_bytes = total_bytes
+    self.hook_bytes = hook_bytes
+    self.flush_event = flush_event
+    self.spill_dir = spill_dir
+    self.flush_ratio = flush_ratio
+    self.spills = 0
+    self._spill_queue = SimpleQueue[EventBuffer | None]()
+    self._spill_thread = Thread(target=self._spill, name="kernmlops-spill", daemon=True)
+
+  def start(self) -> None:
+    if self.spill_dir is not None:
+      self.spill_dir.mkdir(parents=True, exist_ok=True)
+    self._spill_thread.start()
+
+  def close(self) -> None:
+    """Stops the spill thread, called after the last flush popped every spilled row."""
+    self._spill_queue.put(None)
+    self._spill_thread.join()
+    if self.spill_dir is not None:
+      shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+  def check(self) -> None:
+    """Called by the poll thread after handling events."""
+    hook_usage = sorted(
+      [
+        (bpf_program, sum(buffer.estimated_bytes() for buffer in bpf_program.buffers().values()))
+        for bpf_program in self.bpf_programs
+      ],
+      key=lambda x: x[1],
+      reverse=True,
+    )
+    total_usage = sum(usage for _, usage in hook_usage)
+    if total_usage < self.total_bytes * self.flush_ratio and all(
+      usage < self.hook_bytes * self.flush_ratio
+      for _, usage in hook_usage
+    ):
+      return
+    if not self.flush_event.is_set():
+      self.flush_event.set()
+      return
+    # the requested flush has not started yet, spill whatever is over budget
+    # starting with the largest hooks since they free the most memory
+    for bpf_program, usage in hook_usage:
+      if usage < self.hook_bytes and total_usage < self.total_bytes:
+        continue
+      for buffer in bpf_program.buffers().values():
+        if buffer.retire():
+          self._spill_queue.put(buffer)
+      total_usage -= usage
+
+  def _spill(self) -> None:
+    while (buffer := self._spill_queue.get()) is not None:
+      self.spills += buffer.spill_retired(self.spill_dir)
@@ -1,13 +1,41 @@
 import time
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Mapping
+from typing import Final, Mapping
 
 import polars as pl
 from data_collection.bpf_instrumentation.bpf_hook import BPFProgram
-from data_schema import CollectionTable
+from data_collection.bpf_instrumentation.event_buffer import EventBuffer
+from data_schema import UPTIME_TIMESTAMP, CollectionTable
 from data_schema.memory_usage import MemoryUsageTable
 
+# field of /proc/meminfo behind each column, fields are parsed as kB
+PROCFS_FIELDS: Final[Mapping[str, str]] = {
+  "mem_total_bytes": "MemTotal",
+  "mem_free_bytes": "MemFree",
+  "mem_available_bytes": "MemAvailable",
+  "buffers_bytes": "Buffers",
+  "cached_bytes": "Cached",
+
+  "swap_total_bytes": "SwapTotal",
+  "swap_free_bytes": "SwapFree",
+
+  "dirty_bytes": "Dirty",
+  "writeback_bytes": "Writeback",
+
+  "anon_pages_total_bytes": "AnonPages",
+  "anon_hugepages_total_bytes": "AnonHugePages",
+  "mapped_total_bytes": "Mapped",
+  "shmem_total_bytes": "Shmem",
+
+  "hugepages_total": "HugePages_Total",
+  "hugepages_free": "HugePages_Free",
+  "hugepages_reserved": "HugePages_Rsvd",
+  "hugepage_size_bytes": "Hugepagesize",
+
+  "hardware_corrupted_bytes": "HardwareCorrupted",
+}
+
 
 # Documentation: https://access.redhat.com/solutions/406773
 @dataclass(frozen=True)
@@ -43,30 +71,10 @@ class MemoryUsageData:
   def from_procfs_map(cls, ts_uptime_us: int, procfs_map: Mapping[str, int]) -> "MemoryUsageData":
     return MemoryUsageData(
       ts_uptime_us=ts_uptime_us,
-
-      mem_total_bytes=procfs_map.get("MemTotal", 0) * 1024,
-      mem_free_bytes=procfs_map.get("MemFree", 0) * 1024,
-      mem_available_bytes=procfs_map.get("MemAvailable", 0) * 1024,
-      buffers_bytes=procfs_map.get("Buffers", 0) * 1024,
-      cached_bytes=procfs_map.get("Cached", 0) * 1024,
-
-      swap_total_bytes=procfs_map.get("SwapTotal", 0) * 1024,
-      swap_free_bytes=procfs_map.get("SwapFree", 0) * 1024,
-
-      dirty_bytes=procfs_map.get("Dirty", 0) * 1024,
-      writeback_bytes=procfs_map.get("Writeback", 0) * 1024,
-
-      anon_pages_total_bytes=procfs_map.get("AnonPages", 0) * 1024,
-      anon_hugepages_total_bytes=procfs_map.get("AnonHugePages", 0) * 1024,
-      mapped_total_bytes=procfs_map.get("Mapped", 0) * 1024,
-      shmem_total_bytes=procfs_map.get("Shmem", 0) * 1024,
-
-      hugepages_total=procfs_map.get("HugePages_Total", 0) * 1024,
-      hugepages_free=procfs_map.get("HugePages_Free", 0) * 1024,
-      hugepages_reserved=procfs_map.get("HugePages_Rsvd", 0) * 1024,
-      hugepage_size_bytes=procfs_map.get("Hugepagesize", 0) * 1024,
-
-      hardware_corrupted_bytes=procfs_map.get("HardwareCorrupted", 0) * 1024,
+      **{
+        column: procfs_map.get(procfs_field, 0) * 1024
+        for column, procfs_field in PROCFS_FIELDS.items()
+      },
     )
 
 
@@ -100,11 +108,10 @@ class MemoryUsageHook(BPFProgram):
     return Path("/proc/meminfo")
 
   def __init__(self):
-    pass
+    self.memory_usage = EventBuffer(MemoryUsageDataRaw)
 
   def load(self, collection_id: str):
     self.collection_id = collection_id
-    self.memory_usage = list[MemoryUsageDataRaw]()
 
   def poll(self):
     self.memory_usage.append(
@@ -117,21 +124,36 @@ class MemoryUsageHook(BPFProgram):
   def close(self):
     pass
 
-  def data(self) -> list[CollectionTable]:
+  def buffers(self) -> Mapping[str, EventBuffer]:
+    return {
+      "memory_usage": self.memory_usage,
+    }
+
+  @classmethod
+  def build_tables(cls, raw_data: Mapping[str, pl.DataFrame], collection_id: str) -> list[CollectionTable]:
+    # procfs dumps are only parsed when flushing to keep polling cheap
     return [
       MemoryUsageTable.from_df_id(
         pl.DataFrame([
-          raw_data.parse()
-          for raw_data in self.memory_usage
+          MemoryUsageDataRaw(**raw_row).parse()
+          for raw_row in raw_data["memory_usage"].iter_rows(named=True)
         ]),
-        collection_id=self.collection_id,
+        collection_id=collection_id,
       )
     ]
 
-  def clear(self):
-    self.memory_usage.clear()
-
-  def pop_data(self) -> list[CollectionTable]:
-    memory_table = self.data()
-    self.clear()
-    return memory_table
+  @classmethod
+  def raw_data_from_tables(cls, tables: Mapping[str, pl.DataFrame]) -> Mapping[str, pl.DataFrame]:
+    # only the fields that were parsed are written back into the dumps
+    return {
+      "memory_usage": tables[MemoryUsageTable.name()].select(
+        UPTIME_TIMESTAMP,
+        pl.concat_str(
+          [
+            pl.format(f"{procfs_field}: {{}} kB", pl.col(column) // 1024)
+            for column, procfs_field in PROCFS_FIELDS.items()
+          ],
+          separator="\n",
+        ).alias("procfs_dump"),
+      ),
+    }
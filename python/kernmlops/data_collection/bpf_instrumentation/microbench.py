@@ -0,0 +1,326 @@
+"""Microbenchmarks of the collector's userspace hot paths, runnable without root."""
+
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from time import perf_counter_ns
+from typing import Any, Callable, Final, Mapping, cast
+
+import polars as pl
+from data_collection.bpf_instrumentation.raw_capture import RawCaptureDecoder
+from data_schema import UPTIME_TIMESTAMP, CollectionTable, CollectionWriter, table_types
+from data_schema.block_io import BlockIOLatencyTable, BlockIOQueueTable, BlockIOTable
+from data_schema.generic_table import (
+  CollapseHugePageDataTableRaw,
+  TraceMMCollapseHugePageDataTable,
+)
+from data_schema.huge_pages import CollapseHugePageDataTable
+from data_schema.perf import PerfCollectionTable, perf_table_types
+from data_schema.schema import collection_id_column
+
+MICROBENCH_REPORT_VERSION: Final[int] = 2
+MICROBENCH_EVENTS: Final[tuple[int, ...]] = (100_000, 1_000_000, 10_000_000)
+_COLLECTION_ID: Final[str] = "microbench"
+SYNTHETIC_CHUNK_EVENTS: Final[int] = 64 * 1024
+
+# commands timed from a fresh interpreter, none of them load a hook or graph anything
+STARTUP_COMMANDS: Final[tuple[tuple[str, ...], ...]] = (
+  ("--help",),
+  ("collect", "dump", "--help"),
+  ("collect", "defaults", "--help"),
+)
+# a command doing real work, dumping an empty collection directory appended to it
+STARTUP_DUMP_COMMAND: Final[tuple[str, ...]] = ("collect", "dump", "-d")
+STARTUP_RUNS: Final[int] = 5
+# modules that take seconds to import or are missing on analysis hosts
+STARTUP_FORBIDDEN_IMPORTS: Final[tuple[str, ...]] = ("bcc", "matplotlib", "plotext", "osquery", "psutil", "pymongo")
+_KERNMLOPS_DIR: Final[Path] = Path(__file__).parents[2]
+
+
+@dataclass(frozen=True)
+class MicrobenchResult:
+  """Time one benchmark took over `events` rows, `error` is set when it could not run."""
+  benchmark: str
+  subject: str
+  events: int
+  ok: bool = True
+  error: str | None = None
+  seconds: float = 0.0
+  ns_per_event: float = 0.0
+  events_per_sec: float = 0.0
+  bytes: int = 0
+
+
+def _timed(benchmark: str, subject: str, events: int, elapsed_ns: int, written_bytes: int = 0) -> MicrobenchResult:
+  return MicrobenchResult(
+    benchmark=benchmark,
+    subject=subject,
+    events=events,
+    seconds=elapsed_ns / 1e9,
+    ns_per_event=elapsed_ns / events if events else 0.0,
+    events_per_sec=events * 1e9 / elapsed_ns if elapsed_ns else 0.0,
+    bytes=written_bytes,
+  )
+
+
+def _failed(benchmark: str, subject: str, events: int, e: Exception) -> MicrobenchResult:
+  return MicrobenchResult(benchmark=benchmark, subject=subject, events=events, ok=False, error=f"{type(e).__name__}: {e}")
+
+
+class _SyntheticTable:
+
+  def event(self, data: Any) -> Any:
+    # synthetic records are already the events their handlers decode
+    return data
+
+
+class SyntheticDecoder(RawCaptureDecoder):
+  """Stands in for a hook's `BPF` object so its handlers run on the hook's `synthetic_event`s.
+
+  Handlers are timed on building and appending their rows, without the cost
+  of copying records out of the kernel.
+  """
+
+  def __init__(self):
+    super().__init__({"buffers": []})
+    self.table_names = list[str]()
+    self._table = _SyntheticTable()
+
+  def __getitem__(self, table_name: str) -> Any:
+    return self._table
+
+  def register(self, table_name: str, callback: Callable) -> None:
+    super().register(table_name, callback)
+    self.table_names.append(table_name)
+
+
+def bench_hook(hook_name: str, events: int) -> list[MicrobenchResult]:
+  """Times `events` records through the hook's handlers, then `data` and `pop_data` on the rows they made.
+
+  Records are split evenly across the hook's outputs, hooks without any or
+  without a `synthetic_event`, like sampling hooks, are skipped. Hook
+  modules import bcc, without it every hook fails.
+  """
+  # imported here since the hooks themselves import this module
+  from data_collection.bpf_instrumentation import all_hooks
+
+  try:
+    hook_type = all_hooks[hook_name]
+    hook = hook_type()
+    decoder = SyntheticDecoder()
+    hook.bpf = decoder  # pyright: ignore [reportAttributeAccessIssue]
+    hook.collection_id = _COLLECTION_ID
+    hook.open_buffers()
+  except Exception as e:
+    return [_failed("handler", hook_name, events, e)]
+  if not decoder.table_names or hook_type.synthetic_event(decoder.table_names[0], 0) is None:
+    return []
+  results = list[MicrobenchResult]()
+  try:
+    records_per_table = events // len(decoder.table_names)
+    elapsed_ns = 0
+    for table_name in decoder.table_names:
+      handler = cast(Callable, decoder.handler(table_name))
+      # events are made ahead of the timed loop, a chunk at a time to bound memory
+      for chunk_start in range(0, records_per_table, SYNTHETIC_CHUNK_EVENTS):
+        chunk_end = min(chunk_start + SYNTHETIC_CHUNK_EVENTS, records_per_table)
+        synthetic_events = [hook_type.synthetic_event(table_name, seq) for seq in range(chunk_start, chunk_end)]
+        start_ns = perf_counter_ns()
+        for event in synthetic_events:
+          handler(0, event, 0)
+        elapsed_ns += perf_counter_ns() - start_ns
+    results.append(_timed("handler", hook.name(), events, elapsed_ns))
+    start_ns = perf_counter_ns()
+    hook.data()
+    results.append(_timed("data", hook.name(), events, perf_counter_ns() - start_ns))
+    start_ns = perf_counter_ns()
+    hook.pop_data()
+    results.append(_timed("pop_data", hook.name(), events, perf_counter_ns() - start_ns))
+  except Exception as e:
+    results.append(_failed("handler" if not results else "pop_data", hook.name(), events, e))
+  return results
+
+
+def _synthetic_column(dtype: pl.DataType, events: int) -> pl.Expr:
+  values = pl.int_range(events, dtype=pl.Int64)
+  if dtype == pl.String():
+    return values.cast(pl.String)
+  if dtype == pl.Boolean():
+    return values % 2 == 0
+  return values.cast(dtype)
+
+
+def synthetic_frame(schema: pl.Schema, events: int) -> pl.DataFrame:
+  """`events` rows of `schema` as the raw rows of a hook would be, without a `collection_id` column."""
+  return pl.select(**{
+    column: _synthetic_column(dtype, events)
+    for column, dtype in schema.items()
+    if column != collection_id_column()
+  })
+
+
+def bench_from_df_id(table_type: type[CollectionTable], events: int) -> MicrobenchResult:
+  try:
+    raw_df = synthetic_frame(table_type.schema(), events)
+    if table_type in perf_table_types.values():
+      # perf tables rename the counter column of their raw rows
+      raw_df = raw_df.rename({cast(type[PerfCollectionTable], table_type).cumulative_column_name(): "cumulative_count"})
+    start_ns = perf_counter_ns()
+    table_type.from_df_id(raw_df, collection_id=_COLLECTION_ID)
+    return _timed("from_df_id", table_type.name(), events, perf_counter_ns() - start_ns)
+  except Exception as e:
+    return _failed("from_df_id", table_type.name(), events, e)
+
+
+def _block_io_tables(events: int) -> tuple[BlockIOQueueTable, BlockIOLatencyTable]:
+  # every request is queued 10us after the last and completes 5us later
+  queue_df = synthetic_frame(BlockIOQueueTable.schema(), events).with_columns(
+    (pl.col("sector") * 10).alias(UPTIME_TIMESTAMP),
+    pl.lit(0, dtype=pl.Int64).alias("block_io_flags"),
+  )
+  latency_df = synthetic_frame(BlockIOLatencyTable.schema(), events).with_columns(
+    (pl.col("sector") * 10 + 5).alias(UPTIME_TIMESTAMP),
+    pl.lit(100, dtype=pl.Int64).alias("block_latency_us"),
+    pl.lit(0, dtype=pl.Int64).alias("block_io_flags"),
+  )
+  return (
+    cast(BlockIOQueueTable, BlockIOQueueTable.from_df_id(queue_df, collection_id=_COLLECTION_ID)),
+    cast(BlockIOLatencyTable, BlockIOLatencyTable.from_df_id(latency_df, collection_id=_COLLECTION_ID)),
+  )
+
+
+def bench_block_io_join(events: int) -> MicrobenchResult:
+  try:
+    queue_table, latency_table = _block_io_tables(events)
+    start_ns = perf_counter_ns()
+    BlockIOTable.from_tables(queue_table=queue_table, latency_table=latency_table)
+    return _timed("from_tables", BlockIOTable.name(), events, perf_counter_ns() - start_ns)
+  except Exception as e:
+    return _failed("from_tables", BlockIOTable.name(), events, e)
+
+
+def bench_collapse_huge_page_join(events: int) -> MicrobenchResult:
+  try:
+    collapse_df = pl.select(
+      pl.int_range(events, dtype=pl.Int64).alias("pid"),
+      pl.int_range(events, dtype=pl.Int64).alias("tgid"),
+      (pl.int_range(events, dtype=pl.Int64) * 1000).alias("start_ts_ns"),
+      (pl.int_range(events, dtype=pl.Int64) * 1000 + 500).alias("end_ts_ns"),
+      pl.lit("0x1").alias("mm"),
+      pl.lit(1, dtype=pl.Int64).alias("referenced"),
+      pl.lit("0x200000").alias("address"),
+      pl.lit(0, dtype=pl.Int64).alias("unmapped"),
+      pl.lit("0x0").alias("cc"),
+    )
+    trace_mm_df = collapse_df.select(
+      "pid",
+      "tgid",
+      pl.col("start_ts_ns") + 1,
+      pl.col("end_ts_ns") - 1,
+      "mm",
+      pl.lit(True).alias("isolated"),
+      pl.lit(1, dtype=pl.Int64).alias("status"),
+    )
+    collapse_table = cast(
+      CollapseHugePageDataTableRaw,
+      CollapseHugePageDataTableRaw.from_df_id(collapse_df, collection_id=_COLLECTION_ID),
+    )
+    trace_mm_table = cast(
+      TraceMMCollapseHugePageDataTable,
+      TraceMMCollapseHugePageDataTable.from_df_id(trace_mm_df, collection_id=_COLLECTION_ID),
+    )
+    start_ns = perf_counter_ns()
+    CollapseHugePageDataTable.from_tables(collapse_table=collapse_table, trace_mm_table=trace_mm_table)
+    return _timed("from_tables", CollapseHugePageDataTable.name(), events, perf_counter_ns() - start_ns)
+  except Exception as e:
+    return _failed("from_tables", CollapseHugePageDataTable.name(), events, e)
+
+
+def bench_write_parquet(events: int) -> MicrobenchResult:
+  """Writes a block_io table of `events` rows through the collection writer, as flushes do."""
+  try:
+    queue_table, latency_table = _block_io_tables(events)
+    block_io_table = BlockIOTable.from_tables(queue_table=queue_table, latency_table=latency_table)
+    with tempfile.TemporaryDirectory(prefix="kernmlops-microbench-") as output_dir:
+      writer = CollectionWriter(output_dir=Path(output_dir), roll_size_bytes=1 << 40, roll_interval_sec=float("inf"))
+      start_ns = perf_counter_ns()
+      writer.write(block_io_table)
+      writer.close()
+      elapsed_ns = perf_counter_ns() - start_ns
+      written_bytes = sum(parquet_path.stat().st_size for parquet_path in Path(output_dir).glob("*.parquet"))
+    return _timed("write_parquet", BlockIOTable.name(), events, elapsed_ns, written_bytes)
+  except Exception as e:
+    return _failed("write_parquet", BlockIOTable.name(), events, e)
+
+
+def bench_startup(command: tuple[str, ...], runs: int = STARTUP_RUNS, subject: str | None = None) -> MicrobenchResult:
+  """Times `runs` fresh interpreters running the CLI with `command`, fails if it imports anything forbidden.
+
+  Reported under `subject`, the command itself by default.
+  """
+  subject = subject if subject is not None else " ".join(command)
+  cli_command = [sys.executable, str(_KERNMLOPS_DIR), *command]
+  try:
+    import_times = subprocess.run(
+      [sys.executable, "-X", "importtime", *cli_command[1:]], check=True, capture_output=True, text=True,
+    ).stderr
+    # each line ends with the module imported
+    imported = {line.rsplit("|", 1)[-1].strip() for line in import_times.splitlines()}
+    forbidden = [module for module in STARTUP_FORBIDDEN_IMPORTS if module in imported]
+    if forbidden:
+      raise RuntimeError(f"imports {', '.join(forbidden)}")
+    elapsed_ns = 0
+    for _ in range(runs):
+      start_ns = perf_counter_ns()
+      subprocess.run(cli_command, check=True, capture_output=True)
+      elapsed_ns += perf_counter_ns() - start_ns
+    return _timed("startup", subject, runs, elapsed_ns)
+  except Exception as e:
+    return _failed("startup", subject, runs, e)
+
+
+def run_microbenchmarks(
+  hook_names: list[str],
+  *,
+  event_counts: tuple[int, ...] = MICROBENCH_EVENTS,
+  verbose: bool = False,
+) -> Mapping[str, Any]:
+  """Report of every microbenchmark at each of `event_counts`, versioned so reports can be compared in review."""
+  results = list[MicrobenchResult]()
+
+  def record(new_results: list[MicrobenchResult]) -> None:
+    results.extend(new_results)
+    if verbose:
+      for result in new_results:
+        print(result)
+
+  record([bench_startup(command) for command in STARTUP_COMMANDS])
+  with tempfile.TemporaryDirectory(prefix="kernmlops-microbench-") as empty_dir:
+    record([bench_startup(
+      (*STARTUP_DUMP_COMMAND, empty_dir),
+      subject=" ".join([*STARTUP_DUMP_COMMAND, "<empty dir>"]),
+    )])
+  for events in event_counts:
+    for hook_name in hook_names:
+      record(bench_hook(hook_name, events))
+    # generic tables have no schema to cast to
+    for table_type in table_types:
+      if table_type.schema():
+        record([bench_from_df_id(table_type, events)])
+    record([bench_block_io_join(events), bench_collapse_huge_page_join(events), bench_write_parquet(events)])
+  return {
+    "version": MICROBENCH_REPORT_VERSION,
+    "host": {
+      "hostname": platform.node(),
+      "kernel": platform.release(),
+      "cpus": os.cpu_count(),
+      "python": platform.python_version(),
+      "polars": pl.__version__,
+    },
+    "failed": sorted({f"{result.benchmark}:{result.subject}" for result in results if not result.ok}),
+    "results": [asdict(result) for result in results],
+  }
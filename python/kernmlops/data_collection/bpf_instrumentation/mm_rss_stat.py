@@ -1,9 +1,12 @@
 from dataclasses import dataclass
 from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Mapping
 
 import polars as pl
-from bcc import BPF
 from data_collection.bpf_instrumentation.bpf_hook import POLL_TIMEOUT_MS, BPFProgram
+from data_collection.bpf_instrumentation.event_buffer import EventBuffer
+from data_collection.bpf_instrumentation.perf_buffer import PerfBuffers
 from data_schema import CollectionTable
 from data_schema.generic_table import TraceMMRSSStatDataTable
 
@@ -27,35 +30,45 @@ class TraceRSSStatBPFHook(BPFProgram):
   def __init__(self):
     self.is_support_raw_tp = True #  BPF.support_raw_tracepoint()
     self.bpf_text = open(Path(__file__).parent / "bpf/mm_trace_rss_stat.bpf.c", "r").read()
-    self.trace_rss_stat = list[TraceRSSStat]()
+    self.trace_rss_stat = EventBuffer(TraceRSSStat)
 
   def load(self, collection_id: str):
     self.collection_id = collection_id
-    self.bpf = BPF(text = self.bpf_text)
+    self.bpf = self.compiled_bpf()
     #self.bpf.attach_raw_tracepoint(tp=b"mm_trace_rss_stat", fn_name=b"mm_trace_rss_stat")
-    self.bpf["rss_stat_output"].open_perf_buffer(self._mm_trace_rss_stat_eh, page_cnt=256)
+    self.open_buffers()
+
+  def open_buffers(self):
+    self.perf_buffers = PerfBuffers(self.bpf, self.name(), self.transport)
+    self.perf_buffers.open("rss_stat_output", self._mm_trace_rss_stat_eh, page_cnt=256)
 
   def poll(self):
-    self.bpf.perf_buffer_poll(timeout=POLL_TIMEOUT_MS)
+    self.perf_buffers.poll(timeout_ms=POLL_TIMEOUT_MS)
 
   def close(self):
     self.bpf.cleanup()
 
-  def data(self) -> list[CollectionTable]:
+  def buffers(self) -> Mapping[str, EventBuffer]:
+    return {
+      "mm_rss_stat": self.trace_rss_stat,
+    }
+
+  @classmethod
+  def build_tables(cls, raw_data: Mapping[str, pl.DataFrame], collection_id: str) -> list[CollectionTable]:
     return [
             TraceMMRSSStatDataTable.from_df_id(
-                pl.DataFrame(self.trace_rss_stat),
-                collection_id=self.collection_id,
+                raw_data["mm_rss_stat"],
+                collection_id=collection_id,
             ),
         ]
 
-  def clear(self):
-    self.trace_rss_stat.clear()
+  @classmethod
+  def synthetic_event(cls, table_name: str, seq: int) -> Any:
+    return SimpleNamespace(pid=seq, tgid=seq, ts=seq, member=seq % len(MEMBER_ASSIGN_ARR), counter_value=seq)
 
-  def pop_data(self) -> list[CollectionTable]:
-    quanta_tables = self.data()
-    self.clear()
-    return quanta_tables
+  @classmethod
+  def raw_data_from_tables(cls, tables: Mapping[str, pl.DataFrame]) -> Mapping[str, pl.DataFrame]:
+    return {"mm_rss_stat": tables[TraceMMRSSStatDataTable.name()]}
 
   def _mm_trace_rss_stat_eh(self, cpu, rss_stat_struct, size):
       event = self.bpf["rss_stat_output"].event(rss_stat_struct)
@@ -0,0 +1,107 @@
+"""Accounting of the time the collector itself spends on each hook."""
+
+import time
+from dataclasses import dataclass
+
+import polars as pl
+from data_collection.bpf_instrumentation.bpf_hook import BPFProgram
+from data_collection.bpf_instrumentation.perf_buffer import PerfBuffers
+from data_schema import CollectorOverheadTable
+
+
+@dataclass
+class HookOverhead:
+  poll_ns: int = 0
+  pop_data_ns: int = 0
+  write_ns: int = 0
+
+
+class CollectorOverhead:
+  """Per hook timings accumulated between flushes.
+
+  The poll thread adds poll times and the output thread adds table building
+  and write times, handler times, events and bytes come from the counters the
+  hook's `PerfBuffers` keep, handler times are sampled so they only estimate
+  the total. Each call to `pop_table` closes the interval.
+  """
+
+  def __init__(self, bpf_programs: list[BPFProgram]):
+    self.bpf_programs = bpf_programs
+    self._overheads = dict[str, HookOverhead]()
+    self._handler_marks = dict[str, tuple[int, int, int]]()
+    self._interval_start_us = self._uptime_us()
+
+  def add_poll(self, hook_name: str, elapsed_ns: int) -> None:
+    self._overhead(hook_name).poll_ns += elapsed_ns
+
+  def add_pop_data(self, hook_name: str, elapsed_ns: int) -> None:
+    self._overhead(hook_name).pop_data_ns += elapsed_ns
+
+  def add_write(self, hook_name: str, elapsed_ns: int) -> None:
+    self._overhead(hook_name).write_ns += elapsed_ns
+
+  def pop_table(self, collection_id: str) -> CollectorOverheadTable:
+    """One row per hook for the interval since the previous call."""
+    overheads, self._overheads = self._overheads, dict[str, HookOverhead]()
+    interval_start_us, interval_end_us = self._interval_start_us, self._uptime_us()
+    self._interval_start_us = interval_end_us
+    hook_names = [bpf_program.name() for bpf_program in self.bpf_programs]
+    hook_names += [hook_name for hook_name in overheads.keys() if hook_name not in hook_names]
+    # costs of sampling hooks scale with the frequency they ran at
+    sample_freqs = {
+      bpf_program.name(): getattr(bpf_program, "sample_freq", None)
+      for bpf_program in self.bpf_programs
+    }
+    rows = list[dict[str, int | str | None]]()
+    for hook_name in hook_names:
+      overhead = overheads.get(hook_name, HookOverhead())
+      handler_ns, events, event_bytes = self._take_handler_counts(hook_name)
+      rows.append({
+        "hook": hook_name,
+        "ts_uptime_us": interval_end_us,
+        "interval_us": interval_end_us - interval_start_us,
+        "poll_ns": overhead.poll_ns,
+        "handler_ns": handler_ns,
+        "pop_data_ns": overhead.pop_data_ns,
+        "write_ns": overhead.write_ns,
+        "events": events,
+        "bytes": event_bytes,
+        "sample_freq": sample_freqs.get(hook_name),
+      })
+    return CollectorOverheadTable.from_df_id(
+      pl.DataFrame(rows, schema=[
+        "hook", "ts_uptime_us", "interval_us", "poll_ns", "handler_ns",
+        "pop_data_ns", "write_ns", "events", "bytes", "sample_freq",
+      ]),
+      collection_id=collection_id,
+    )
+
+  def _overhead(self, hook_name: str) -> HookOverhead:
+    overhead = self._overheads.get(hook_name)
+    if overhead is None:
+      overhead = self._overheads[hook_name] = HookOverhead()
+    return overhead
+
+  def _take_handler_counts(self, hook_name: str) -> tuple[int, int, int]:
+    perf_buffers = next(
+      (
+        getattr(bpf_program, "perf_buffers", None)
+        for bpf_program in self.bpf_programs
+        if bpf_program.name() == hook_name
+      ),
+      None,
+    )
+    if not isinstance(perf_buffers, PerfBuffers):
+      return (0, 0, 0)
+    totals = (
+      sum(stats.handler_ns for stats in perf_buffers.stats()),
+      sum(stats.events for stats in perf_buffers.stats()),
+      sum(stats.bytes for stats in perf_buffers.stats()),
+    )
+    marks = self._handler_marks.get(hook_name, (0, 0, 0))
+    self._handler_marks[hook_name] = totals
+    return (totals[0] - marks[0], totals[1] - marks[1], totals[2] - marks[2])
+
+  @staticmethod
+  def _uptime_us() -> int:
+    return int(time.clock_gettime_ns(time.CLOCK_BOOTTIME) / 1000)
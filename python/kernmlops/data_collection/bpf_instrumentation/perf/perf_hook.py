@@ -1,23 +1,27 @@
 from dataclasses import dataclass
 from fcntl import ioctl
 from pathlib import Path
-from typing import Any, Final
+from types import SimpleNamespace
+from typing import Any, Final, Mapping
 
 import polars as pl
-from bcc import BPF, PerfType
+from bcc import PerfType
 from data_collection.bpf_instrumentation.bpf_hook import POLL_TIMEOUT_MS, BPFProgram
+from data_collection.bpf_instrumentation.event_buffer import EventBuffer
 from data_collection.bpf_instrumentation.perf.perf_config import (
   PERF_EVENT_IOC_DISABLE,
   PERF_EVENT_IOC_ENABLE,
   PERF_IOC_FLAG_GROUP,
   CustomHWConfigManager,
 )
+from data_collection.bpf_instrumentation.perf_buffer import PerfBuffers
 from data_schema import CollectionTable
 from data_schema.perf import PerfCollectionTable, perf_table_types
 
 PERF_HANDLER: Final[str] = """
 BPF_PERF_OUTPUT(NAME);
 int NAME_on(struct bpf_perf_event_data* ctx) {
+  KERNMLOPS_RETURN_IF_DISABLED();
   struct bpf_perf_event_value value_buf;
   if (bpf_perf_prog_read_value(ctx, (void*)&value_buf, sizeof(struct bpf_perf_event_value))) {
     return 0;
@@ -31,6 +35,7 @@ int NAME_on(struct bpf_perf_event_data* ctx) {
   data.tgid = tgid;
   data.ts_uptime_us = ts / 1000;
   data.count = value_buf.counter;
+  data.cpu = bpf_get_smp_processor_id();
   data.enabled_time_us = value_buf.enabled / 1000;
   data.running_time_us = value_buf.running / 1000;
   NAME.perf_submit(ctx, &data, sizeof(data));
@@ -62,13 +67,15 @@ class PerfData:
 
 
 class PerfBPFHook(BPFProgram):
+  # in hertz, lowered by hook selection to fit an overhead budget
+  sample_freq: int = 1000
 
   @classmethod
   def name(cls) -> str:
     return "perf"
 
   def __init__(self):
-    self._perf_data = dict[str, list[PerfData]]()
+    self._perf_data = dict[str, EventBuffer[PerfData]]()
     self.bpf_text = open(Path(__file__).parent / "../bpf/perf.bpf.c", "r").read()
     self.loaded_hw_event_configs = dict[type[PerfCollectionTable], int]()
     self.group_fds: dict[int, int] | None = None
@@ -79,13 +86,13 @@ class PerfBPFHook(BPFProgram):
         hw_config_value = CustomHWConfigManager.get_hw_config(perf_event)
         if hw_config_value is not None:
           self.bpf_text += PERF_HANDLER.replace("NAME", perf_event.name())
-          self._perf_data[perf_event.name()] = list[PerfData]()
+          self._perf_data[perf_event.name()] = EventBuffer(PerfData)
           self.loaded_hw_event_configs[perf_event] = hw_config_value
         else:
           print(f"info: could not enable perf counter for {perf_event.name()}")
       else:
         self.bpf_text += PERF_HANDLER.replace("NAME", perf_event.name())
-        self._perf_data[perf_event.name()] = list[PerfData]()
+        self._perf_data[perf_event.name()] = EventBuffer(PerfData)
         self.loaded_hw_event_configs[perf_event] = perf_event.ev_config()
 
     for perf_event in list(perf_table_types.values()):
@@ -122,17 +129,20 @@ class PerfBPFHook(BPFProgram):
 
   def load(self, collection_id: str):
     self.collection_id = collection_id
-    self.bpf = BPF(text = self.bpf_text)
-    # sample frequency is in hertz
+    self.bpf = self.compiled_bpf()
     for event, hw_config in self.loaded_hw_event_configs.items():
       self._attach_perf_event(
         ev_type=event.ev_type(),
         ev_config=hw_config,
         fn_name=bytes(f"{str(event.name())}_on", encoding="utf-8"),
-        sample_freq=1000,
+        sample_freq=self.sample_freq,
       )
+    self.open_buffers()
+
+  def open_buffers(self):
+    self.perf_buffers = PerfBuffers(self.bpf, self.name(), self.transport)
     for event_name in self._perf_data.keys():
-      self.bpf[event_name].open_perf_buffer(self._perf_handler(event_name), page_cnt=64)
+      self.perf_buffers.open(event_name, self._perf_handler(event_name), page_cnt=64)
 
   def disable_counters(self) -> None:
     if self.group_fds is None:
@@ -147,29 +157,39 @@ class PerfBPFHook(BPFProgram):
       ioctl(group_fd, PERF_EVENT_IOC_ENABLE, PERF_IOC_FLAG_GROUP)
 
   def poll(self):
-    self.bpf.perf_buffer_poll(timeout=POLL_TIMEOUT_MS)
+    self.perf_buffers.poll(timeout_ms=POLL_TIMEOUT_MS)
 
   def close(self):
     self.bpf.cleanup()
 
-  def data(self) -> list[CollectionTable]:
+  def buffers(self) -> Mapping[str, EventBuffer]:
+    return self._perf_data
+
+  @classmethod
+  def build_tables(cls, raw_data: Mapping[str, pl.DataFrame], collection_id: str) -> list[CollectionTable]:
     return [
       perf_table_types[event_name].from_df_id(
-        pl.DataFrame(self._perf_data[event_name]),
-        collection_id=self.collection_id,
+        raw_df,
+        collection_id=collection_id,
       )
-      for event_name in self._perf_data.keys()
-      if event_name in perf_table_types and len(self._perf_data[event_name]) > 0
+      for event_name, raw_df in raw_data.items()
+      if event_name in perf_table_types and len(raw_df) > 0
     ]
 
-  def clear(self):
-    for key in self._perf_data.keys():
-      self._perf_data[key].clear()
+  @classmethod
+  def synthetic_event(cls, table_name: str, seq: int) -> Any:
+    # counters only grow
+    return SimpleNamespace(
+      pid=seq, tgid=seq, ts_uptime_us=seq, count=seq * 1000, enabled_time_us=seq, running_time_us=seq,
+    )
 
-  def pop_data(self) -> list[CollectionTable]:
-    miss_tables = self.data()
-    self.clear()
-    return miss_tables
+  @classmethod
+  def raw_data_from_tables(cls, tables: Mapping[str, pl.DataFrame]) -> Mapping[str, pl.DataFrame]:
+    return {
+      event_name: tables[event_name]
+      for event_name in perf_table_types
+      if event_name in tables
+    }
 
   def _perf_handler(self, event_name: str):
     def _perf_event_handler(cpu, perf_event_data, size):
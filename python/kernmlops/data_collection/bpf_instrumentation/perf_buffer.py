@@ -0,0 +1,303 @@
+"""Perf buffers opened per CPU so records dropped by the kernel are accounted for."""
+
+import ctypes as ct
+import mmap
+import time
+from dataclasses import dataclass
+from typing import Final
+
+import polars as pl
+from bcc import BPF
+from bcc.libbcc import lib
+from bcc.table import _get_event_class
+from bcc.utils import get_online_cpus
+from data_collection.bpf_instrumentation.bpf_hook import BPFProgram
+from data_collection.bpf_instrumentation.event_buffer import EventBuffer
+from data_collection.bpf_instrumentation.raw_capture import (
+  RawCaptureDecoder,
+  RawCaptureLog,
+  event_spec,
+)
+from data_collection.bpf_instrumentation.transport import (
+  PERF_TRANSPORT,
+  PinnedBuffer,
+  Transport,
+  lost_counter_name,
+  record_cpu_reader,
+)
+from data_schema import CollectionLossTable, CollectionTable
+
+# perf_event_header plus the u32 size prefixed to every raw sample
+PERF_RECORD_HEADER_BYTES: Final[int] = 12
+
+# one event in this many is timed and stands for the others in `handler_ns`,
+# timing every event would add to the overhead it measures
+HANDLER_TIMING_INTERVAL: Final[int] = 64
+
+
+@dataclass(frozen=True)
+class LostSampleData:
+  hook: str
+  buffer: str
+  cpu: int
+  ts_uptime_us: int
+  lost_samples: int
+
+
+@dataclass
+class PerfBufferStats:
+  """Running counters for the buffer of one CPU, or the whole ring buffer with cpu -1.
+
+  `handler_ns` is estimated from one event in every `HANDLER_TIMING_INTERVAL`.
+  """
+  buffer: str
+  cpu: int
+  reader: int
+  capacity_bytes: int
+  events: int = 0
+  bytes: int = 0
+  handler_ns: int = 0
+
+
+class PerfBuffers:
+  """Opens the perf buffers of a hook and counts lost records per CPU and buffer.
+
+  bcc only reports how many records were lost to the `lost_cb`, not where, so
+  each CPU's buffer is opened with its own loss callback. Hooks using the ring
+  buffer `Transport` get one shared ring per output instead, its losses are
+  read from the per CPU counters the rewritten program keeps.
+
+  Opened on a `RawCaptureDecoder` instead of a loaded program, handlers are
+  registered with the decoder so a raw capture replays through them. With a
+  `pin_dir` in the transport, outputs are pinned and listed in `pinned` for
+  consumer processes, only ring buffer losses are still read here.
+  """
+
+  def __init__(self, bpf: BPF | RawCaptureDecoder, hook_name: str, transport: Transport = PERF_TRANSPORT):
+    self.bpf = bpf
+    self.hook_name = hook_name
+    self.transport = transport
+    self.losses = EventBuffer(LostSampleData)
+    self._lost_totals = dict[tuple[str, int], int]()
+    self._stats = list[PerfBufferStats]()
+    self._filled_bytes_mark = dict[tuple[str, int], int]()
+    self._ring_buffers = list[str]()
+    self._readers = (ct.c_void_p * 0)()
+    self.pinned = list[PinnedBuffer]()
+    self._raw_log: RawCaptureLog | None = None
+    if transport.raw_capture_dir is not None and not isinstance(bpf, RawCaptureDecoder):
+      self._raw_log = RawCaptureLog(transport.raw_capture_dir, hook_name)
+
+  def open(self, table_name: str, callback, *, page_cnt: int) -> None:
+    """Opens `table_name` with `page_cnt` pages per CPU unless the transport sizes it, as it does ring buffers."""
+    if isinstance(self.bpf, RawCaptureDecoder):
+      self.bpf.register(table_name, callback)
+      return
+    page_cnt = self.transport.output_page_cnt(table_name, page_cnt)
+    if self._raw_log is not None:
+      # records are copied out as is and decoded by `kernmlops collect decode`
+      event_type = _get_event_class(self.bpf[table_name])
+      callback = self._raw_log.record_writer(self._raw_log.add_buffer(table_name, event_type))
+    if self.transport.pin_dir is not None:
+      self._pin(table_name, page_cnt)
+      return
+    if self.transport.ring_buffer:
+      self._open_ring_buffer(table_name, callback)
+      return
+    if page_cnt & (page_cnt - 1) != 0:
+      raise ValueError(f"perf buffer page_cnt must be a power of two, got {page_cnt}")
+    table = self.bpf[table_name]
+    for cpu in get_online_cpus():
+      stats = PerfBufferStats(
+        buffer=table_name,
+        cpu=cpu,
+        reader=0,
+        capacity_bytes=page_cnt * mmap.PAGESIZE,
+      )
+      table._open_perf_buffer(
+        cpu,
+        self._event_handler(stats, callback),
+        page_cnt,
+        self._lost_handler(table_name, cpu),
+        1,
+      )
+      # bcc keys the readers of a table by (table id, cpu)
+      stats.reader = self.bpf.perf_buffers[(id(table), cpu)]
+      self._stats.append(stats)
+    self._readers = (ct.c_void_p * len(self.readers()))(*self.readers())
+
+  def consume(self) -> None:
+    """Handles every record already in the buffers without waiting."""
+    if self._readers:
+      lib.perf_reader_consume(len(self._readers), self._readers)
+    if self._ring_buffers:
+      if self.transport.pin_dir is None:
+        self.bpf.ring_buffer_consume()
+      self._collect_ring_buffer_losses()
+    if self._raw_log is not None:
+      self._raw_log.roll_if_full()
+
+  def poll(self, timeout_ms: int) -> None:
+    """Waits up to `timeout_ms` for records and handles them."""
+    if self._readers:
+      self.bpf.perf_buffer_poll(timeout=timeout_ms)
+    if self._ring_buffers:
+      if self.transport.pin_dir is None:
+        self.bpf.ring_buffer_poll(timeout=timeout_ms)
+      self._collect_ring_buffer_losses()
+    if self._raw_log is not None:
+      self._raw_log.roll_if_full()
+
+  def close(self) -> None:
+    """Flushes the raw capture, if any, once the buffers were drained."""
+    if self._raw_log is not None:
+      self._raw_log.close()
+
+  def ring_buffer_fds(self) -> list[int]:
+    """Ring buffers consumed here by their map fd, readable once the program woke the consumer.
+
+    Pinned rings are consumed by other processes, only their losses are read here.
+    """
+    if self.transport.pin_dir is not None:
+      return []
+    return [self.bpf[table_name].map_fd for table_name in self._ring_buffers]
+
+  def readers(self) -> list[int]:
+    """Perf buffer readers, ring buffers are consumed through bcc's ring buffer manager."""
+    return [stats.reader for stats in self._stats if stats.reader]
+
+  def stats(self) -> list[PerfBufferStats]:
+    return self._stats
+
+  def lost_samples(self) -> int:
+    return sum(self._lost_totals.values())
+
+  def take_fill_ratio(self) -> float:
+    """Largest fraction of a single CPU's buffer written since the last call.
+
+    The fullest buffer is the one that loses records first, so it decides how
+    soon the hook has to be polled again.
+    """
+    fill_ratio = 0.0
+    for stats in self._stats:
+      key = (stats.buffer, stats.cpu)
+      total_bytes = stats.bytes + stats.events * PERF_RECORD_HEADER_BYTES
+      written = total_bytes - self._filled_bytes_mark.get(key, 0)
+      self._filled_bytes_mark[key] = total_bytes
+      fill_ratio = max(fill_ratio, written / stats.capacity_bytes)
+    return fill_ratio
+
+  def _event_handler(self, stats: PerfBufferStats, callback):
+    perf_counter_ns = time.perf_counter_ns
+
+    def _counted_event_handler(cpu, data, size):
+      stats.events += 1
+      stats.bytes += size
+      if stats.events % HANDLER_TIMING_INTERVAL != 0:
+        callback(cpu, data, size)
+        return
+      start_ns = perf_counter_ns()
+      callback(cpu, data, size)
+      stats.handler_ns += (perf_counter_ns() - start_ns) * HANDLER_TIMING_INTERVAL
+    return _counted_event_handler
+
+  def _pin(self, table_name: str, page_cnt: int) -> None:
+    assert self.transport.pin_dir is not None
+    table = self.bpf[table_name]
+    pin_path = self.transport.pin_dir / self.hook_name / table_name
+    pin_path.parent.mkdir(parents=True, exist_ok=True)
+    lib.bpf_obj_pin.argtypes = [ct.c_int, ct.c_char_p]
+    if lib.bpf_obj_pin(table.map_fd, str(pin_path).encode()) < 0:
+      raise OSError(ct.get_errno(), f"could not pin {table_name} of {self.hook_name} to {pin_path}")
+    self.pinned.append(PinnedBuffer(
+      hook=self.hook_name,
+      table_name=table_name,
+      path=pin_path,
+      event=event_spec(_get_event_class(table)),
+      page_cnt=self.transport.ring_buffer_page_cnt(table_name) if self.transport.ring_buffer else page_cnt,
+      ring_buffer=self.transport.ring_buffer,
+    ))
+    if self.transport.ring_buffer:
+      # the lost counters stay with the program, consumers only read the ring
+      self._ring_buffers.append(table_name)
+
+  def _open_ring_buffer(self, table_name: str, callback) -> None:
+    stats = PerfBufferStats(
+      buffer=table_name,
+      cpu=-1,
+      reader=0,
+      capacity_bytes=self.transport.ring_buffer_page_cnt(table_name) * mmap.PAGESIZE,
+    )
+    table = self.bpf[table_name]
+    table.open_ring_buffer(self._ring_buffer_event_handler(stats, callback, _get_event_class(table)))
+    self._stats.append(stats)
+    self._ring_buffers.append(table_name)
+
+  def _ring_buffer_event_handler(self, stats: PerfBufferStats, callback, event_type):
+    event_handler = self._event_handler(stats, callback)
+    record_cpu = record_cpu_reader(event_type)
+
+    def _ring_buffer_handler(ctx, data, size):
+      event_handler(record_cpu(data), data, size)
+      return 0
+    return _ring_buffer_handler
+
+  def _collect_ring_buffer_losses(self) -> None:
+    for table_name in self._ring_buffers:
+      lost_counts = self.bpf[lost_counter_name(table_name)][ct.c_int(0)]
+      for cpu, lost_total in enumerate(lost_counts):
+        lost = lost_total - self._lost_totals.get((table_name, cpu), 0)
+        if lost > 0:
+          self._record_loss(table_name, cpu, lost)
+
+  def _lost_handler(self, table_name: str, cpu: int):
+    self._lost_totals[(table_name, cpu)] = 0
+
+    def _lost_samples_handler(lost: int):
+      self._record_loss(table_name, cpu, lost)
+    return _lost_samples_handler
+
+  def _record_loss(self, table_name: str, cpu: int, lost: int) -> None:
+    key = (table_name, cpu)
+    self._lost_totals[key] = self._lost_totals.get(key, 0) + lost
+    self.losses.append(LostSampleData(
+      hook=self.hook_name,
+      buffer=table_name,
+      cpu=cpu,
+      ts_uptime_us=int(time.clock_gettime_ns(time.CLOCK_BOOTTIME) / 1000),
+      lost_samples=lost,
+    ))
+
+
+def _perf_buffers(bpf_program: BPFProgram) -> PerfBuffers | None:
+  # sampling hooks never open perf buffers
+  return getattr(bpf_program, "perf_buffers", None)
+
+
+def pop_collection_loss(bpf_programs: list[BPFProgram]) -> list[CollectionTable]:
+  """Collects the losses recorded since the last call into a single `collection_loss` table."""
+  loss_tables = [
+    CollectionLossTable.from_df_id(
+      perf_buffers.losses.pop_frame(),
+      collection_id=bpf_program.collection_id,
+    ).table
+    for bpf_program in bpf_programs
+    if (perf_buffers := _perf_buffers(bpf_program)) is not None
+  ]
+  if not loss_tables:
+    return []
+  return [CollectionLossTable.from_df(pl.concat(loss_tables))]
+
+
+def close_perf_buffers(bpf_programs: list[BPFProgram]) -> None:
+  for bpf_program in bpf_programs:
+    if (perf_buffers := _perf_buffers(bpf_program)) is not None:
+      perf_buffers.close()
+
+
+def total_lost_samples(bpf_programs: list[BPFProgram]) -> int:
+  return sum(
+    perf_buffers.lost_samples()
+    for bpf_program in bpf_programs
+    if (perf_buffers := _perf_buffers(bpf_program)) is not None
+  )
@@ -0,0 +1,259 @@
+"""Event driven poller draining the perf buffers of every loaded BPFProgram."""
+
+import ctypes as ct
+import select
+import time
+from dataclasses import dataclass
+from typing import Mapping
+
+from bcc.libbcc import lib
+from data_collection.bpf_instrumentation.bpf_hook import BPFProgram
+from data_collection.bpf_instrumentation.overhead import CollectorOverhead
+from data_collection.bpf_instrumentation.perf_buffer import PerfBuffers
+
+
+def perf_readers(bpf_program: BPFProgram) -> Mapping[int, int]:
+  """Returns the perf buffer readers opened by a program keyed by file descriptor.
+
+  Programs without perf buffers, like sampling hooks, return nothing.
+  """
+  bpf = getattr(bpf_program, "bpf", None)
+  if bpf is None:
+    return {}
+  # bcc keys perf buffers by (table id, cpu) and holds the fd inside the reader
+  return {
+    lib.perf_reader_fd(reader): reader
+    for reader in bpf.perf_buffers.values()
+  }
+
+
+def ring_buffers(bpf_program: BPFProgram) -> Mapping[int, PerfBuffers]:
+  """Returns the `PerfBuffers` of a program keyed by the fd of each ring buffer it consumes."""
+  perf_buffers = getattr(bpf_program, "perf_buffers", None)
+  if not isinstance(perf_buffers, PerfBuffers):
+    return {}
+  return {fd: perf_buffers for fd in perf_buffers.ring_buffer_fds()}
+
+
+class EpollPoller:
+  """Waits on the perf and ring buffers of all hooks at once and drains only the ready ones.
+
+  Ring buffers are consumed without waiting once ready, those batching their
+  wakeups are also consumed every `sample_interval_sec` so records short of a
+  batch are not held back. Programs with neither, like `MemoryUsageHook`, are
+  polled on that timer through `BPFProgram.poll`.
+  """
+
+  def __init__(
+    self,
+    bpf_programs: list[BPFProgram],
+    *,
+    sample_interval_sec: float,
+    overhead: CollectorOverhead | None = None,
+  ):
+    self.sample_interval_sec = sample_interval_sec
+    self.overhead = overhead
+    self._epoll = select.epoll()
+    self._readers = dict[int, int]()
+    self._ring_buffers = dict[int, PerfBuffers]()
+    self._reader_hooks = dict[int, str]()
+    self._sampled_programs = list[BPFProgram]()
+    self._next_sample = time.monotonic()
+    for bpf_program in bpf_programs:
+      readers = perf_readers(bpf_program)
+      rings = ring_buffers(bpf_program)
+      if not readers and not rings:
+        self._sampled_programs.append(bpf_program)
+        continue
+      self._readers.update(readers)
+      self._ring_buffers.update(rings)
+      for fd in [*readers, *rings]:
+        self._reader_hooks[fd] = bpf_program.name()
+        self._epoll.register(fd, select.EPOLLIN)
+
+  def poll(self, timeout_sec: float) -> None:
+    """Waits at most `timeout_sec` for events and handles everything that became ready."""
+    now = time.monotonic()
+    if now >= self._next_sample:
+      self._sample()
+      self._next_sample = now + self.sample_interval_sec
+    if not self._reader_hooks:
+      time.sleep(max(0.0, min(timeout_sec, self._next_sample - now)))
+      return
+    wait_sec = max(0.0, min(timeout_sec, self._next_sample - now))
+    for fd, _ in self._epoll.poll(wait_sec):
+      self._consume(fd)
+
+  def drain(self) -> None:
+    """Empties every perf and ring buffer and takes a final sample without waiting."""
+    for fd in self._reader_hooks.keys():
+      self._consume(fd)
+    self._sample()
+
+  def close(self) -> None:
+    """Must be called before the programs are closed since they own the perf buffers."""
+    self._epoll.close()
+    self._readers.clear()
+    self._ring_buffers.clear()
+    self._reader_hooks.clear()
+
+  def _sample(self) -> None:
+    _sample_programs(self._sampled_programs, self.overhead)
+    # one fd per program is enough, consuming a ring empties every ring of its program
+    consumed = set[int]()
+    for fd, perf_buffers in self._ring_buffers.items():
+      if id(perf_buffers) not in consumed:
+        consumed.add(id(perf_buffers))
+        self._consume(fd)
+
+  def _consume(self, fd: int) -> None:
+    start_ns = time.perf_counter_ns()
+    if fd in self._readers:
+      _consume_reader(self._readers[fd])
+    else:
+      self._ring_buffers[fd].consume()
+    if self.overhead is not None:
+      self.overhead.add_poll(self._reader_hooks[fd], time.perf_counter_ns() - start_ns)
+
+
+def _consume_reader(reader: int) -> None:
+  readers = (ct.c_void_p * 1)(reader)
+  lib.perf_reader_consume(1, readers)
+
+
+def _sample_programs(bpf_programs: list[BPFProgram], overhead: CollectorOverhead | None) -> None:
+  for bpf_program in bpf_programs:
+    if not bpf_program.enabled:
+      continue
+    start_ns = time.perf_counter_ns()
+    bpf_program.poll()
+    if overhead is not None:
+      overhead.add_poll(bpf_program.name(), time.perf_counter_ns() - start_ns)
+
+
+@dataclass
+class _HookSchedule:
+  bpf_program: BPFProgram
+  perf_buffers: PerfBuffers
+  interval_sec: float
+  next_poll: float
+  last_poll: float
+  lost_samples: int = 0
+  # fraction of the fullest CPU buffer written per second, smoothed over polls
+  fill_rate: float = 0.0
+
+
+class AdaptivePoller:
+  """Polls each hook on its own interval, tuned from how fast its perf buffers fill.
+
+  Like `EpollPoller` a hook is polled as soon as its perf or ring buffers
+  wake the poller, the interval only bounds how long a hook goes without a
+  poll when nothing woke it, such as ring buffers batching wakeups. After every poll of a hook
+  the share of its fullest CPU buffer written since the previous poll gives
+  its fill rate, the next poll is scheduled for when the buffer is expected
+  to reach `target_fill`, bounded by `min_interval_sec` and
+  `max_interval_sec`. Lost records send the hook back to the shortest
+  interval. Hooks without perf buffers are sampled every `sample_interval_sec`.
+  """
+
+  def __init__(
+    self,
+    bpf_programs: list[BPFProgram],
+    *,
+    sample_interval_sec: float,
+    min_interval_sec: float,
+    max_interval_sec: float,
+    target_fill: float = 0.25,
+    overhead: CollectorOverhead | None = None,
+  ):
+    self.sample_interval_sec = sample_interval_sec
+    self.overhead = overhead
+    self.min_interval_sec = min_interval_sec
+    self.max_interval_sec = max(min_interval_sec, max_interval_sec)
+    self.target_fill = target_fill
+    self._schedules = list[_HookSchedule]()
+    self._sampled_programs = list[BPFProgram]()
+    self._epoll = select.epoll()
+    self._fd_schedules = dict[int, _HookSchedule]()
+    now = time.monotonic()
+    self._next_sample = now
+    for bpf_program in bpf_programs:
+      perf_buffers = getattr(bpf_program, "perf_buffers", None)
+      if not isinstance(perf_buffers, PerfBuffers):
+        self._sampled_programs.append(bpf_program)
+        continue
+      schedule = _HookSchedule(
+        bpf_program=bpf_program,
+        perf_buffers=perf_buffers,
+        interval_sec=self.min_interval_sec,
+        next_poll=now,
+        last_poll=now,
+      )
+      self._schedules.append(schedule)
+      for fd in [*perf_readers(bpf_program), *ring_buffers(bpf_program)]:
+        self._fd_schedules[fd] = schedule
+        self._epoll.register(fd, select.EPOLLIN)
+
+  def intervals(self) -> Mapping[str, float]:
+    """Current poll interval of every hook with perf buffers."""
+    return {
+      schedule.bpf_program.name(): schedule.interval_sec
+      for schedule in self._schedules
+    }
+
+  def poll(self, timeout_sec: float) -> None:
+    """Polls the hooks that are due then waits for data until the next one is, at most `timeout_sec`."""
+    now = time.monotonic()
+    if now >= self._next_sample:
+      self._sample()
+      self._next_sample = now + self.sample_interval_sec
+    for schedule in self._schedules:
+      if now >= schedule.next_poll:
+        self._poll_hook(schedule)
+    next_wakeup = min(
+      [schedule.next_poll for schedule in self._schedules] + [self._next_sample]
+    )
+    wait_sec = max(0.0, min(timeout_sec, next_wakeup - time.monotonic()))
+    # a hook with several ready buffers is polled once
+    ready = {
+      id(self._fd_schedules[fd]): self._fd_schedules[fd]
+      for fd, _ in self._epoll.poll(wait_sec)
+    }
+    for schedule in ready.values():
+      self._poll_hook(schedule)
+
+  def drain(self) -> None:
+    """Empties every perf buffer and takes a final sample without waiting."""
+    for schedule in self._schedules:
+      schedule.perf_buffers.consume()
+    self._sample()
+
+  def close(self) -> None:
+    """Must be called before the programs are closed since they own the perf buffers."""
+    self._epoll.close()
+    self._fd_schedules.clear()
+    self._schedules.clear()
+
+  def _sample(self) -> None:
+    _sample_programs(self._sampled_programs, self.overhead)
+
+  def _poll_hook(self, schedule: _HookSchedule) -> None:
+    start_ns = time.perf_counter_ns()
+    schedule.perf_buffers.consume()
+    if self.overhead is not None:
+      self.overhead.add_poll(schedule.bpf_program.name(), time.perf_counter_ns() - start_ns)
+    now = time.monotonic()
+    elapsed_sec = max(now - schedule.last_poll, 1e-6)
+    fill_rate = schedule.perf_buffers.take_fill_ratio() / elapsed_sec
+    schedule.fill_rate = (schedule.fill_rate + fill_rate) / 2
+    lost_samples = schedule.perf_buffers.lost_samples()
+    if lost_samples > schedule.lost_samples:
+      interval_sec = self.min_interval_sec
+    elif schedule.fill_rate > 0:
+      interval_sec = self.target_fill / schedule.fill_rate
+    else:
+      interval_sec = self.max_interval_sec
+    schedule.interval_sec = min(self.max_interval_sec, max(self.min_interval_sec, interval_sec))
+    schedule.lost_samples = lost_samples
+    schedule.last_poll = now
+    schedule.next_poll = now + schedule.interval_sec
@@ -9,6 +9,7 @@ import osquery
 import osquery.extensions
 import polars as pl
 from data_collection.bpf_instrumentation.bpf_hook import BPFProgram
+from data_collection.bpf_instrumentation.event_buffer import EventBuffer
 from data_schema import CollectionTable
 from data_schema.generic_table import ProcessMetadataTable
 from osquery.extensions.ttypes import ExtensionStatus
@@ -42,7 +43,7 @@ class ProcessMetadataHook(BPFProgram):
 
   def __init__(self):
     self.collector_pid = os.getpid()
-    self.process_metadata = list[Mapping[str, Any]]()
+    self.process_metadata = EventBuffer[Mapping[str, Any]]()
 
   def load(self, collection_id: str):
     self.collection_id = collection_id
@@ -57,7 +58,7 @@ class ProcessMetadataHook(BPFProgram):
     assert isinstance(initial_processes_query.status, ExtensionStatus)
     assert initial_processes_query.status.code == 0
     assert isinstance(initial_processes_query.response, list)
-    self.process_metadata = initial_processes_query.response
+    self.process_metadata.extend(initial_processes_query.response)
 
   def poll(self):
     new_processes_query = self.osquery_client.query(
@@ -73,14 +74,18 @@ class ProcessMetadataHook(BPFProgram):
     self.osquery_instance.instance.send_signal(signal.SIGINT)  # pyright: ignore [reportOptionalMemberAccess]
     self.osquery_instance.instance.wait()  # pyright: ignore [reportOptionalMemberAccess]
 
-  def data(self) -> list[CollectionTable]:
-    if len(self.process_metadata) == 0:
+  def buffers(self) -> Mapping[str, EventBuffer]:
+    return {
+      "process_metadata": self.process_metadata,
+    }
+
+  @classmethod
+  def build_tables(cls, raw_data: Mapping[str, pl.DataFrame], collection_id: str) -> list[CollectionTable]:
+    if len(raw_data["process_metadata"]) == 0:
         return []
     return [
       ProcessMetadataTable.from_df_id(
-        pl.DataFrame(
-          self.process_metadata
-        ).unique(
+        raw_data["process_metadata"].unique(
           "pid"
         ).cast({
           "pid": pl.Int64(),
@@ -91,14 +96,15 @@ class ProcessMetadataHook(BPFProgram):
           "parent": "parent_pid",
           "start_time": "start_time_unix_sec",
         }),
-        collection_id=self.collection_id,
+        collection_id=collection_id,
       )
     ]
 
-  def clear(self):
-    self.process_metadata.clear()
-
-  def pop_data(self) -> list[CollectionTable]:
-    process_table = self.data()
-    self.clear()
-    return process_table
+  @classmethod
+  def raw_data_from_tables(cls, tables: Mapping[str, pl.DataFrame]) -> Mapping[str, pl.DataFrame]:
+    return {
+      "process_metadata": tables[ProcessMetadataTable.name()].rename({
+        "parent_pid": "parent",
+        "start_time_unix_sec": "start_time",
+      }),
+    }
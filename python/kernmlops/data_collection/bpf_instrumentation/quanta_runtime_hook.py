@@ -1,9 +1,13 @@
 from dataclasses import dataclass
 from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Mapping
 
 import polars as pl
-from bcc import BPF
 from data_collection.bpf_instrumentation.bpf_hook import POLL_TIMEOUT_MS, BPFProgram
+from data_collection.bpf_instrumentation.event_buffer import EventBuffer
+from data_collection.bpf_instrumentation.kernel_features import kernel_struct_has_field
+from data_collection.bpf_instrumentation.perf_buffer import PerfBuffers
 from data_schema import UPTIME_TIMESTAMP, CollectionTable
 from data_schema.quanta_runtime import QuantaQueuedTable, QuantaRuntimeTable
 
@@ -29,7 +33,7 @@ class QuantaRuntimeBPFHook(BPFProgram):
     bpf_text = open(Path(__file__).parent / "bpf/sched_quanta_runtime.bpf.c", "r").read()
 
     # code substitutions
-    if BPF.kernel_struct_has_field(b'task_struct', b'__state') == 1:
+    if kernel_struct_has_field('task_struct', '__state'):
         bpf_text = bpf_text.replace('STATE_FIELD', '__state')
     else:
         bpf_text = bpf_text.replace('STATE_FIELD', 'state')
@@ -40,12 +44,12 @@ class QuantaRuntimeBPFHook(BPFProgram):
         bpf_text = bpf_text.replace('USE_TRACEPOINT', '1')
     else:
         bpf_text = bpf_text.replace('USE_TRACEPOINT', '0')
-    self.quanta_runtime_data = list[QuantaRuntimeData]()
-    self.quanta_queue_data = list[QuantaRuntimeData]()
+    self.quanta_runtime_data = EventBuffer(QuantaRuntimeData)
+    self.quanta_queue_data = EventBuffer(QuantaRuntimeData)
 
   def load(self, collection_id: str):
     self.collection_id = collection_id
-    self.bpf = BPF(text = self.bpf_text)
+    self.bpf = self.compiled_bpf()
     if not self.is_support_raw_tp:
       self.bpf.attach_kprobe(event=b"ttwu_do_activate", fn_name=b"trace_ttwu_do_wakeup")
       self.bpf.attach_kprobe(event=b"wake_up_new_task", fn_name=b"trace_wake_up_new_task")
@@ -53,40 +57,58 @@ class QuantaRuntimeBPFHook(BPFProgram):
         event_re=rb'^finish_task_switch$|^finish_task_switch\.isra\.\d$',
         fn_name=b"trace_run"
       )
-    self.bpf["quanta_runtimes"].open_perf_buffer(self._runtime_event_handler, page_cnt=64)
-    self.bpf["quanta_queue_times"].open_perf_buffer(self._queue_event_handler, page_cnt=64)
+    self.open_buffers()
+
+  def open_buffers(self):
+    self.perf_buffers = PerfBuffers(self.bpf, self.name(), self.transport)
+    self.perf_buffers.open("quanta_runtimes", self._runtime_event_handler, page_cnt=64)
+    self.perf_buffers.open("quanta_queue_times", self._queue_event_handler, page_cnt=64)
 
   def poll(self):
-    self.bpf.perf_buffer_poll(timeout=POLL_TIMEOUT_MS)
+    self.perf_buffers.poll(timeout_ms=POLL_TIMEOUT_MS)
 
   def close(self):
     self.bpf.cleanup()
 
-  def data(self) -> list[CollectionTable]:
+  def buffers(self) -> Mapping[str, EventBuffer]:
+    return {
+      "quanta_runtime": self.quanta_runtime_data,
+      "quanta_queue": self.quanta_queue_data,
+    }
+
+  @classmethod
+  def build_tables(cls, raw_data: Mapping[str, pl.DataFrame], collection_id: str) -> list[CollectionTable]:
     return [
       QuantaRuntimeTable.from_df_id(
-        pl.DataFrame(self.quanta_runtime_data).rename({
+        raw_data["quanta_runtime"].rename({
           "quanta_end_uptime_us": UPTIME_TIMESTAMP,
         }),
-        collection_id=self.collection_id,
+        collection_id=collection_id,
       ),
       QuantaQueuedTable.from_df_id(
-        pl.DataFrame(self.quanta_queue_data).rename({
+        raw_data["quanta_queue"].rename({
           "quanta_end_uptime_us": UPTIME_TIMESTAMP,
           "quanta_run_length_us": "quanta_queued_time_us",
         }),
-        collection_id=self.collection_id,
+        collection_id=collection_id,
       )
     ]
 
-  def clear(self):
-    self.quanta_runtime_data.clear()
-    self.quanta_queue_data.clear()
+  @classmethod
+  def synthetic_event(cls, table_name: str, seq: int) -> Any:
+    return SimpleNamespace(pid=seq, tgid=seq, quanta_end_uptime_us=seq, quanta_run_length_us=100)
 
-  def pop_data(self) -> list[CollectionTable]:
-    quanta_tables = self.data()
-    self.clear()
-    return quanta_tables
+  @classmethod
+  def raw_data_from_tables(cls, tables: Mapping[str, pl.DataFrame]) -> Mapping[str, pl.DataFrame]:
+    return {
+      "quanta_runtime": tables[QuantaRuntimeTable.name()].rename({
+        UPTIME_TIMESTAMP: "quanta_end_uptime_us",
+      }),
+      "quanta_queue": tables[QuantaQueuedTable.name()].rename({
+        UPTIME_TIMESTAMP: "quanta_end_uptime_us",
+        "quanta_queued_time_us": "quanta_run_length_us",
+      }),
+    }
 
   def _runtime_event_handler(self, cpu, quanta_runtime_perf_event, size):
     event = self.bpf["quanta_runtimes"].event(quanta_runtime_perf_event)
@@ -0,0 +1,227 @@
+"""Append only logs of raw perf records, decoded into tables after the collection."""
+
+import ctypes as ct
+import json
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Any, Callable, Final, Mapping
+
+import polars as pl
+from data_schema import CollectionWriter
+
+# buffer id and cpu of the record, then the size of the record bytes that follow
+RAW_RECORD_HEADER: Final[struct.Struct] = struct.Struct("<HHI")
+RAW_LOG_ROLL_BYTES: Final[int] = 64 * 1024 * 1024
+
+
+def event_spec(ctype: Any) -> Any:
+  """JSON description of a ctypes type as built by bcc for an output's events."""
+  if issubclass(ctype, ct.Array):
+    return {"array": event_spec(ctype._type_), "length": ctype._length_}
+  if issubclass(ctype, (ct.Structure, ct.Union)):
+    return {
+      "union": issubclass(ctype, ct.Union),
+      "pack": getattr(ctype, "_pack_", 0),
+      "fields": [
+        [field[0], event_spec(field[1]), *field[2:]]
+        for field in ctype._fields_
+      ],
+    }
+  return ctype.__name__
+
+
+def event_type_from_spec(name: str, spec: Any) -> Any:
+  if isinstance(spec, str):
+    return getattr(ct, spec)
+  if "array" in spec:
+    return event_type_from_spec(name, spec["array"]) * spec["length"]
+  attrs: dict[str, Any] = {
+    "_fields_": [
+      (field[0], event_type_from_spec(f"{name}_{field[0]}", field[1]), *field[2:])
+      for field in spec["fields"]
+    ],
+  }
+  if spec["pack"]:
+    attrs["_pack_"] = spec["pack"]
+  return type(name, (ct.Union if spec["union"] else ct.Structure,), attrs)
+
+
+class RawCaptureLog:
+  """Append only log of every record a hook's buffers receive, rolled by size.
+
+  Logs are named `{hook}.{num}.bin`, each record is a `RAW_RECORD_HEADER`
+  followed by the bytes the program submitted, so capturing a record is a
+  single copy out of the perf or ring buffer. `{hook}.json` names the hook's
+  buffers in id order along with the layout of their events.
+  """
+
+  def __init__(self, capture_dir: Path, hook_name: str, roll_size_bytes: int = RAW_LOG_ROLL_BYTES):
+    self.capture_dir = capture_dir
+    self.hook_name = hook_name
+    self.roll_size_bytes = roll_size_bytes
+    self._buffers = list[dict[str, Any]]()
+    self._file_num = 0
+    self.capture_dir.mkdir(parents=True, exist_ok=True)
+    self._log = open(self._log_path(), "wb")
+    self.write = self._log.write
+
+  def add_buffer(self, table_name: str, event_type: Any) -> int:
+    """Registers an output of the hook and returns the buffer id its records are logged with."""
+    self._buffers.append({"name": table_name, "event": event_spec(event_type)})
+    (self.capture_dir / f"{self.hook_name}.json").write_text(
+      json.dumps({"hook": self.hook_name, "buffers": self._buffers})
+    )
+    return len(self._buffers) - 1
+
+  def record_writer(self, buffer_id: int) -> Callable[[int, int, int], None]:
+    pack = RAW_RECORD_HEADER.pack
+    string_at = ct.string_at
+
+    def _raw_record_writer(cpu, data, size):
+      self.write(pack(buffer_id, cpu, size) + string_at(data, size))
+    return _raw_record_writer
+
+  def roll_if_full(self) -> None:
+    """Called between polls, so records never straddle two files."""
+    if self._log.tell() < self.roll_size_bytes:
+      return
+    self._log.close()
+    self._file_num += 1
+    self._log = open(self._log_path(), "wb")
+    self.write = self._log.write
+
+  def close(self) -> None:
+    self._log.close()
+
+  def _log_path(self) -> Path:
+    return self.capture_dir / f"{self.hook_name}.{self._file_num}.bin"
+
+
+class _DecodedTable:
+
+  def __init__(self, event_type: Any):
+    self.event_type = event_type
+
+  def event(self, data: memoryview | int) -> Any:
+    if isinstance(data, int):
+      # consumers handing over a record still in the perf or ring buffer
+      return ct.cast(data, ct.POINTER(self.event_type)).contents
+    return self.event_type.from_buffer_copy(data)
+
+
+class RawCaptureDecoder:
+  """Stands in for a hook's `BPF` object to replay logged records through the hook's own handlers.
+
+  Hooks open their buffers on the decoder the same way they do on a loaded
+  program, `PerfBuffers` registers each handler here instead of with bcc.
+  """
+
+  def __init__(self, sidecar: Mapping[str, Any]):
+    self.buffer_names = [buffer["name"] for buffer in sidecar["buffers"]]
+    self._tables = {
+      buffer["name"]: _DecodedTable(event_type_from_spec(buffer["name"], buffer["event"]))
+      for buffer in sidecar["buffers"]
+    }
+    self._handlers = dict[str, Callable]()
+
+  def __getitem__(self, table_name: str) -> _DecodedTable:
+    return self._tables[table_name]
+
+  def register(self, table_name: str, callback: Callable) -> None:
+    self._handlers[table_name] = callback
+
+  def handler(self, table_name: str) -> Callable | None:
+    return self._handlers.get(table_name)
+
+  def replay(self, log_path: Path) -> int:
+    """Feeds every record of a log to its handler, returns the number of records."""
+    handlers = [self._handlers.get(buffer_name) for buffer_name in self.buffer_names]
+    raw_log = memoryview(log_path.read_bytes())
+    unpack_from = RAW_RECORD_HEADER.unpack_from
+    offset, records = 0, 0
+    while offset < len(raw_log):
+      buffer_id, cpu, size = unpack_from(raw_log, offset)
+      offset += RAW_RECORD_HEADER.size
+      handler = handlers[buffer_id]
+      if handler is not None:
+        handler(cpu, raw_log[offset:offset + size], size)
+      offset += size
+      records += 1
+    return records
+
+
+def _decode_log(hook_name: str, sidecar: Mapping[str, Any], log_path: Path) -> Mapping[str, pl.DataFrame]:
+  # imported here since the hooks themselves import this module
+  from data_collection.bpf_instrumentation import all_hooks
+
+  decoder = RawCaptureDecoder(sidecar)
+  hook = all_hooks[hook_name]()
+  # handlers look up events through self.bpf, exactly as they do while collecting
+  hook.bpf = decoder  # pyright: ignore [reportAttributeAccessIssue]
+  hook.open_buffers()
+  decoder.replay(log_path)
+  return hook.pop_raw_data()
+
+
+def _log_num(log_path: Path) -> int:
+  return int(log_path.suffixes[-2].removeprefix("."))
+
+
+def raw_logs(capture_dir: Path, hook_name: str) -> list[Path]:
+  """Logs of `hook_name` in `capture_dir`, in capture order."""
+  return sorted(capture_dir.glob(f"{hook_name}.*.bin"), key=_log_num)
+
+
+def decode_raw_capture(
+  collection_dir: Path,
+  *,
+  collection_id: str,
+  roll_size_bytes: int,
+  roll_interval_sec: float,
+  jobs: int | None = None,
+  ids: tuple[int, int] | None = None,
+) -> list[str]:
+  """Decodes the raw logs under `collection_dir/raw` into the collection's parquet tables.
+
+  Logs are decoded in parallel, each hook's rows are then joined and written
+  in capture order by this process. Returns the names of the decoded hooks.
+  """
+  from data_collection.bpf_instrumentation import all_hooks
+
+  capture_dir = collection_dir / "raw"
+  sidecars = {
+    sidecar_path.stem: json.loads(sidecar_path.read_text())
+    for sidecar_path in sorted(capture_dir.glob("*.json"))
+  }
+  writer = CollectionWriter(
+    output_dir=collection_dir,
+    roll_size_bytes=roll_size_bytes,
+    roll_interval_sec=roll_interval_sec,
+    ids=ids,
+  )
+  # polars is not fork safe, see WriterProcess
+  with ProcessPoolExecutor(max_workers=jobs, mp_context=get_context("spawn")) as executor:
+    decoding = {
+      hook_name: [
+        executor.submit(_decode_log, hook_name, sidecar, log_path)
+        for log_path in raw_logs(capture_dir, hook_name)
+      ]
+      for hook_name, sidecar in sidecars.items()
+    }
+    for hook_name, decoded_logs in decoding.items():
+      raw_frames = dict[str, list[pl.DataFrame]]()
+      for decoded_log in decoded_logs:
+        for buffer_name, raw_df in decoded_log.result().items():
+          raw_frames.setdefault(buffer_name, []).append(raw_df)
+      raw_data = {
+        buffer_name: pl.concat(frames, how="diagonal_relaxed")
+        for buffer_name, frames in raw_frames.items()
+      }
+      if not raw_data:
+        continue
+      for collection_table in all_hooks[hook_name].build_tables(raw_data, collection_id):
+        writer.write(collection_table)
+  writer.close()
+  return list(decoding.keys())
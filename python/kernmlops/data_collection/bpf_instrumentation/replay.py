@@ -0,0 +1,172 @@
+"""Replays a recorded collection through a hook's buffers and table builders."""
+
+import json
+import time
+from pathlib import Path
+from typing import Any, Final, Iterator, Mapping
+
+import polars as pl
+from data_collection.bpf_instrumentation.bpf_hook import BPFProgram
+from data_collection.bpf_instrumentation.event_buffer import EventBuffer
+from data_collection.bpf_instrumentation.raw_capture import RawCaptureDecoder, raw_logs
+from data_schema import UPTIME_TIMESTAMP, CollectionTable
+from data_schema.schema import collection_id_column
+
+# rows appended to each buffer per poll when replaying as fast as possible
+REPLAY_BATCH_ROWS: Final[int] = 64 * 1024
+
+
+class RecordedTables(Mapping[str, pl.DataFrame]):
+  """Tables of a collection directory, each read on first use without its `collection_id` column."""
+
+  def __init__(self, collection_dir: Path):
+    self._paths = dict[str, list[tuple[int, Path]]]()
+    for parquet_path in collection_dir.glob("*.parquet"):
+      # written as {table}.{num}.parquet by the collection writers
+      table_name, file_num, _ = parquet_path.name.split(".")
+      self._paths.setdefault(table_name, []).append((int(file_num), parquet_path))
+    self._tables = dict[str, pl.DataFrame]()
+
+  def __getitem__(self, table_name: str) -> pl.DataFrame:
+    if table_name not in self._tables:
+      self._tables[table_name] = pl.concat(
+        [pl.read_parquet(parquet_path) for _, parquet_path in sorted(self._paths[table_name])],
+        how="diagonal_relaxed",
+      ).drop(collection_id_column(), strict=False)
+    return self._tables[table_name]
+
+  def __iter__(self) -> Iterator[str]:
+    return iter(self._paths)
+
+  def __len__(self) -> int:
+    return len(self._paths)
+
+
+def _recorded_time_us(raw_df: pl.DataFrame) -> pl.Expr | None:
+  """When each row was recorded, None for buffers whose rows carry no time."""
+  if UPTIME_TIMESTAMP in raw_df.columns:
+    return pl.col(UPTIME_TIMESTAMP)
+  for column in raw_df.columns:
+    if column.endswith("_uptime_us"):
+      return pl.col(column)
+  for column in raw_df.columns:
+    if column.endswith("_ts_ns"):
+      return pl.col(column) // 1000
+  return None
+
+
+class ReplayHook(BPFProgram):
+  """Stands in for `hook_type` by feeding the rows of a recorded collection through its buffers.
+
+  Collections captured with `raw_capture` are replayed from their raw logs,
+  one log at a time as the replay reaches it: the records are decoded by a
+  `RawCaptureDecoder` and handled by the handlers of a `hook_type` instance,
+  as when collecting. Otherwise `hook_type.raw_data_from_tables` recovers
+  the raw rows of each buffer from the collection's tables, which skips the
+  handlers. Rows are appended once the replay clock passes the time they
+  were recorded at, running `speed` times as fast as the recording. With
+  `speed` 0 every poll appends the next `REPLAY_BATCH_ROWS` of each buffer
+  instead. Nothing is loaded so replays need no privileges, but the hook
+  modules still import bcc. Tables are built by `hook_type` as when
+  collecting.
+  """
+
+  def __init__(self, hook_type: type[BPFProgram], collection_dir: Path, speed: float = 1.0):
+    self.hook_type = hook_type
+    self.collection_dir = collection_dir
+    self.speed = speed
+    self._raw_data = dict[str, pl.DataFrame]()
+    self._times_us = dict[str, pl.Series | None]()
+    self._replayed = dict[str, int]()
+    self._buffers = dict[str, EventBuffer]()
+    self._raw_logs = list[Path]()
+    self._capture_hook: BPFProgram | None = None
+    self._start_us = 0
+    self._started_at = 0.0
+
+  def name(self) -> str:  # pyright: ignore [reportIncompatibleMethodOverride]
+    return self.hook_type.name()
+
+  def load(self, collection_id: str):
+    self.collection_id = collection_id
+    sidecar_path = self.collection_dir / "raw" / f"{self.name()}.json"
+    if sidecar_path.is_file():
+      self._raw_logs = raw_logs(sidecar_path.parent, self.name())
+      decoder = RawCaptureDecoder(json.loads(sidecar_path.read_text()))
+      self._capture_hook = self.hook_type()
+      # handlers look up events through self.bpf, exactly as they do while collecting
+      self._capture_hook.bpf = decoder  # pyright: ignore [reportAttributeAccessIssue]
+      self._capture_hook.open_buffers()
+      self._decode_next_log()
+    else:
+      try:
+        raw_data = self.hook_type.raw_data_from_tables(RecordedTables(self.collection_dir))
+      except KeyError as e:
+        raise ValueError(f"{self.collection_dir} has no {e} table to replay {self.name()} from") from e
+      if raw_data is None:
+        raise ValueError(f"{self.name()} cannot be replayed, it does not implement raw_data_from_tables")
+      self._set_raw_data(raw_data)
+    first_times_us = [
+      times_us.min() for times_us in self._times_us.values()
+      if times_us is not None and len(times_us) > 0
+    ]
+    self._start_us = min(first_times_us) if first_times_us else 0  # pyright: ignore [reportAttributeAccessIssue]
+    self._started_at = time.monotonic()
+
+  def _decode_next_log(self) -> None:
+    assert self._capture_hook is not None
+    log_path = self._raw_logs.pop(0) if self._raw_logs else None
+    if log_path is not None:
+      getattr(self._capture_hook, "bpf").replay(log_path)
+    self._set_raw_data(self._capture_hook.pop_raw_data())
+
+  def _set_raw_data(self, raw_data: Mapping[str, pl.DataFrame]) -> None:
+    for buffer_name, raw_df in raw_data.items():
+      recorded_time_us = _recorded_time_us(raw_df)
+      times_us = None
+      if recorded_time_us is not None:
+        raw_df = raw_df.sort(recorded_time_us, maintain_order=True)
+        times_us = raw_df.select(recorded_time_us).to_series()
+      self._raw_data[buffer_name] = raw_df
+      self._times_us[buffer_name] = times_us
+      self._replayed[buffer_name] = 0
+      if buffer_name not in self._buffers:
+        self._buffers[buffer_name] = EventBuffer(schema=raw_df.schema)
+
+  def _log_replayed(self) -> bool:
+    return all(self._replayed[buffer_name] == len(raw_df) for buffer_name, raw_df in self._raw_data.items())
+
+  def poll(self):
+    replay_until_us = self._start_us + (time.monotonic() - self._started_at) * 1_000_000 * self.speed
+    for buffer_name, buffer in self._buffers.items():
+      raw_df, times_us, replayed = self._raw_data[buffer_name], self._times_us[buffer_name], self._replayed[buffer_name]
+      if self.speed <= 0 or times_us is None:
+        due = min(replayed + REPLAY_BATCH_ROWS, len(raw_df))
+      else:
+        due = int(times_us.search_sorted(int(replay_until_us), side="right"))
+      if due > replayed:
+        buffer.extend(raw_df.slice(replayed, due - replayed).iter_rows())
+        self._replayed[buffer_name] = due
+    if self._raw_logs and self._log_replayed():
+      # logs are rolled in capture order, the next one starts about where this one ended
+      self._decode_next_log()
+
+  def finished(self) -> bool:
+    """Whether every recorded row has been replayed."""
+    return not self._raw_logs and self._log_replayed()
+
+  def close(self):
+    pass
+
+  def buffers(self) -> Mapping[str, EventBuffer]:
+    return self._buffers
+
+  def build_tables(  # pyright: ignore [reportIncompatibleMethodOverride]
+    self, raw_data: Mapping[str, pl.DataFrame], collection_id: str,
+  ) -> list[CollectionTable]:
+    return self.hook_type.build_tables(raw_data, collection_id)
+
+  def build_streaming_tables(  # pyright: ignore [reportIncompatibleMethodOverride]
+    self, raw_data: Mapping[str, pl.DataFrame], collection_id: str, joins: dict[str, Any],
+  ) -> list[CollectionTable]:
+    return self.hook_type.build_streaming_tables(raw_data, collection_id, joins)
@@ -0,0 +1,176 @@
+"""Selects how a hook's events leave the kernel: per CPU perf buffers or one shared ring buffer."""
+
+import ctypes as ct
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Final, Mapping
+
+# header the kernel puts in front of every ring buffer record
+RING_BUFFER_HEADER_BYTES: Final[int] = 8
+
+# ring buffers are shared by every CPU, events that report the CPU they were
+# submitted on carry it in a field of this name
+RECORD_CPU_FIELD: Final[str] = "cpu"
+
+# every program is compiled with one shared control array, its entry points return
+# early through KERNMLOPS_RETURN_IF_DISABLED while the slot holds a nonzero value,
+# return and completion probes only skip submitting through kernmlops_disabled so
+# they still clear the state their entry points stored before the hook was disabled
+CONTROL_MAP: Final[str] = "kernmlops_control"
+_CONTROL_TEXT: Final[str] = f"""
+BPF_ARRAY({CONTROL_MAP}, u32, 1);
+static inline bool kernmlops_disabled() {{
+  int zero = 0;
+  u32 *disabled = {CONTROL_MAP}.lookup(&zero);
+  return disabled && *disabled;
+}}
+#define KERNMLOPS_RETURN_IF_DISABLED() if (kernmlops_disabled()) return 0
+"""
+
+_PERF_OUTPUT: Final[re.Pattern] = re.compile(r"BPF_PERF_OUTPUT\(\s*(\w+)\s*\);")
+_PERF_SUBMIT: Final[re.Pattern] = re.compile(r"(\w+)\.perf_submit\(")
+_HASH_MAP: Final[re.Pattern] = re.compile(r"BPF_(?:LRU_|PERCPU_)?HASH\(\s*(\w+)\s*[,)]")
+
+
+def lost_counter_name(table_name: str) -> str:
+  return f"kernmlops_lost_{table_name}"
+
+
+def hash_map_names(bpf_text: str) -> list[str]:
+  """Hash maps declared by a program, where its probes keep state between events."""
+  return _HASH_MAP.findall(bpf_text)
+
+
+def _wakeup_counter_name(table_name: str) -> str:
+  return f"kernmlops_wakeup_{table_name}"
+
+
+def record_cpu_reader(event_type: Any) -> Callable[[int], int]:
+  """Reads the CPU of a ring buffer record of `event_type` from its `RECORD_CPU_FIELD`, -1 without one."""
+  cpu_field = getattr(event_type, RECORD_CPU_FIELD, None)
+  if cpu_field is None:
+    return lambda data: -1
+  offset = cpu_field.offset
+
+  def _record_cpu(data: int) -> int:
+    return ct.c_uint32.from_address(data + offset).value
+  return _record_cpu
+
+
+def _split_args(args: str) -> list[str]:
+  split_args, depth, start = list[str](), 0, 0
+  for i, char in enumerate(args):
+    if char in "([{":
+      depth += 1
+    elif char in ")]}":
+      depth -= 1
+    elif char == "," and depth == 0:
+      split_args.append(args[start:i].strip())
+      start = i + 1
+  split_args.append(args[start:].strip())
+  return split_args
+
+
+@dataclass(frozen=True)
+class Transport:
+  """Perf buffers by default, otherwise a `BPF_RINGBUF_OUTPUT` of `page_cnt` pages per output.
+
+  Ring buffer records are the program's own typed events passed to
+  `ringbuf_output`, so bcc decodes them with `.event()` as it does perf
+  records, a failed output counts as a lost record in a per CPU array.
+  Handlers get the CPU from the event's `RECORD_CPU_FIELD`, or -1. With `wakeup_events` set, a CPU
+  only wakes the consumer every `wakeup_events` records, otherwise the kernel
+  decides, the collector's own polls pick up anything in between.
+
+  With `raw_capture_dir` set, records are not decoded while collecting but
+  appended to `RawCaptureLog`s in that directory, for either transport. With
+  `pin_dir` set, outputs are pinned there for a `ConsumerPool` to read instead.
+  `page_cnts` sizes single outputs by name, overriding both the pages a hook
+  passes to `PerfBuffers.open` and `page_cnt`, `min_page_cnts` only raises
+  them.
+  """
+
+  ring_buffer: bool = False
+  page_cnt: int = 1024
+  wakeup_events: int = 0
+  raw_capture_dir: Path | None = None
+  pin_dir: Path | None = None
+  page_cnts: Mapping[str, int] = field(default_factory=dict, hash=False)
+  min_page_cnts: Mapping[str, int] = field(default_factory=dict, hash=False)
+
+  def output_page_cnt(self, table_name: str, page_cnt: int) -> int:
+    """Pages of `table_name` when its hook asks for `page_cnt`."""
+    return max(self.page_cnts.get(table_name, page_cnt), self.min_page_cnts.get(table_name, 0))
+
+  def ring_buffer_page_cnt(self, table_name: str) -> int:
+    return self.output_page_cnt(table_name, self.page_cnt)
+
+  def bpf_text(self, bpf_text: str) -> str:
+    """Adds the control array and rewrites the perf outputs of a program to ring buffers when selected."""
+    bpf_text = _CONTROL_TEXT + bpf_text
+    if not self.ring_buffer:
+      return bpf_text
+    bpf_text = _PERF_OUTPUT.sub(self._ring_buffer_output, bpf_text)
+    return self._rewrite_submits(bpf_text)
+
+  def _ring_buffer_output(self, match: re.Match) -> str:
+    table_name = match.group(1)
+    output = (
+      f"BPF_RINGBUF_OUTPUT({table_name}, {self.ring_buffer_page_cnt(table_name)});\n"
+      f"BPF_PERCPU_ARRAY({lost_counter_name(table_name)}, u64, 1);"
+    )
+    if self.wakeup_events > 0:
+      output += f"\nBPF_PERCPU_ARRAY({_wakeup_counter_name(table_name)}, u64, 1);"
+    return output
+
+  def _rewrite_submits(self, bpf_text: str) -> str:
+    rewritten, end = list[str](), 0
+    for match in _PERF_SUBMIT.finditer(bpf_text):
+      if match.start() < end:
+        continue
+      depth, args_end = 1, match.end()
+      while depth > 0:
+        depth += {"(": 1, ")": -1}.get(bpf_text[args_end], 0)
+        args_end += 1
+      statement_end = bpf_text.index(";", args_end) + 1
+      _, data, size = _split_args(bpf_text[match.end():args_end - 1])
+      rewritten.append(bpf_text[end:match.start()])
+      rewritten.append(self._ring_buffer_submit(match.group(1), data, size))
+      end = statement_end
+    rewritten.append(bpf_text[end:])
+    return "".join(rewritten)
+
+  def _ring_buffer_submit(self, table_name: str, data: str, size: str) -> str:
+    flags = "0"
+    wakeup = ""
+    if self.wakeup_events > 0:
+      wakeup = (
+        f"u64 *__kernmlops_wakeups = {_wakeup_counter_name(table_name)}.lookup(&__kernmlops_zero); "
+        f"u64 __kernmlops_flags = BPF_RB_NO_WAKEUP; "
+        f"if (__kernmlops_wakeups && ++(*__kernmlops_wakeups) % {self.wakeup_events} == 0) "
+        f"__kernmlops_flags = BPF_RB_FORCE_WAKEUP; "
+      )
+      flags = "__kernmlops_flags"
+    return (
+      "{ "
+      "int __kernmlops_zero = 0; "
+      f"{wakeup}"
+      f"if ({table_name}.ringbuf_output({data}, {size}, {flags}) != 0) "
+      f"{lost_counter_name(table_name)}.increment(__kernmlops_zero); "
+      "}"
+    )
+
+
+PERF_TRANSPORT: Final[Transport] = Transport()
+
+
+@dataclass(frozen=True)
+class PinnedBuffer:
+  """An output pinned to bpffs, along with what a consumer process needs to open and decode it."""
+  hook: str
+  table_name: str
+  path: Path
+  event: Any
+  page_cnt: int
+  ring_buffer: bool
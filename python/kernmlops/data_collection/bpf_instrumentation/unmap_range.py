@@ -1,9 +1,12 @@
 from dataclasses import dataclass
 from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Mapping
 
 import polars as pl
-from bcc import BPF
 from data_collection.bpf_instrumentation.bpf_hook import POLL_TIMEOUT_MS, BPFProgram
+from data_collection.bpf_instrumentation.event_buffer import EventBuffer
+from data_collection.bpf_instrumentation.perf_buffer import PerfBuffers
 from data_schema import CollectionTable
 from data_schema.generic_table import UnmapRangeDataTable
 
@@ -25,36 +28,46 @@ class UnmapRangeBPFHook(BPFProgram):
   def __init__(self):
     self.is_support_raw_tp = True #  BPF.support_raw_tracepoint()
     self.bpf_text = open(Path(__file__).parent / "bpf/unmap_range.bpf.c", "r").read()
-    self.unmap_range_stat = list[UnmapRangeStat]()
+    self.unmap_range_stat = EventBuffer(UnmapRangeStat)
 
   def load(self, collection_id: str):
     self.collection_id = collection_id
-    self.bpf = BPF(text = self.bpf_text)
+    self.bpf = self.compiled_bpf()
     self.bpf.attach_kprobe(event=b"unmap_page_range", fn_name=b"kprobe__unmap_page_range")
     self.bpf.attach_kprobe(event=b"__unmap_hugepage_range", fn_name=b"kprobe__unmap_hugepage_range")
-    self.bpf["unmap_range_output"].open_perf_buffer(self._unmap_range_eh, page_cnt=64)
+    self.open_buffers()
+
+  def open_buffers(self):
+    self.perf_buffers = PerfBuffers(self.bpf, self.name(), self.transport)
+    self.perf_buffers.open("unmap_range_output", self._unmap_range_eh, page_cnt=64)
 
   def poll(self):
-    self.bpf.perf_buffer_poll(timeout=POLL_TIMEOUT_MS)
+    self.perf_buffers.poll(timeout_ms=POLL_TIMEOUT_MS)
 
   def close(self):
     self.bpf.cleanup()
 
-  def data(self) -> list[CollectionTable]:
+  def buffers(self) -> Mapping[str, EventBuffer]:
+    return {
+      "unmap_range": self.unmap_range_stat,
+    }
+
+  @classmethod
+  def build_tables(cls, raw_data: Mapping[str, pl.DataFrame], collection_id: str) -> list[CollectionTable]:
     return [
             UnmapRangeDataTable.from_df_id(
-                pl.DataFrame(self.unmap_range_stat),
-                collection_id=self.collection_id,
+                raw_data["unmap_range"],
+                collection_id=collection_id,
             ),
         ]
 
-  def clear(self):
-    self.unmap_range_stat.clear()
+  @classmethod
+  def synthetic_event(cls, table_name: str, seq: int) -> Any:
+    return SimpleNamespace(tgid=seq, ts_ns=seq, start=seq * 4096, end=seq * 4096 + 4096, huge=seq & 1)
 
-  def pop_data(self) -> list[CollectionTable]:
-    tables = self.data()
-    self.clear()
-    return tables
+  @classmethod
+  def raw_data_from_tables(cls, tables: Mapping[str, pl.DataFrame]) -> Mapping[str, pl.DataFrame]:
+    return {"unmap_range": tables[UnmapRangeDataTable.name()]}
 
   def _unmap_range_eh(self, cpu, unmap_range_struct, size):
       event = self.bpf["unmap_range_output"].event(unmap_range_struct)
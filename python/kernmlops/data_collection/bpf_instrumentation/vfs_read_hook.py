@@ -1,9 +1,12 @@
 from dataclasses import dataclass
 from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Mapping
 
 import polars as pl
-from bcc import BPF
 from data_collection.bpf_instrumentation.bpf_hook import POLL_TIMEOUT_MS, BPFProgram
+from data_collection.bpf_instrumentation.event_buffer import EventBuffer
+from data_collection.bpf_instrumentation.perf_buffer import PerfBuffers
 from data_schema import CollectionTable
 from data_schema.vfs_read import (
     VFSReadDataTable,  # We defined this schema separately
@@ -32,11 +35,11 @@ class VFSReadBPFHook(BPFProgram):
 
     def __init__(self):
         self.bpf_text = open(Path(__file__).parent / "bpf/vfs_read.bpf.c", "r").read()
-        self.trace_process: list[VFSReadEvent] = []
+        self.trace_process = EventBuffer(VFSReadEvent)
 
     def load(self, collection_id: str):
         self.collection_id = collection_id
-        self.bpf = BPF(text=self.bpf_text)
+        self.bpf = self.compiled_bpf()
 
         # Match updated function names from vfs_read.bpf.c
         self.bpf.attach_kprobe(event=b"vfs_read", fn_name=b"trace_vfs_read_entry")
@@ -48,29 +51,42 @@ class VFSReadBPFHook(BPFProgram):
         self.bpf.attach_kprobe(event=b"vfs_read+0x11d", fn_name=b"trace_add_rchar")
 
 
-        self.bpf["vfs_read_events"].open_perf_buffer(self.vfs_read_eh, page_cnt=128)
+        self.open_buffers()
+
+    def open_buffers(self):
+        self.perf_buffers = PerfBuffers(self.bpf, self.name(), self.transport)
+        self.perf_buffers.open("vfs_read_events", self.vfs_read_eh, page_cnt=128)
 
     def poll(self):
-        self.bpf.perf_buffer_poll(timeout=POLL_TIMEOUT_MS)
+        self.perf_buffers.poll(timeout_ms=POLL_TIMEOUT_MS)
 
     def close(self):
         self.bpf.cleanup()
 
-    def data(self) -> list[CollectionTable]:
+    def buffers(self) -> Mapping[str, EventBuffer]:
+        return {
+            "vfs_read": self.trace_process,
+        }
+
+    @classmethod
+    def build_tables(cls, raw_data: Mapping[str, pl.DataFrame], collection_id: str) -> list[CollectionTable]:
         return [
             VFSReadDataTable.from_df_id(
-                pl.DataFrame(self.trace_process),
-                collection_id=self.collection_id,
+                raw_data["vfs_read"],
+                collection_id=collection_id,
             )
         ]
 
-    def clear(self):
-        self.trace_process.clear()
+    @classmethod
+    def synthetic_event(cls, table_name: str, seq: int) -> Any:
+        return SimpleNamespace(
+            pid=seq, tgid=seq, comm=b"kernmlops", count=4096, buf=seq, ret=4096,
+            has_read=1, has_read_iter=0, which_read=0, success=1, ts_ns=seq,
+        )
 
-    def pop_data(self) -> list[CollectionTable]:
-        tables = self.data()
-        self.clear()
-        return tables
+    @classmethod
+    def raw_data_from_tables(cls, tables: Mapping[str, pl.DataFrame]) -> Mapping[str, pl.DataFrame]:
+        return {"vfs_read": tables[VFSReadDataTable.name()]}
 
     def vfs_read_eh(self, cpu, data, size):
         event = self.bpf["vfs_read_events"].event(data)
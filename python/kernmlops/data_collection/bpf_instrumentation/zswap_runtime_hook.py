@@ -1,9 +1,12 @@
 from dataclasses import dataclass
 from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Mapping
 
 import polars as pl
-from bcc import BPF
 from data_collection.bpf_instrumentation.bpf_hook import POLL_TIMEOUT_MS, BPFProgram
+from data_collection.bpf_instrumentation.event_buffer import EventBuffer
+from data_collection.bpf_instrumentation.perf_buffer import PerfBuffers
 from data_schema import CollectionTable
 from data_schema.generic_table import ZswapRuntimeDataTable
 
@@ -24,42 +27,52 @@ class ZswapRuntimeBPFHook(BPFProgram):
 
   def __init__(self):
     self.bpf_text = open(Path(__file__).parent / "bpf/zswap_runtime.bpf.c", "r").read()
-    self.trace_process = list[ZswapRuntimeStat]()
+    self.trace_process = EventBuffer(ZswapRuntimeStat)
 
   def load(self, collection_id: str):
     self.collection_id = collection_id
-    self.bpf = BPF(text = self.bpf_text)
+    self.bpf = self.compiled_bpf()
     self.bpf.attach_kprobe(event=b"zswap_store", fn_name=b"trace_zswap_store_entry")
     self.bpf.attach_kretprobe(event=b"zswap_store", fn_name=b"trace_zswap_store_return")
     self.bpf.attach_kprobe(event=b"zswap_load", fn_name=b"trace_zswap_load_entry")
     self.bpf.attach_kretprobe(event=b"zswap_load", fn_name=b"trace_zswap_load_return")
     self.bpf.attach_kprobe(event=b"zswap_invalidate", fn_name=b"trace_zswap_invalidate_entry")
     self.bpf.attach_kretprobe(event=b"zswap_invalidate", fn_name=b"trace_zswap_invalidate_return")
-    self.bpf["zswap_store_events"].open_perf_buffer(self._zswap_store_eh, page_cnt=128)
-    self.bpf["zswap_load_events"].open_perf_buffer(self._zswap_load_eh, page_cnt=128)
-    self.bpf["zswap_invalidate_events"].open_perf_buffer(self._zswap_invalidate_eh, page_cnt=128)
+    self.open_buffers()
+
+  def open_buffers(self):
+    self.perf_buffers = PerfBuffers(self.bpf, self.name(), self.transport)
+    self.perf_buffers.open("zswap_store_events", self._zswap_store_eh, page_cnt=128)
+    self.perf_buffers.open("zswap_load_events", self._zswap_load_eh, page_cnt=128)
+    self.perf_buffers.open("zswap_invalidate_events", self._zswap_invalidate_eh, page_cnt=128)
 
   def poll(self):
-    self.bpf.perf_buffer_poll(timeout=POLL_TIMEOUT_MS)
+    self.perf_buffers.poll(timeout_ms=POLL_TIMEOUT_MS)
 
   def close(self):
     self.bpf.cleanup()
 
-  def data(self) -> list[CollectionTable]:
+  def buffers(self) -> Mapping[str, EventBuffer]:
+    return {
+      "zswap_runtime": self.trace_process,
+    }
+
+  @classmethod
+  def build_tables(cls, raw_data: Mapping[str, pl.DataFrame], collection_id: str) -> list[CollectionTable]:
     return [
             ZswapRuntimeDataTable.from_df_id(
-                pl.DataFrame(self.trace_process),
-                collection_id=self.collection_id,
+                raw_data["zswap_runtime"],
+                collection_id=collection_id,
             ),
         ]
 
-  def clear(self):
-    self.trace_process.clear()
+  @classmethod
+  def synthetic_event(cls, table_name: str, seq: int) -> Any:
+    return SimpleNamespace(pid=seq, tgid=seq, start_ts=seq * 1000, end_ts=seq * 1000 + 500)
 
-  def pop_data(self) -> list[CollectionTable]:
-    tables = self.data()
-    self.clear()
-    return tables
+  @classmethod
+  def raw_data_from_tables(cls, tables: Mapping[str, pl.DataFrame]) -> Mapping[str, pl.DataFrame]:
+    return {"zswap_runtime": tables[ZswapRuntimeDataTable.name()]}
 
   def _zswap_store_eh(self, cpu, start_data, size):
       event = self.bpf["zswap_store_events"].event(start_data)
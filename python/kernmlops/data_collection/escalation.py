@@ -0,0 +1,174 @@
+"""Turns expensive hooks on for a while when rules over cheap hooks fire."""
+
+import time
+import traceback
+from dataclasses import dataclass
+from threading import Event, Thread
+from typing import Any, Final, Mapping
+
+import polars as pl
+from data_collection.bpf_instrumentation import BPFProgram
+from data_schema import UPTIME_TIMESTAMP
+from pytimeparse.timeparse import timeparse
+
+AGGREGATES: Final[tuple[str, ...]] = ("count", "mean", "min", "max", "rate")
+
+
+def _parse_sec(value: str | int | float) -> float:
+    if isinstance(value, (int, float)):
+        return float(value)
+    parsed = timeparse(value)
+    if parsed is None:
+        raise ValueError(f"could not parse duration {value}")
+    return float(parsed)
+
+
+@dataclass(frozen=True)
+class EscalationRule:
+    """Enables `hooks` for `duration_sec` once `aggregate` of `column` crosses `threshold`.
+
+    The aggregate is taken over the last `window_sec` of the `table` built by
+    `hook`, `rate` is the increase of a cumulative column per second summed
+    over CPUs, as perf counters are kept. Rules are only checked once the
+    hook's rows cover a whole window.
+    """
+
+    hook: str
+    table: str
+    column: str
+    aggregate: str
+    threshold: float
+    above: bool
+    window_sec: float
+    hooks: tuple[str, ...]
+    duration_sec: float
+
+    @classmethod
+    def from_config(cls, rule: Mapping[str, Any]) -> "EscalationRule":
+        """Reads a rule of the collector config, with exactly one of `above` or `below` set.
+
+        `{"hook": "memory_usage", "column": "mem_available_bytes", "aggregate": "min",
+        "below": 1073741824, "window": "5s", "hooks": ["vfs_read"], "duration": "30s"}`
+        """
+        if ("above" in rule) == ("below" in rule):
+            raise ValueError(f"escalation rule needs exactly one of above or below: {rule}")
+        aggregate = rule.get("aggregate", "mean")
+        if aggregate not in AGGREGATES:
+            raise ValueError(f"escalation rule aggregate must be one of {AGGREGATES}, got {aggregate}")
+        return EscalationRule(
+            hook=rule["hook"],
+            table=rule.get("table", rule["hook"]),
+            column=rule.get("column", UPTIME_TIMESTAMP),
+            aggregate=aggregate,
+            threshold=float(rule["above"] if "above" in rule else rule["below"]),
+            above="above" in rule,
+            window_sec=_parse_sec(rule.get("window", "5s")),
+            hooks=tuple(rule["hooks"]),
+            duration_sec=_parse_sec(rule.get("duration", "30s")),
+        )
+
+    def value(self, table: pl.DataFrame, *, covered: bool = True) -> float | None:
+        """The aggregate over `table`, None when there are too few rows to tell.
+
+        An empty window only counts as zero rows when the rows of the whole
+        window are `covered`, otherwise it holds only part of the window.
+        """
+        if not covered:
+            return None
+        if self.aggregate == "count":
+            return float(len(table))
+        if table.is_empty():
+            return None
+        if self.aggregate == "rate":
+            span_sec = (table[UPTIME_TIMESTAMP].max() - table[UPTIME_TIMESTAMP].min()) / 1_000_000  # pyright: ignore [reportOperatorIssue]
+            if span_sec <= 0:
+                return None
+            by_cpu = table.group_by("cpu") if "cpu" in table.columns else table.group_by(pl.lit(0))
+            increase = by_cpu.agg((pl.col(self.column).max() - pl.col(self.column).min()).alias("increase"))
+            return float(increase["increase"].sum()) / span_sec
+        value = getattr(table[self.column], self.aggregate)()
+        return float(value) if value is not None else None
+
+    def fires(self, value: float) -> bool:
+        return value > self.threshold if self.above else value < self.threshold
+
+
+class EscalationEngine:
+    """Checks every rule once per `check_interval_sec` on a thread of its own.
+
+    Hooks escalated by any rule start disabled, a firing rule enables them
+    until `duration_sec` after it last fired. Hooks keep their flushed rows
+    for the longest window of the rules over them, so windows span flushes.
+    """
+
+    def __init__(
+        self,
+        bpf_programs: list[BPFProgram],
+        rules: list[EscalationRule],
+        *,
+        check_interval_sec: float = 1.0,
+        verbose: bool = False,
+    ):
+        self.bpf_programs = {bpf_program.name(): bpf_program for bpf_program in bpf_programs}
+        self.rules = rules
+        self.check_interval_sec = check_interval_sec
+        self.verbose = verbose
+        for rule in rules:
+            unknown_hooks = {rule.hook, *rule.hooks} - self.bpf_programs.keys()
+            if unknown_hooks:
+                raise ValueError(f"escalation rule uses hooks {sorted(unknown_hooks)} that are not collected")
+            self.bpf_programs[rule.hook].keep_tail(int(rule.window_sec * 1000))
+        self._escalated_until = dict[str, float]()
+        self._stop_event = Event()
+        self._thread = Thread(target=self._run, name="kernmlops-escalation", daemon=True)
+
+    def start(self) -> None:
+        for rule in self.rules:
+            for hook_name in rule.hooks:
+                self.bpf_programs[hook_name].disable()
+        self._thread.start()
+
+    def close(self) -> None:
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def escalated(self) -> list[str]:
+        return list(self._escalated_until.keys())
+
+    def check(self) -> None:
+        now = time.monotonic()
+        for rule in self.rules:
+            bpf_program = self.bpf_programs[rule.hook]
+            window_ms = int(rule.window_sec * 1000)
+            # checked first, rows arriving in between only make the window fuller
+            covered = bpf_program.covers_ms(window_ms)
+            collection_tables = bpf_program.last_k_ms(window_ms)
+            table = next(
+                (collection_table.table for collection_table in collection_tables if collection_table.name() == rule.table),
+                None,
+            )
+            if table is None:
+                continue
+            value = rule.value(table, covered=covered)
+            if value is None or not rule.fires(value):
+                continue
+            for hook_name in rule.hooks:
+                if hook_name not in self._escalated_until:
+                    self.bpf_programs[hook_name].enable()
+                    if self.verbose:
+                        print(f"escalated {hook_name}: {rule.aggregate} {rule.table}.{rule.column} = {value}")
+                self._escalated_until[hook_name] = max(self._escalated_until.get(hook_name, 0.0), now + rule.duration_sec)
+        for hook_name, until in list(self._escalated_until.items()):
+            if until <= now:
+                self.bpf_programs[hook_name].disable()
+                del self._escalated_until[hook_name]
+                if self.verbose:
+                    print(f"de-escalated {hook_name}")
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.check_interval_sec):
+            try:
+                self.check()
+            except Exception:
+                print(traceback.format_exc())
@@ -0,0 +1,154 @@
+"""Keeps only the most recent rows of every hook and writes them out when triggered."""
+
+import time
+from collections import deque
+from dataclasses import dataclass
+from threading import Event
+from typing import Mapping
+
+import polars as pl
+from data_collection.bpf_instrumentation import BPFProgram, PerfBuffers
+from data_schema import CollectionTable
+
+
+@dataclass(frozen=True)
+class RecordedChunk:
+    recorded_at: float
+    raw_data: Mapping[str, Mapping[str, pl.DataFrame]]
+    size_bytes: int
+
+
+class FlightRecorder:
+    """Ring of the raw rows popped from every hook, bounded by age and size.
+
+    `record` moves the rows buffered since the last call into a new chunk and
+    evicts chunks older than `window_sec` or beyond `max_bytes`. Nothing is
+    written until `trigger` is called, by a signal, a command on stdin or a
+    hook whose event rate crosses `trigger_events_per_sec`. Recording goes on
+    for `post_trigger_sec` so the dump shows what followed the trigger as
+    well, `dump` then builds the tables of every chunk recorded from
+    `window_sec` before the trigger. Triggers within `cooldown_sec` of the
+    last dump are ignored, so a hook staying over its rate does not dump
+    every second.
+    """
+
+    def __init__(
+        self,
+        bpf_programs: list[BPFProgram],
+        *,
+        window_sec: float,
+        max_bytes: int,
+        trigger_hook: str | None = None,
+        trigger_events_per_sec: float = 0.0,
+        post_trigger_sec: float = 0.0,
+        cooldown_sec: float = 0.0,
+    ):
+        self.bpf_programs = bpf_programs
+        self.window_sec = window_sec
+        self.max_bytes = max_bytes
+        self.trigger_hook = trigger_hook
+        self.trigger_events_per_sec = trigger_events_per_sec
+        self.post_trigger_sec = post_trigger_sec
+        self.cooldown_sec = cooldown_sec
+        self.triggered = Event()
+        self.trigger_reason: str | None = None
+        self._triggered_at = 0.0
+        self._dumped_at: float | None = None
+        self._chunks = deque[RecordedChunk]()
+        self._size_bytes = 0
+        self._trigger_events_mark: tuple[float, int] | None = None
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+    def size_bytes(self) -> int:
+        return self._size_bytes
+
+    def trigger(self, reason: str) -> None:
+        """Requests a dump, safe to call from signal handlers and other threads."""
+        now = time.monotonic()
+        if self.triggered.is_set():
+            return
+        if self._dumped_at is not None and now - self._dumped_at < self.cooldown_sec:
+            return
+        self.trigger_reason = reason
+        self._triggered_at = now
+        self.triggered.set()
+
+    def seconds_until_dump(self) -> float | None:
+        """How long the recorder keeps recording after the pending trigger, None without one."""
+        if not self.triggered.is_set():
+            return None
+        return max(0.0, self._triggered_at + self.post_trigger_sec - time.monotonic())
+
+    def record(self) -> None:
+        raw_data = {
+            bpf_program.name(): bpf_program.pop_raw_data()
+            for bpf_program in self.bpf_programs
+        }
+        size_bytes = sum(
+            raw_df.estimated_size()
+            for hook_data in raw_data.values()
+            for raw_df in hook_data.values()
+        )
+        self._chunks.append(RecordedChunk(recorded_at=time.monotonic(), raw_data=raw_data, size_bytes=size_bytes))
+        self._size_bytes += size_bytes
+        self._evict()
+        self._check_trigger_rate()
+
+    def dump(self) -> dict[str, list[CollectionTable]]:
+        """Tables of every recorded chunk by hook, the recorder starts over empty."""
+        chunks, self._chunks, self._size_bytes = self._chunks, deque[RecordedChunk](), 0
+        self._dumped_at = time.monotonic()
+        self.triggered.clear()
+        collection_tables = dict[str, list[CollectionTable]]()
+        for bpf_program in self.bpf_programs:
+            raw_frames = dict[str, list[pl.DataFrame]]()
+            for chunk in chunks:
+                for buffer_name, raw_df in chunk.raw_data.get(bpf_program.name(), {}).items():
+                    raw_frames.setdefault(buffer_name, []).append(raw_df)
+            if not raw_frames:
+                continue
+            collection_tables[bpf_program.name()] = bpf_program.build_tables(
+                {
+                    buffer_name: pl.concat(frames, how="diagonal_relaxed")
+                    for buffer_name, frames in raw_frames.items()
+                },
+                bpf_program.collection_id,
+            )
+        return collection_tables
+
+    def discard(self) -> None:
+        self._chunks.clear()
+        self._size_bytes = 0
+
+    def _evict(self) -> None:
+        # once triggered, the window ends at the trigger until the dump
+        window_end = self._triggered_at if self.triggered.is_set() else time.monotonic()
+        oldest = window_end - self.window_sec
+        # the newest chunk is kept even if it is larger than max_bytes by itself
+        while len(self._chunks) > 1 and (
+            self._chunks[0].recorded_at < oldest or self._size_bytes > self.max_bytes
+        ):
+            self._size_bytes -= self._chunks.popleft().size_bytes
+
+    def _check_trigger_rate(self) -> None:
+        if self.trigger_hook is None or self.trigger_events_per_sec <= 0:
+            return
+        perf_buffers = next(
+            (
+                getattr(bpf_program, "perf_buffers", None)
+                for bpf_program in self.bpf_programs
+                if bpf_program.name() == self.trigger_hook
+            ),
+            None,
+        )
+        if not isinstance(perf_buffers, PerfBuffers):
+            return
+        # counted by the perf buffers before decoding, so checking is close to free
+        now, events = time.monotonic(), sum(stats.events for stats in perf_buffers.stats())
+        if self._trigger_events_mark is not None:
+            marked_at, marked_events = self._trigger_events_mark
+            if now > marked_at and (events - marked_events) / (now - marked_at) >= self.trigger_events_per_sec:
+                self.trigger(f"{self.trigger_hook} over {self.trigger_events_per_sec} events/s")
+        self._trigger_events_mark = (now, events)
@@ -0,0 +1,102 @@
+"""Local Unix socket answering queries for the latest rows of a running collection."""
+
+import json
+import os
+import socketserver
+import traceback
+from pathlib import Path
+from threading import Thread
+from typing import Any, Mapping
+
+from data_collection.bpf_instrumentation import BPFProgram
+
+
+class _QueryHandler(socketserver.StreamRequestHandler):
+    """One JSON request per line, answered by one JSON line.
+
+    `{"hook": "block_io", "last_ms": 500}` or `{"hook": "block_io", "last_k": 10}`
+    return `{"tables": {table_name: [row, ...]}}`, `{"hooks": true}` lists the
+    hooks that can be queried. `{"hook": "vfs_read", "enable": false}` disables
+    a hook and `true` enables it again, answered by `{"hook": ..., "enabled": ...}`.
+    Failures are answered with `{"error": message}`.
+    """
+
+    server: "_QueryUnixServer"
+
+    def handle(self) -> None:
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                response = self.server.query_server.query(json.loads(line))
+            except Exception as e:
+                response = {"error": str(e)}
+            self.wfile.write(json.dumps(response, default=str).encode() + b"\n")
+            self.wfile.flush()
+
+
+class _QueryUnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: Path, query_server: "QueryServer"):
+        self.query_server = query_server
+        super().__init__(str(socket_path), _QueryHandler)
+
+
+class QueryServer:
+    """Serves `last_k_ms` and `last_k_data` of every hook over a Unix socket, and switches hooks on and off.
+
+    Queries read the rows not yet flushed and those flushed within the last
+    `max_window_ms`, the collection itself is never paused or copied as a
+    whole to answer them.
+    """
+
+    def __init__(self, bpf_programs: list[BPFProgram], socket_path: Path, *, max_window_ms: int = 60_000):
+        self.bpf_programs = {bpf_program.name(): bpf_program for bpf_program in bpf_programs}
+        for bpf_program in bpf_programs:
+            bpf_program.keep_tail(max_window_ms)
+        self.socket_path = socket_path
+        self.socket_path.unlink(missing_ok=True)
+        self._server = _QueryUnixServer(socket_path, self)
+        # only the collecting user and root should read kernel events
+        os.chmod(socket_path, 0o600)
+        self._thread = Thread(target=self._serve, name="kernmlops-query", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self.socket_path.unlink(missing_ok=True)
+
+    def query(self, request: Mapping[str, Any]) -> Mapping[str, Any]:
+        if request.get("hooks"):
+            return {"hooks": list(self.bpf_programs.keys())}
+        bpf_program = self.bpf_programs.get(request.get("hook", ""))
+        if bpf_program is None:
+            raise ValueError(f"unknown hook {request.get('hook')}, expected one of {list(self.bpf_programs.keys())}")
+        if "enable" in request:
+            if request["enable"]:
+                bpf_program.enable()
+            else:
+                bpf_program.disable()
+            return {"hook": bpf_program.name(), "enabled": bpf_program.enabled}
+        if "last_ms" in request:
+            collection_tables = bpf_program.last_k_ms(int(request["last_ms"]))
+        elif "last_k" in request:
+            collection_tables = bpf_program.last_k_data(int(request["last_k"]))
+        else:
+            collection_tables = bpf_program.last_data()
+        return {
+            "tables": {
+                collection_table.name(): collection_table.table.to_dicts()
+                for collection_table in collection_tables
+            },
+        }
+
+    def _serve(self) -> None:
+        try:
+            self._server.serve_forever()
+        except Exception:
+            print(traceback.format_exc())
@@ -0,0 +1,193 @@
+"""Subprocess that builds collection tables and writes parquet away from the collector."""
+
+import multiprocessing
+import queue
+import traceback
+from dataclasses import dataclass
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+from typing import Any, Mapping
+
+import polars as pl
+import pyarrow as pa
+from data_schema import CollectionTable, CollectionWriter
+
+
+def _write_stream(sink: pa.NativeFile, arrow_table: pa.Table) -> None:
+    # arrow holds an export of the sink's memory until its writers are released
+    with pa.ipc.new_stream(sink, arrow_table.schema) as ipc_writer:
+        ipc_writer.write_table(arrow_table)
+
+
+@dataclass(frozen=True)
+class SharedFrame:
+    """Arrow IPC stream of a raw frame stored in a shared memory block."""
+    shm_name: str
+    size: int
+
+    @classmethod
+    def from_df(cls, df: pl.DataFrame) -> "SharedFrame":
+        arrow_table = df.to_arrow(compat_level=pl.CompatLevel.oldest())
+        # size the block first so the stream is written straight into shared memory
+        mock_sink = pa.MockOutputStream()
+        _write_stream(mock_sink, arrow_table)
+        size = mock_sink.size()
+        shm = SharedMemory(create=True, size=max(size, 1))
+        try:
+            _write_stream(pa.FixedSizeBufferWriter(pa.py_buffer(shm.buf)), arrow_table)
+        finally:
+            shm.close()
+        return SharedFrame(shm_name=shm.name, size=size)
+
+    def take(self) -> pl.DataFrame:
+        """Reads the frame and releases the shared memory block, can only be called once."""
+        shm = SharedMemory(name=self.shm_name)
+        try:
+            raw_stream = bytes(shm.buf[:self.size])
+        finally:
+            shm.close()
+            shm.unlink()
+        df = pl.from_arrow(pa.ipc.open_stream(raw_stream).read_all())
+        assert isinstance(df, pl.DataFrame)
+        return df
+
+    def discard(self) -> None:
+        """Releases the shared memory block of a frame that will never be taken."""
+        try:
+            shm = SharedMemory(name=self.shm_name)
+        except FileNotFoundError:
+            return
+        shm.close()
+        shm.unlink()
+
+
+@dataclass(frozen=True)
+class RawDataMessage:
+    hook_name: str
+    collection_id: str
+    raw_data: Mapping[str, SharedFrame]
+
+    def shared_frames(self) -> list[SharedFrame]:
+        return list(self.raw_data.values())
+
+
+@dataclass(frozen=True)
+class TableMessage:
+    table_name: str
+    table: SharedFrame
+
+    def shared_frames(self) -> list[SharedFrame]:
+        return [self.table]
+
+
+def _writer_main(
+    queue: multiprocessing.Queue,
+    output_dir: Path,
+    roll_size_bytes: int,
+    roll_interval_sec: float,
+    ids: tuple[int, int] | None,
+    verbose: bool,
+) -> None:
+    from data_collection.bpf_instrumentation import all_hooks
+
+    writer = CollectionWriter(
+        output_dir=output_dir,
+        roll_size_bytes=roll_size_bytes,
+        roll_interval_sec=roll_interval_sec,
+        ids=ids,
+    )
+    # rows the joins of each hook's collection left for later flushes
+    joins = dict[tuple[str, str], dict[str, Any]]()
+    while (message := queue.get()) is not None:
+        try:
+            if isinstance(message, RawDataMessage):
+                raw_data = {
+                    name: shared_frame.take()
+                    for name, shared_frame in message.raw_data.items()
+                }
+                collection_tables = all_hooks[message.hook_name].build_streaming_tables(
+                    raw_data,
+                    message.collection_id,
+                    joins.setdefault((message.hook_name, message.collection_id), {}),
+                )
+                for collection_table in collection_tables:
+                    if verbose:
+                        with pl.Config(tbl_cols=-1):
+                            print(f"{collection_table.name()}: {collection_table.table}")
+                    writer.write(collection_table)
+            elif isinstance(message, TableMessage):
+                writer.write_frame(message.table_name, message.table.take())
+        except Exception:
+            print(traceback.format_exc())
+    writer.close()
+
+
+class WriterProcess:
+    """Hands raw hook rows to a subprocess that casts, joins, compresses and writes them.
+
+    The collector only converts the retired rows of each buffer into Arrow and
+    copies them into shared memory, everything after that happens without
+    holding the collector's GIL.
+    """
+
+    def __init__(
+        self,
+        *,
+        output_dir: Path,
+        roll_size_bytes: int,
+        roll_interval_sec: float,
+        ids: tuple[int, int] | None = None,
+        verbose: bool = False,
+    ):
+        # polars is not fork safe and the collector holds BPF file descriptors
+        context = multiprocessing.get_context("spawn")
+        self._queue = context.Queue()
+        self._process = context.Process(
+            target=_writer_main,
+            args=(self._queue, output_dir, roll_size_bytes, roll_interval_sec, ids, verbose),
+            name="kernmlops-writer",
+            daemon=True,
+        )
+        self._process.start()
+
+    def write_raw(self, hook_name: str, collection_id: str, raw_data: Mapping[str, pl.DataFrame]) -> None:
+        self._check_alive()
+        self._queue.put(RawDataMessage(
+            hook_name=hook_name,
+            collection_id=collection_id,
+            raw_data={
+                name: SharedFrame.from_df(raw_df)
+                for name, raw_df in raw_data.items()
+            },
+        ))
+
+    def write(self, collection_table: CollectionTable) -> None:
+        self._check_alive()
+        self._queue.put(TableMessage(
+            table_name=collection_table.name(),
+            table=SharedFrame.from_df(collection_table.table),
+        ))
+
+    def close(self) -> None:
+        """Waits for every queued table to be written and the parquet footers finalized."""
+        if self._process.is_alive():
+            self._queue.put(None)
+        self._process.join()
+        if self._process.exitcode != 0:
+            # frames queued for a writer that died are never taken
+            self._discard_queued()
+
+    def _check_alive(self) -> None:
+        # shared memory blocks queued for a dead writer would only fill /dev/shm
+        if not self._process.is_alive():
+            raise RuntimeError(f"writer process exited with {self._process.exitcode}, tables are not written")
+
+    def _discard_queued(self) -> None:
+        while True:
+            try:
+                message = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                return
+            if message is not None:
+                for shared_frame in message.shared_frames():
+                    shared_frame.discard()
@@ -6,6 +6,8 @@ from typing import Callable
 
 from data_schema import perf
 from data_schema.block_io import BlockIOLatencyTable, BlockIOQueueTable, BlockIOTable
+from data_schema.collection_loss import CollectionLossTable
+from data_schema.collector_overhead import CollectorOverheadTable
 from data_schema.file_data import FileDataTable
 from data_schema.generic_table import ProcessMetadataTable
 from data_schema.huge_pages import CollapseHugePageDataTable
@@ -21,11 +23,14 @@ from data_schema.schema import (
     collection_id_column,
     cumulative_pma_as_pdf,
 )
+from data_schema.table_writer import CollectionTableWriter, CollectionWriter
 from data_schema.vfs_read import VFSReadDataTable
 from data_schema.vfs_write import VFSWriteDataTable
 
 table_types: list[type[CollectionTable]] = [
     SystemInfoTable,
+    CollectionLossTable,
+    CollectorOverheadTable,
     QuantaRuntimeTable,
     QuantaQueuedTable,
     ProcessMetadataTable,
@@ -81,7 +86,11 @@ __all__ = [
     "get_user_group_ids",
     "table_types",
     "perf",
+    "CollectionLossTable",
     "CollectionTable",
+    "CollectionTableWriter",
+    "CollectorOverheadTable",
+    "CollectionWriter",
     "CollectionData",
     "CollectionGraph",
     "GraphEngine",
@@ -1,3 +1,4 @@
+from typing import Final
 
 import polars as pl
 from data_schema.schema import (
@@ -29,6 +30,9 @@ REQ_FUA = 1 << (REQ_OP_BITS + 9)
 REQ_RAHEAD = 1 << (REQ_OP_BITS + 11)
 REQ_BACKGROUND = 1 << (REQ_OP_BITS + 12)
 REQ_NOWAIT = 1 << (REQ_OP_BITS + 13)
+
+# the default block layer request timeout, requests pending longer are not coming back
+BLOCK_IO_MAX_PENDING_AGE_US: Final[int] = 30 * 1_000_000
 def flags_print(flags: int):
     desc = ""
     # operation
@@ -254,6 +258,91 @@ class BlockIOTable(CollectionTable):
         ])
 
 
+class BlockIOJoin:
+    """Joins queue and latency rows across flushes, keeping only the rows not matched yet.
+
+    Requests that straddle a flush are matched once their other half arrives,
+    so memory scales with the requests in flight rather than the interval.
+    Rows more than `max_age_us` older than the newest row seen are evicted
+    unmatched.
+    """
+
+    def __init__(self, max_age_us: int = BLOCK_IO_MAX_PENDING_AGE_US):
+        self.max_age_us = max_age_us
+        self._queue_df: pl.DataFrame | None = None
+        self._latency_df: pl.DataFrame | None = None
+
+    def pending_rows(self) -> int:
+        """Queue and latency rows waiting for their other half."""
+        return sum(len(df) for df in (self._queue_df, self._latency_df) if df is not None)
+
+    def join(self, queue_table: BlockIOQueueTable, latency_table: BlockIOLatencyTable) -> BlockIOTable:
+        """Table of the requests matched by the rows of this flush, including with rows left from earlier ones."""
+        queue_df = pl.concat([
+            df for df in (self._queue_df, queue_table.filtered_table()) if df is not None
+        ])
+        latency_df = pl.concat([
+            df for df in (self._latency_df, latency_table.filtered_table()) if df is not None
+        ])
+        block_table = BlockIOTable.from_tables(
+            queue_table=BlockIOQueueTable(queue_df),
+            latency_table=BlockIOLatencyTable(latency_df),
+        )
+        matched_df = block_table.table
+        newest_us = max(
+            (df[UPTIME_TIMESTAMP].max() for df in (queue_df, latency_df) if not df.is_empty()),
+            default=None,
+        )
+        if newest_us is None:
+            return block_table
+        evict_before_us = newest_us - self.max_age_us  # pyright: ignore [reportOperatorIssue]
+        self._queue_df = queue_df.join(
+            matched_df.select([
+                "cpu",
+                "device",
+                "sector",
+                "segments",
+                "block_io_bytes",
+                UPTIME_TIMESTAMP,
+                "block_io_flags",
+                "collection_id",
+            ]),
+            on=[
+                "cpu",
+                "device",
+                "sector",
+                "segments",
+                "block_io_bytes",
+                UPTIME_TIMESTAMP,
+                "block_io_flags",
+                "collection_id",
+            ],
+            how="anti",
+        ).filter(pl.col(UPTIME_TIMESTAMP) >= evict_before_us)
+        self._latency_df = latency_df.join(
+            matched_df.select([
+                "device",
+                "sector",
+                "segments",
+                "block_io_bytes",
+                pl.col("finish_ts_uptime_us").alias(UPTIME_TIMESTAMP),
+                "block_io_flags",
+                "collection_id",
+            ]),
+            on=[
+                "device",
+                "sector",
+                "segments",
+                "block_io_bytes",
+                UPTIME_TIMESTAMP,
+                "block_io_flags",
+                "collection_id",
+            ],
+            how="anti",
+        ).filter(pl.col(UPTIME_TIMESTAMP) >= evict_before_us)
+        return block_table
+
+
 class BlockQueueGraph(CollectionGraph):
 
     @classmethod
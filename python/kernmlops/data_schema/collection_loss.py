@@ -0,0 +1,46 @@
+import polars as pl
+from data_schema.schema import CollectionGraph, CollectionTable
+
+
+class CollectionLossTable(CollectionTable):
+    """Perf buffer records dropped by the kernel before the collector read them."""
+
+    @classmethod
+    def name(cls) -> str:
+        return "collection_loss"
+
+    @classmethod
+    def schema(cls) -> pl.Schema:
+        return pl.Schema({
+            "hook": pl.String(),
+            "buffer": pl.String(),
+            "cpu": pl.Int64(),
+            "ts_uptime_us": pl.Int64(),
+            "lost_samples": pl.Int64(),
+            "collection_id": pl.String(),
+        })
+
+    @classmethod
+    def from_df(cls, table: pl.DataFrame) -> "CollectionLossTable":
+        return CollectionLossTable(table=table.cast(cls.schema(), strict=True))  # pyright: ignore [reportArgumentType]
+
+    def __init__(self, table: pl.DataFrame):
+        self._table = table
+
+    @property
+    def table(self) -> pl.DataFrame:
+        return self._table
+
+    def filtered_table(self) -> pl.DataFrame:
+        return self.table
+
+    def graphs(self) -> list[type[CollectionGraph]]:
+        return []
+
+    def lost_samples(self) -> int:
+        return self.table["lost_samples"].sum()
+
+    def by_buffer(self) -> pl.DataFrame:
+        return self.table.group_by("hook", "buffer", "cpu").agg(
+            pl.col("lost_samples").sum()
+        ).sort("hook", "buffer", "cpu")
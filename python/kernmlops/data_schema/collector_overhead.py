@@ -0,0 +1,55 @@
+import polars as pl
+from data_schema.schema import CollectionGraph, CollectionTable
+
+
+class CollectorOverheadTable(CollectionTable):
+    """Time the collector spent on each hook per flush interval."""
+
+    @classmethod
+    def name(cls) -> str:
+        return "collector_overhead"
+
+    @classmethod
+    def schema(cls) -> pl.Schema:
+        return pl.Schema({
+            "hook": pl.String(),
+            "ts_uptime_us": pl.Int64(),
+            "interval_us": pl.Int64(),
+            "poll_ns": pl.Int64(),
+            "handler_ns": pl.Int64(),
+            "pop_data_ns": pl.Int64(),
+            "write_ns": pl.Int64(),
+            "events": pl.Int64(),
+            "bytes": pl.Int64(),
+            # null for hooks that are not sampled
+            "sample_freq": pl.Int64(),
+            "collection_id": pl.String(),
+        })
+
+    @classmethod
+    def from_df(cls, table: pl.DataFrame) -> "CollectorOverheadTable":
+        return CollectorOverheadTable(table=table.cast(cls.schema(), strict=True))  # pyright: ignore [reportArgumentType]
+
+    def __init__(self, table: pl.DataFrame):
+        self._table = table
+
+    @property
+    def table(self) -> pl.DataFrame:
+        return self._table
+
+    def filtered_table(self) -> pl.DataFrame:
+        return self.table
+
+    def graphs(self) -> list[type[CollectionGraph]]:
+        return []
+
+    def by_hook(self) -> pl.DataFrame:
+        """Total collector time and work per hook over the whole collection."""
+        return self.table.group_by("hook").agg(
+            pl.col("poll_ns", "handler_ns", "pop_data_ns", "write_ns", "events", "bytes").sum()
+        ).with_columns(
+            # event handlers run inside poll so handler_ns is already part of poll_ns
+            (
+                pl.col("poll_ns") + pl.col("pop_data_ns") + pl.col("write_ns")
+            ).alias("total_ns")
+        ).sort("total_ns", descending=True)
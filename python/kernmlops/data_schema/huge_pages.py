@@ -1,3 +1,5 @@
+from typing import Final
+
 import polars as pl
 from data_schema.generic_table import (
     CollapseHugePageDataTableRaw,
@@ -8,6 +10,61 @@ from data_schema.schema import (
     CollectionTable,
 )
 
+# collapses copy at most a huge page, anything pending longer lost its other half
+COLLAPSE_HUGE_PAGE_MAX_PENDING_AGE_NS: Final[int] = 10 * 1_000_000_000
+
+
+def _match_collapses(collapse_df: pl.DataFrame, trace_mm_df: pl.DataFrame) -> pl.DataFrame:
+    """Matches each trace row with the latest collapse of the same task started before it.
+
+    The tracepoint fires as `collapse_huge_page` returns, the trace rows do not
+    record the mm so the task is what ties them to the kprobe's rows. Trace
+    rows without a collapse are left out, a collapse may match several.
+    """
+    collapse_schema = {
+        "pid": pl.Int64(),
+        "tgid": pl.Int64(),
+        "start_ts_ns": pl.Int64(),
+        **{column: dtype for column, dtype in collapse_df.schema.items() if column != "end_ts_ns"},
+    }
+    if collapse_df.is_empty() or trace_mm_df.is_empty():
+        # typed like a match so callers select and drop the same columns either way
+        return pl.DataFrame(schema={
+            **collapse_schema,
+            "trace_start_ts_ns": trace_mm_df.schema.get("start_ts_ns", pl.Int64()),
+            "isolated": trace_mm_df.schema.get("isolated", pl.Boolean()),
+            "status": trace_mm_df.schema.get("status", pl.Int64()),
+        })
+    return trace_mm_df.select(
+        "pid",
+        "tgid",
+        pl.col("start_ts_ns").alias("trace_start_ts_ns"),
+        "isolated",
+        "status",
+    ).sort("trace_start_ts_ns").join_asof(
+        collapse_df.select(list(collapse_schema)).sort("start_ts_ns"),
+        left_on="trace_start_ts_ns",
+        right_on="start_ts_ns",
+        by=["pid", "tgid"],
+        strategy="backward",
+        check_sortedness=False,
+    ).filter(
+        pl.col("start_ts_ns").is_not_null()
+    )
+
+
+def _pair_collapses(matched_df: pl.DataFrame, collapse_df: pl.DataFrame) -> pl.DataFrame:
+    """Pairs each matched collapse with the first trace row that matched it."""
+    collapse_columns = [column for column in collapse_df.columns if column != "end_ts_ns"]
+    return matched_df.unique(
+        ["pid", "tgid", "start_ts_ns"], keep="first", maintain_order=True,
+    ).select([
+        *collapse_columns,
+        "isolated",
+        "status",
+        "trace_start_ts_ns",
+    ])
+
 
 class CollapseHugePageDataTable(CollectionTable):
     """Best effort merged table of CollapseHugePageDataTableRaw and TraceMMCollapseHugePageDataTable."""
@@ -26,23 +83,9 @@ class CollapseHugePageDataTable(CollectionTable):
 
     @classmethod
     def from_tables(cls, collapse_table: CollapseHugePageDataTableRaw, trace_mm_table: TraceMMCollapseHugePageDataTable) -> "CollapseHugePageDataTable":
-        collapse_df = collapse_table.filtered_table().sort("start_ts_ns", descending=False)
-        trace_mm_df = trace_mm_table.filtered_table().sort("start_ts_ns", descending=False)
-        if trace_mm_df.row(0, named=True)["start_ts_ns"] < collapse_df.row(0, named=True)["start_ts_ns"]:
-            collapse_df = collapse_df[1:]
-        assert len(collapse_df) == len(trace_mm_df)
-        collapse_df = collapse_df.drop([
-            "end_ts_ns",
-        ])
-        trace_mm_df = trace_mm_df.drop([
-            "pid",
-            "tgid",
-            "start_ts_ns",
-            "end_ts_ns",
-            "mm",
-            "collection_id",
-        ])
-        return cls.from_df(pl.concat([collapse_df, trace_mm_df], how="horizontal"))
+        collapse_df = collapse_table.filtered_table()
+        matched_df = _match_collapses(collapse_df, trace_mm_table.filtered_table())
+        return cls.from_df(_pair_collapses(matched_df, collapse_df).drop("trace_start_ts_ns"))
 
     def __init__(self, table: pl.DataFrame):
         self._table = table
@@ -56,3 +99,55 @@ class CollapseHugePageDataTable(CollectionTable):
 
     def graphs(self) -> list[type[CollectionGraph]]:
         return []
+
+
+class CollapseHugePageJoin:
+    """Pairs collapse and trace rows across flushes, keeping only the rows not paired yet.
+
+    Collapses that straddle a flush are paired once their trace row arrives,
+    rows more than `max_age_ns` older than the newest row seen are evicted
+    unpaired.
+    """
+
+    def __init__(self, max_age_ns: int = COLLAPSE_HUGE_PAGE_MAX_PENDING_AGE_NS):
+        self.max_age_ns = max_age_ns
+        self._collapse_df: pl.DataFrame | None = None
+        self._trace_mm_df: pl.DataFrame | None = None
+
+    def pending_rows(self) -> int:
+        """Collapse and trace rows waiting for their other half."""
+        return sum(len(df) for df in (self._collapse_df, self._trace_mm_df) if df is not None)
+
+    def join(
+        self, collapse_table: CollapseHugePageDataTableRaw, trace_mm_table: TraceMMCollapseHugePageDataTable,
+    ) -> CollapseHugePageDataTable:
+        """Table of the collapses paired by the rows of this flush, including with rows left from earlier ones."""
+        # empty intervals have untyped columns
+        collapse_df = pl.concat([
+            df for df in (self._collapse_df, collapse_table.filtered_table()) if df is not None
+        ], how="vertical_relaxed")
+        trace_mm_df = pl.concat([
+            df for df in (self._trace_mm_df, trace_mm_table.filtered_table()) if df is not None
+        ], how="vertical_relaxed")
+        matched_df = _match_collapses(collapse_df, trace_mm_df)
+        paired_df = _pair_collapses(matched_df, collapse_df)
+        newest_ns = max(
+            (df["start_ts_ns"].max() for df in (collapse_df, trace_mm_df) if not df.is_empty()),
+            default=None,
+        )
+        if newest_ns is not None and not paired_df.is_empty():
+            collapse_df = collapse_df.join(
+                paired_df.select("pid", "tgid", "start_ts_ns"), on=["pid", "tgid", "start_ts_ns"], how="anti",
+            )
+            # trace rows matching a collapse another trace row paired with are duplicates, not pending
+            trace_mm_df = trace_mm_df.join(
+                matched_df.select("pid", "tgid", pl.col("trace_start_ts_ns").alias("start_ts_ns")),
+                on=["pid", "tgid", "start_ts_ns"],
+                how="anti",
+            )
+        if newest_ns is not None:
+            evict_before_ns = newest_ns - self.max_age_ns  # pyright: ignore [reportOperatorIssue]
+            collapse_df = collapse_df.filter(pl.col("start_ts_ns") >= evict_before_ns)
+            trace_mm_df = trace_mm_df.filter(pl.col("start_ts_ns") >= evict_before_ns)
+        self._collapse_df, self._trace_mm_df = collapse_df, trace_mm_df
+        return CollapseHugePageDataTable.from_df(paired_df.drop("trace_start_ts_ns"))
@@ -1,5 +1,4 @@
 import polars as pl
-from bcc import PerfType
 from data_schema.memory_usage import MemoryUsageGraph
 from data_schema.perf.perf_schema import (
     CumulativePerfGraph,
@@ -22,6 +21,9 @@ class DTLBPerfTable(PerfCollectionTable):
 
     @classmethod
     def ev_type(cls) -> int:
+        # analysis hosts read perf tables without BCC installed
+        from bcc import PerfType
+
         return PerfType.HW_CACHE
 
     @classmethod
@@ -110,6 +112,8 @@ class ITLBPerfTable(PerfCollectionTable):
 
     @classmethod
     def ev_type(cls) -> int:
+        from bcc import PerfType
+
         return PerfType.HW_CACHE
 
     @classmethod
@@ -198,6 +202,8 @@ class TLBFlushPerfTable(PerfCollectionTable):
 
     @classmethod
     def ev_type(cls) -> int:
+        from bcc import PerfType
+
         return PerfType.RAW
 
     @classmethod
@@ -285,6 +291,8 @@ class DTLBWalkDurationPerfTable(PerfCollectionTable):
 
     @classmethod
     def ev_type(cls) -> int:
+        from bcc import PerfType
+
         return PerfType.RAW
 
     @classmethod
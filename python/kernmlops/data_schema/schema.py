@@ -1,11 +1,9 @@
 # Abstract definition of CollectionTable and logical collection
 
 from pathlib import Path
-from typing import Final, Mapping, cast
+from typing import Any, Final, Mapping, cast
 
-import plotext
 import polars as pl
-from matplotlib import pyplot
 from typing_extensions import Protocol
 
 UPTIME_TIMESTAMP: Final[str] = "ts_uptime_us"
@@ -254,12 +252,33 @@ class CollectionData:
                 pl.read_parquet(x) for x in dataframe_dir.iterdir()
                 if x.is_file() and x.suffix == ".parquet" and x.name.startswith(collection_id)
             ]
-            # Throw explainable error
-            assert len(dfs) <= 1
+            # long collections roll over into multiple files per table
             if dfs:
-                collection_tables[dataframe_dir.name] = type_map[dataframe_dir.name].from_df(dfs[0])
+                collection_tables[dataframe_dir.name] = type_map[dataframe_dir.name].from_df(
+                    pl.concat(dfs, how="diagonal_relaxed")
+                )
         return CollectionData(collection_tables)
 
+    @classmethod
+    def from_collection_dir(
+        cls,
+        collection_dir: Path,
+        table_types: list[type[CollectionTable]],
+    ) -> "CollectionData":
+        """Reads back the `{table}.{num}.parquet` files written by a CollectionWriter."""
+        type_map = _type_map(table_types)
+        table_files = dict[str, list[Path]]()
+        for x in sorted(collection_dir.glob("*.parquet")):
+            table_name = x.name.split(".")[0]
+            if table_name in type_map:
+                table_files.setdefault(table_name, []).append(x)
+        return CollectionData({
+            table_name: type_map[table_name].from_df(
+                pl.concat([pl.read_parquet(x) for x in files], how="diagonal_relaxed")
+            )
+            for table_name, files in table_files.items()
+        })
+
 
 class GraphEngine:
 
@@ -270,7 +289,15 @@ class GraphEngine:
         use_matplot: bool = False
     ):
         self.collection_data = collection_data
-        self._plt = pyplot if use_matplot else plotext
+        # graph backends are slow to import, only the one used is
+        self._use_matplot = use_matplot
+        self._plt: Any
+        if use_matplot:
+            from matplotlib import pyplot
+            self._plt = pyplot
+        else:
+            import plotext
+            self._plt = plotext
         self._y_axis: str | None = None
         self._figure = None
         self._ax = None
@@ -298,8 +325,8 @@ class GraphEngine:
         self._show()
 
     def _setup_graph(self, graph: CollectionGraph) -> None:
-        if self._plt is pyplot:
-            self._figure, self._ax = pyplot.subplots()
+        if self._use_matplot:
+            self._figure, self._ax = self._plt.subplots()
         self._plt.title(graph.name())
         self._y_axis = graph.y_axis()
         if not self._ax:
@@ -318,7 +345,7 @@ class GraphEngine:
 
     def _show(self) -> None:
         if self._figure is not None:
-            manager = pyplot.get_current_fig_manager()
+            manager = self._plt.get_current_fig_manager()
             if manager is not None:
                 manager.full_screen_toggle()
             #self._figure.tight_layout()
@@ -339,27 +366,27 @@ class GraphEngine:
         linestyle: str | None = None,
     ) -> None:
         if not y_axis or y_axis == self._y_axis:
-            if not linestyle or self._plt is plotext:
+            if not linestyle or not self._use_matplot:
                 self._plt.plot(x_data, y_data, label=label)
             else:
-                self._plt.plot(x_data, y_data, label=label, linestyle=linestyle)  # pyright: ignore[reportCallIssue]
+                self._plt.plot(x_data, y_data, label=label, linestyle=linestyle)
         elif self._ax is not None:
             if self._ax2 is None:
                 self._ax2 = self._ax.twinx()
                 self._ax2.set_ylabel(y_axis)
             self._ax2.plot(x_data, y_data, label=label, linestyle=linestyle)
-        elif self._plt is plotext:
-            plotext.plot(x_data, y_data, label=label, yside="right")
-            plotext.ylabel(label=y_axis, yside="right")
+        elif not self._use_matplot:
+            self._plt.plot(x_data, y_data, label=label, yside="right")
+            self._plt.ylabel(label=y_axis, yside="right")
 
     def plot_event_as_sec(self, *, ts_us: int | None) -> None:
         if ts_us is None:
             return
         ts_sec = (ts_us / 1_000_000.0) - self.collection_data.start_uptime_sec
-        if self._plt is plotext:
-            plotext.vline(ts_sec)
+        if not self._use_matplot:
+            self._plt.vline(ts_sec)
         else:
-            pyplot.axvline(ts_sec) # label="value"
+            self._plt.axvline(ts_sec) # label="value"
 
     def savefig(self, graph: CollectionGraph, out_dir: Path) -> None:
         if self._cleared:
@@ -367,8 +394,8 @@ class GraphEngine:
         graph_dir = out_dir / self.collection_data.benchmark / self.collection_data.id
         if graph_dir:
             graph_dir.mkdir(parents=True, exist_ok=True)
-        if self._plt is plotext:
-            plotext.save_fig(
+        if not self._use_matplot:
+            self._plt.save_fig(
                 str(graph_dir / f"{graph.base_name().replace(' ', '_').lower()}.plt"),
                 keep_colors=True,
             )
@@ -381,8 +408,8 @@ class GraphEngine:
             )
 
     def clear(self) -> None:
-        if self._plt is plotext:
-            plotext.clear_figure()
+        if not self._use_matplot:
+            self._plt.clear_figure()
         self._figure = None
         self._ax = None
         self._ax2 = None
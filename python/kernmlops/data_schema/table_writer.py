@@ -0,0 +1,138 @@
+"""Streaming parquet writers that append each flush of a table as a row group."""
+
+import os
+import time
+from pathlib import Path
+
+import polars as pl
+import pyarrow as pa
+import pyarrow.parquet as pq
+from data_schema.schema import CollectionTable
+
+
+class CollectionTableWriter:
+    """Appends a table's flushes to one open parquet file and rolls to a new file by size or age.
+
+    Files are named `{table}.{num}.parquet` with `num` counting the rolled files,
+    each flush becomes a single row group.
+    """
+
+    def __init__(
+        self,
+        *,
+        output_dir: Path,
+        table_name: str,
+        roll_size_bytes: int,
+        roll_interval_sec: float,
+        ids: tuple[int, int] | None = None,
+    ):
+        self.output_dir = output_dir
+        self.table_name = table_name
+        self.roll_size_bytes = roll_size_bytes
+        self.roll_interval_sec = roll_interval_sec
+        self.ids = ids
+        self._file_num = 0
+        self._writer: pq.ParquetWriter | None = None
+        self._schema: pa.Schema | None = None
+        self._path: Path | None = None
+        self._opened_at = 0.0
+
+    @property
+    def path(self) -> Path | None:
+        return self._path
+
+    def write(self, table: pl.DataFrame) -> None:
+        if table.is_empty():
+            return
+        arrow_table = table.to_arrow(compat_level=pl.CompatLevel.oldest())
+        if self._schema is not None and not arrow_table.schema.equals(self._schema):
+            arrow_table = self._conform(arrow_table)
+        if self._writer is None:
+            self._open(arrow_table.schema)
+        assert self._writer is not None
+        self._writer.write_table(arrow_table, row_group_size=len(arrow_table))
+        if self._should_roll():
+            self.roll()
+
+    def roll(self) -> None:
+        """Finalizes the current file, the next write opens a new one."""
+        if self._writer is None:
+            return
+        self._writer.close()
+        self._writer = None
+        self._schema = None
+        self._file_num += 1
+
+    def close(self) -> None:
+        self.roll()
+
+    def _open(self, schema: pa.Schema) -> None:
+        self._path = self.output_dir / f"{self.table_name}.{self._file_num}.parquet"
+        self._writer = pq.ParquetWriter(self._path, schema, compression="zstd")
+        self._schema = schema
+        self._opened_at = time.monotonic()
+        if self.ids is not None:
+            os.chown(self._path, self.ids[0], self.ids[1])
+
+    def _conform(self, arrow_table: pa.Table) -> pa.Table:
+        # generic tables are not cast to a fixed schema so the inferred types can drift
+        assert self._schema is not None
+        if set(arrow_table.schema.names) != set(self._schema.names):
+            self.roll()
+            return arrow_table
+        try:
+            return arrow_table.select(self._schema.names).cast(self._schema)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            self.roll()
+            return arrow_table
+
+    def _should_roll(self) -> bool:
+        if self._path is None:
+            return False
+        if time.monotonic() - self._opened_at >= self.roll_interval_sec:
+            return True
+        return self._path.stat().st_size >= self.roll_size_bytes
+
+
+class CollectionWriter:
+    """Keeps one CollectionTableWriter open per table for the length of a collection."""
+
+    def __init__(
+        self,
+        *,
+        output_dir: Path,
+        roll_size_bytes: int,
+        roll_interval_sec: float,
+        ids: tuple[int, int] | None = None,
+    ):
+        self.output_dir = output_dir
+        self.roll_size_bytes = roll_size_bytes
+        self.roll_interval_sec = roll_interval_sec
+        self.ids = ids
+        self._writers = dict[str, CollectionTableWriter]()
+        self._closed = False
+
+    def write(self, collection_table: CollectionTable) -> None:
+        self.write_frame(collection_table.name(), collection_table.table)
+
+    def write_frame(self, table_name: str, table: pl.DataFrame) -> None:
+        """Writes an already built table by name, used when the CollectionTable lives in another process."""
+        if self._closed:
+            raise ValueError(f"cannot write {table_name} after the collection writer was closed")
+        writer = self._writers.get(table_name)
+        if writer is None:
+            writer = CollectionTableWriter(
+                output_dir=self.output_dir,
+                table_name=table_name,
+                roll_size_bytes=self.roll_size_bytes,
+                roll_interval_sec=self.roll_interval_sec,
+                ids=self.ids,
+            )
+            self._writers[table_name] = writer
+        writer.write(table)
+
+    def close(self) -> None:
+        """Writes the parquet footers of every open file."""
+        for writer in self._writers.values():
+            writer.close()
+        self._closed = True
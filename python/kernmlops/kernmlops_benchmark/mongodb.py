@@ -2,7 +2,7 @@ import signal
 import subprocess
 import time
 from dataclasses import dataclass
-from typing import cast
+from typing import TYPE_CHECKING, cast
 
 from data_schema import GraphEngine, demote
 from kernmlops_benchmark.benchmark import Benchmark, GenericBenchmarkConfig
@@ -13,10 +13,11 @@ from kernmlops_benchmark.errors import (
     BenchmarkRunningError,
 )
 from kernmlops_config import ConfigBase
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
 from pytimeparse.timeparse import timeparse
 
+if TYPE_CHECKING:
+    from pymongo import MongoClient
+
 
 @dataclass(frozen=True)
 class MongoDbConfig(ConfigBase):
@@ -82,7 +83,11 @@ class MongoDbBenchmark(Benchmark):
         self.generic_config.generic_setup()
         subprocess.run(kill_mongod)
 
-    def ping_mongodb(self, url) -> None | MongoClient:
+    def ping_mongodb(self, url) -> "None | MongoClient":
+        # pymongo takes a while to import, only mongodb runs need it
+        from pymongo import MongoClient
+        from pymongo.errors import ConnectionFailure
+
         try:
             client = MongoClient(self.config.url)
             client.admin.command("ping")
@@ -247,6 +252,8 @@ class MongoDbBenchmark(Benchmark):
             return
 
         # Drop databases
+        from pymongo import MongoClient
+
         client = MongoClient(self.config.url)
         for db in client.list_databases():
             if db['name'] != 'admin':
@@ -0,0 +1,12 @@
+import polars as pl
+from data_collection.escalation import EscalationRule
+
+
+def test_empty_windows_count_only_once_covered():
+  rule = EscalationRule.from_config(
+    {"hook": "block_io", "aggregate": "count", "below": 1, "window": "5s", "hooks": ["vfs_read"]}
+  )
+  empty = pl.DataFrame({"ts_uptime_us": []}, schema={"ts_uptime_us": pl.Int64})
+  assert rule.value(empty, covered=False) is None
+  assert rule.value(empty) == 0.0
+  assert rule.fires(0.0)
@@ -0,0 +1,118 @@
+import sys
+import time
+from dataclasses import dataclass
+from threading import Event, Thread
+
+from data_collection.bpf_instrumentation.event_buffer import EventBuffer
+
+
+@dataclass(frozen=True)
+class Row:
+  num: int
+
+
+def _row(num: int) -> Row:
+  # gives the flushing thread a chance to run between the handler's append lookup and call
+  time.sleep(0)
+  return Row(num)
+
+
+def test_swaps_from_another_thread_lose_no_rows():
+  rows, polls, rows_per_poll = EventBuffer(Row), 200, 50
+  polled = Event()
+  retired = list[Row]()
+
+  def poll_thread():
+    rows.own()
+    try:
+      for poll in range(polls):
+        for num in range(poll * rows_per_poll, (poll + 1) * rows_per_poll):
+          rows.append(_row(num))
+        rows.handoff()
+    finally:
+      rows.release()
+      polled.set()
+
+  def flush_thread():
+    while not polled.is_set():
+      retired.extend(rows.swap()[1])
+    retired.extend(rows.swap()[1])
+
+  switch_interval = sys.getswitchinterval()
+  sys.setswitchinterval(1e-6)
+  try:
+    threads = [Thread(target=poll_thread), Thread(target=flush_thread)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join(timeout=60)
+  finally:
+    sys.setswitchinterval(switch_interval)
+  assert sorted(row.num for row in retired) == list(range(polls * rows_per_poll))
+
+
+def test_swap_waits_for_handoff_while_owned():
+  rows = EventBuffer(Row)
+  rows.own()
+  swapped = list[list[Row]]()
+  flusher = Thread(target=lambda: swapped.append(rows.swap()[1]))
+  flusher.start()
+  rows.append(Row(0))
+  flusher.join(timeout=0.1)
+  assert flusher.is_alive()
+  while flusher.is_alive():
+    rows.handoff()
+    flusher.join(timeout=0.01)
+  assert swapped == [[Row(0)]]
+  rows.release()
+  rows.append(Row(1))
+  assert rows.swap() == ([], [Row(1)])
+
+
+def test_retired_rows_pop_in_order_whether_spilled_or_not(tmp_path):
+  rows = EventBuffer(Row)
+  rows.extend([Row(0), Row(1)])
+  assert rows.retire()
+  assert rows.spill_retired(tmp_path) == 1
+  rows.append(Row(2))
+  assert rows.retire()
+  rows.append(Row(3))
+  assert rows.pop_frame()["num"].to_list() == [0, 1, 2, 3]
+  assert not any(tmp_path.iterdir())
+  assert rows.spill_retired(tmp_path) == 0
+
+
+def _marked(rows: EventBuffer[Row], nums: range, mark_us: int) -> None:
+  rows.extend([Row(num) for num in nums])
+  rows.mark(mark_us)
+
+
+def test_windows_reach_back_past_swaps():
+  rows = EventBuffer(Row)
+  rows.keep_tail(2_000)
+  _marked(rows, range(0, 2), 1_000)
+  _marked(rows, range(2, 4), 2_000)
+  rows.swap()
+  _marked(rows, range(4, 6), 3_000)
+  assert [row.num for row in rows.rows_since(1_500)] == [2, 3, 4, 5]
+  assert [row.num for row in rows.rows_since(2_500)] == [4, 5]
+  assert [row.num for row in rows.last_rows(3)] == [3, 4, 5]
+  assert rows.last_rows_since_us(3) == 1_000
+  assert rows.last_rows_since_us(2) == 2_000
+  assert rows.oldest_mark_us() == 1_000
+  rows.swap()
+  _marked(rows, range(6, 8), 5_000)
+  rows.swap()
+  # the last mark at or before 5_000 - 2_000 bounds the tail, older rows are dropped
+  assert [row.num for row in rows.rows_since(0)] == [6, 7]
+  assert rows.oldest_mark_us() == 3_000
+  rows.clear()
+  assert rows.rows_since(0) == []
+  assert rows.oldest_mark_us() is None
+
+
+def test_no_tail_is_kept_by_default():
+  rows = EventBuffer(Row)
+  _marked(rows, range(0, 2), 1_000)
+  rows.swap()
+  assert rows.rows_since(0) == []
@@ -0,0 +1,55 @@
+import threading
+
+import pytest
+from data_collection.bpf_instrumentation.hook_loader import (
+  attaches_on_compile,
+  load_hooks,
+)
+
+
+class FakeHook:
+
+  def __init__(self, name: str, bpf_text: str, fail_load: bool = False):
+    self._name = name
+    self.bpf_text = bpf_text
+    self.fail_load = fail_load
+    self.compile_thread: str | None = None
+    self.discarded = False
+
+  def name(self) -> str:
+    return self._name
+
+  def compile(self) -> None:
+    self.compile_thread = threading.current_thread().name
+
+  def load(self, collection_id: str) -> None:
+    if self.fail_load:
+      raise RuntimeError(f"{self._name} failed to attach")
+
+  def discard(self) -> None:
+    self.discarded = True
+
+
+def test_auto_attached_hooks_compile_in_the_loading_thread():
+  hooks = [
+    FakeHook("first", "int trace(void *ctx) { return 0; }"),
+    FakeHook("threaded", "int trace(void *ctx) { return 0; }"),
+    FakeHook("madvise", "int kprobe__do_madvise(struct pt_regs *ctx) { return 0; }"),
+  ]
+  assert attaches_on_compile(hooks[2])  # pyright: ignore [reportArgumentType]
+  load_hooks(hooks, "test", workers=2)  # pyright: ignore [reportArgumentType]
+  loading_thread = threading.current_thread().name
+  assert hooks[0].compile_thread == loading_thread
+  assert hooks[1].compile_thread != loading_thread
+  assert hooks[2].compile_thread == loading_thread
+
+
+def test_failed_load_discards_every_hook():
+  hooks = [
+    FakeHook("first", ""),
+    FakeHook("broken", "", fail_load=True),
+    FakeHook("last", ""),
+  ]
+  with pytest.raises(RuntimeError):
+    load_hooks(hooks, "test", workers=2)  # pyright: ignore [reportArgumentType]
+  assert all(hook.discarded for hook in hooks)
@@ -0,0 +1,56 @@
+import polars as pl
+from data_collection.bpf_instrumentation.hook_selection import (
+  HookCost,
+  load_hook_costs,
+  plan_hooks,
+)
+
+
+def _overhead(hook: str, sample_freq: int | None, interval_us: int, poll_ns: int) -> pl.DataFrame:
+  return pl.DataFrame({
+    "hook": [hook],
+    "interval_us": [interval_us],
+    "poll_ns": [poll_ns],
+    "pop_data_ns": [0],
+    "write_ns": [0],
+    "events": [0],
+    "sample_freq": [sample_freq],
+  }, schema_overrides={"sample_freq": pl.Int64()})
+
+
+def test_costs_keep_the_frequency_they_were_measured_at(tmp_path):
+  for collection, overhead in enumerate([
+    _overhead("perf", 1000, 1_000_000, 100_000_000),
+    _overhead("perf", 100, 4_000_000, 40_000_000),
+  ]):
+    (tmp_path / str(collection)).mkdir()
+    overhead.write_parquet(tmp_path / str(collection) / "collector_overhead.0.parquet")
+  assert load_hook_costs(tmp_path) == {"perf": HookCost(cores=0.01, events_per_sec=0.0, sample_freq=100)}
+
+
+def test_sampled_costs_scale_from_the_measured_frequency():
+  plan = plan_hooks(
+    ["perf"],
+    {"perf": HookCost(cores=0.01, events_per_sec=0.0, sample_freq=100)},
+    budget_cores=0.05,
+    sample_freqs={"perf": 1000},
+  )
+  # 0.1 cores at 1000Hz, only half of that fits
+  assert plan.sample_freqs() == {"perf": 500}
+
+
+def test_costs_scale_with_the_benchmark_event_rate():
+  # both hooks took 1us per event in earlier collections
+  costs = {
+    "block_io": HookCost(cores=0.01, events_per_sec=10_000.0),
+    "vfs_read": HookCost(cores=0.01, events_per_sec=10_000.0),
+  }
+  plan = plan_hooks(
+    ["vfs_read", "block_io"],
+    costs,
+    budget_cores=0.02,
+    sample_freqs={},
+    event_rates={"vfs_read": 50_000.0, "block_io": 1_000.0},
+  )
+  assert plan.hook_names() == ["block_io"]
+  assert plan.hooks[0].predicted_cores == 0.001
@@ -0,0 +1,113 @@
+import polars as pl
+from data_schema import UPTIME_TIMESTAMP
+from data_schema.block_io import (
+  BlockIOJoin,
+  BlockIOLatencyTable,
+  BlockIOQueueTable,
+)
+from data_schema.generic_table import (
+  CollapseHugePageDataTableRaw,
+  TraceMMCollapseHugePageDataTable,
+)
+from data_schema.huge_pages import CollapseHugePageDataTable, CollapseHugePageJoin
+
+
+def queue_table(sectors: list[int], ts_us: list[int]) -> BlockIOQueueTable:
+  return BlockIOQueueTable.from_df(pl.DataFrame({
+    "cpu": [0] * len(sectors),
+    "device": [8] * len(sectors),
+    "sector": sectors,
+    "segments": [1] * len(sectors),
+    "block_io_bytes": [4096] * len(sectors),
+    UPTIME_TIMESTAMP: ts_us,
+    "block_io_flags": [0] * len(sectors),
+    "queue_length_segment_ios": [1] * len(sectors),
+    "queue_length_4k_ios": [1] * len(sectors),
+    "collection_id": ["test"] * len(sectors),
+  }))
+
+
+def latency_table(sectors: list[int], ts_us: list[int]) -> BlockIOLatencyTable:
+  return BlockIOLatencyTable.from_df(pl.DataFrame({
+    "cpu": [0] * len(sectors),
+    "device": [8] * len(sectors),
+    "sector": sectors,
+    "segments": [1] * len(sectors),
+    "block_io_bytes": [4096] * len(sectors),
+    UPTIME_TIMESTAMP: ts_us,
+    "block_latency_us": [100] * len(sectors),
+    "block_io_latency_us": [50] * len(sectors),
+    "block_io_flags": [0] * len(sectors),
+    "collection_id": ["test"] * len(sectors),
+  }))
+
+
+def collapse_table(pids: list[int], start_ns: list[int]) -> CollapseHugePageDataTableRaw:
+  return CollapseHugePageDataTableRaw.from_df(pl.DataFrame({
+    "pid": pids,
+    "tgid": pids,
+    "start_ts_ns": start_ns,
+    "end_ts_ns": [ts + 500 for ts in start_ns],
+    "mm": ["0x1"] * len(pids),
+    "collection_id": ["test"] * len(pids),
+  }))  # pyright: ignore [reportReturnType]
+
+
+def trace_mm_table(pids: list[int], start_ns: list[int]) -> TraceMMCollapseHugePageDataTable:
+  return TraceMMCollapseHugePageDataTable.from_df(pl.DataFrame({
+    "pid": pids,
+    "tgid": pids,
+    "start_ts_ns": start_ns,
+    "end_ts_ns": [ts + 1 for ts in start_ns],
+    "isolated": [True] * len(pids),
+    "status": [1] * len(pids),
+    "collection_id": ["test"] * len(pids),
+  }))  # pyright: ignore [reportReturnType]
+
+
+def test_block_io_matches_across_flushes():
+  join = BlockIOJoin()
+  assert join.join(queue_table([1, 2], [10, 20]), latency_table([1], [15])).table["sector"].to_list() == [1]
+  # only the request still in flight is carried over
+  assert join.pending_rows() == 1
+  assert join.join(queue_table([], []), latency_table([2], [30])).table["sector"].to_list() == [2]
+  assert join.pending_rows() == 0
+
+
+def test_block_io_evicts_stale_rows():
+  join = BlockIOJoin(max_age_us=100)
+  join.join(queue_table([1], [10]), latency_table([], []))
+  join.join(queue_table([2], [1_000]), latency_table([], []))
+  assert join.pending_rows() == 1
+  assert join.join(queue_table([], []), latency_table([1], [1_050])).table.is_empty()
+
+
+def test_collapses_pair_across_flushes():
+  join = CollapseHugePageJoin()
+  assert join.join(collapse_table([1, 2], [100, 200]), trace_mm_table([1], [150])).table["pid"].to_list() == [1]
+  assert join.pending_rows() == 1
+  assert join.join(collapse_table([], []), trace_mm_table([2], [250])).table["pid"].to_list() == [2]
+  assert join.pending_rows() == 0
+
+
+def test_duplicate_trace_rows_are_not_carried_over():
+  join = CollapseHugePageJoin()
+  paired = join.join(collapse_table([1], [100]), trace_mm_table([1, 1], [150, 160])).table
+  assert len(paired) == 1
+  assert join.pending_rows() == 0
+
+
+def test_collapses_evict_stale_rows():
+  join = CollapseHugePageJoin(max_age_ns=100)
+  join.join(collapse_table([1], [10]), trace_mm_table([], []))
+  join.join(collapse_table([2], [1_000]), trace_mm_table([], []))
+  assert join.pending_rows() == 1
+  assert join.join(collapse_table([], []), trace_mm_table([1], [1_050])).table.is_empty()
+
+
+def test_empty_collapses_build_an_empty_table():
+  table = CollapseHugePageDataTable.from_tables(
+    collapse_table=collapse_table([], []), trace_mm_table=trace_mm_table([1], [150]),
+  )
+  assert table.table.is_empty()
+  assert "trace_start_ts_ns" not in table.table.columns
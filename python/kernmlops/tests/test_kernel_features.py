@@ -0,0 +1,20 @@
+from data_collection.bpf_instrumentation.kernel_features import (
+  KernelFeatures,
+  KernelFeatureStats,
+  kernel_build_id,
+)
+
+
+def test_cached_probes_are_not_probed_again(tmp_path):
+  cache_path = tmp_path / "kernel_features" / f"{kernel_build_id()}.json"
+  probed = list[str]()
+
+  def probe() -> bool:
+    probed.append("task_struct.__state")
+    return True
+
+  assert KernelFeatures(cache_path)._feature("struct_has_field:task_struct.__state", probe)
+  kernel_features = KernelFeatures(cache_path)
+  assert kernel_features._feature("struct_has_field:task_struct.__state", probe)
+  assert probed == ["task_struct.__state"]
+  assert kernel_features.stats == KernelFeatureStats(probes=1, cached=1, probe_sec=0.0)
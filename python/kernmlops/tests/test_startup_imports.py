@@ -0,0 +1,44 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from data_collection.bpf_instrumentation.microbench import STARTUP_FORBIDDEN_IMPORTS
+
+KERNMLOPS_DIR = Path(__file__).parent.parent
+
+# runs the CLI like `python python/kernmlops` then lists the modules it left imported
+_RUN_CLI = """
+import runpy
+import sys
+from pathlib import Path
+
+modules_path, kernmlops_dir, *args = sys.argv[1:]
+sys.argv = [kernmlops_dir, *args]
+sys.path.insert(0, kernmlops_dir)
+try:
+    runpy.run_path(kernmlops_dir, run_name="__main__")
+except SystemExit as e:
+    if e.code:
+        raise
+Path(modules_path).write_text("\\n".join(sys.modules))
+"""
+
+
+def imported_modules(tmp_path: Path, *args: str) -> set[str]:
+  modules_path = tmp_path / "modules.txt"
+  # `collect defaults` writes defaults.yaml to the working directory
+  subprocess.run(
+    [sys.executable, "-c", _RUN_CLI, str(modules_path), str(KERNMLOPS_DIR), *args],
+    check=True,
+    capture_output=True,
+    cwd=tmp_path,
+  )
+  return {module.partition(".")[0] for module in modules_path.read_text().splitlines()}
+
+
+@pytest.mark.parametrize("args", [("collect", "dump", "-d", "."), ("collect", "defaults")])
+def test_cli_does_not_import_slow_modules(tmp_path: Path, args: tuple[str, ...]):
+  imported = imported_modules(tmp_path, *args)
+  assert "cli" in imported
+  assert imported.isdisjoint(STARTUP_FORBIDDEN_IMPORTS)
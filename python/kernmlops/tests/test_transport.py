@@ -0,0 +1,63 @@
+import ctypes as ct
+from pathlib import Path
+
+from data_collection.bpf_instrumentation.transport import (
+  Transport,
+  hash_map_names,
+  lost_counter_name,
+  record_cpu_reader,
+)
+
+BPF_DIR = Path(__file__).parent.parent / "data_collection/bpf_instrumentation/bpf"
+
+
+class BlockIOStart(ct.Structure):
+  # the event class bcc builds for block_io_starts in blk_io.bpf.c
+  _fields_ = [
+    ("device", ct.c_uint),
+    ("cpu", ct.c_uint),
+    ("sector", ct.c_ulonglong),
+    ("segments", ct.c_uint),
+    ("block_io_bytes", ct.c_uint),
+    ("block_io_start_uptime_us", ct.c_ulonglong),
+    ("block_io_flags", ct.c_ulonglong),
+    ("queue_length_segments", ct.c_int),
+    ("queue_length_4ks", ct.c_int),
+  ]
+
+
+class NoCPU(ct.Structure):
+  _fields_ = [("pid", ct.c_uint), ("tgid", ct.c_uint)]
+
+
+def test_ring_buffer_submits_typed_events():
+  bpf_text = Transport(ring_buffer=True, page_cnt=64).bpf_text((BPF_DIR / "blk_io.bpf.c").read_text())
+  assert "perf_submit" not in bpf_text
+  assert "ringbuf_reserve" not in bpf_text
+  assert "BPF_RINGBUF_OUTPUT(block_io_starts, 64);" in bpf_text
+  for table_name in ["block_io_starts", "block_io_ends"]:
+    assert f"if ({table_name}.ringbuf_output(&data, sizeof(data), 0) != 0) " in bpf_text
+    assert f"{lost_counter_name(table_name)}.increment(__kernmlops_zero);" in bpf_text
+
+
+def test_ring_buffer_wakeups_are_batched():
+  bpf_text = Transport(ring_buffer=True, wakeup_events=16).bpf_text((BPF_DIR / "madvise.bpf.c").read_text())
+  assert "madvise_output.ringbuf_output(data, sizeof(madvise_output_t), __kernmlops_flags)" in bpf_text
+  assert "% 16 == 0" in bpf_text
+
+
+def test_perf_transport_keeps_perf_submit():
+  bpf_text = Transport().bpf_text((BPF_DIR / "blk_io.bpf.c").read_text())
+  assert "block_io_starts.perf_submit(ctx, &data, sizeof(data));" in bpf_text
+  assert "ringbuf" not in bpf_text
+
+
+def test_record_cpu_is_read_from_the_event():
+  event = BlockIOStart(device=8, cpu=3, sector=1024)
+  assert record_cpu_reader(BlockIOStart)(ct.addressof(event)) == 3
+  assert record_cpu_reader(NoCPU)(ct.addressof(NoCPU(pid=1, tgid=1))) == -1
+
+
+def test_hash_maps_are_listed_for_rearm():
+  assert hash_map_names((BPF_DIR / "blk_io.bpf.c").read_text()) == ["device_queue", "started_4k_ios"]
+  assert hash_map_names((BPF_DIR / "sched_quanta_runtime.bpf.c").read_text()) == ["run_start", "queue_start"]